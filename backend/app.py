@@ -1,13 +1,25 @@
+import base64
 import json
 import logging
+import os
+import random
+import re
+import time
+from datetime import datetime
 import psycopg
 from psycopg.rows import dict_row
-from flask import Flask, jsonify, request, abort
+from psycopg.types.json import Jsonb
+from flask import Flask, Response, jsonify, request, abort, stream_with_context
 from flask_cors import CORS
-import os
 from dotenv import load_dotenv
 from pathlib import Path
 
+from db_pool import db_connection, get_connection_kwargs, pool_stats
+from json_encoding import init_app as init_json, json_response, use_raw_json
+from metrics import PROMETHEUS_CONTENT_TYPE, init_app as init_metrics, render_metrics
+from query_registry import execute, query_stats, register
+from response_cache import cache_stats, cached_response, get_response_cache
+
 # Configure logging
 logging.basicConfig(
     level=logging.DEBUG,
@@ -33,6 +45,8 @@ load_env()
 
 app = Flask(__name__)
 CORS(app)
+init_json(app)
+init_metrics(app)
 
 # Error handlers - centralized logging for all error responses
 @app.errorhandler(400)
@@ -45,6 +59,11 @@ def handle_not_found(e):
     logging.warning(f"Not found: {e.description}")
     return jsonify({'error': e.description}), 404
 
+@app.errorhandler(409)
+def handle_conflict(e):
+    logging.warning(f"Conflict: {e.description}")
+    return jsonify({'error': e.description}), 409
+
 @app.errorhandler(Exception)
 def handle_exception(e):
     logging.error(f"Unhandled exception: {e}", exc_info=True)
@@ -52,69 +71,252 @@ def handle_exception(e):
     error_msg = str(e).split('\nCONTEXT:')[0]
     return jsonify({'error': error_msg}), 500
 
+@app.after_request
+def invalidate_cache_after_write(response):
+    """
+    Drop cached responses after any write made through this process, so its
+    clients read their own writes without waiting for the NOTIFY round trip.
+    """
+    if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+        cache = get_response_cache()
+        if cache is not None:
+            cache.invalidate()
+    return response
+
 def get_db_connection() -> psycopg.Connection:
-    conn = psycopg.connect(
-        host=os.environ.get('DB_HOST', 'localhost'),
-        port=os.environ.get('DB_PORT', '5432'),
-        dbname=os.environ.get('DB_NAME', 'inventory_db'),
-        user=os.environ.get('DB_USER', 'inventory_user'),
-        password=os.environ.get('DB_PASSWORD', 'secure_password')
-    )
+    """Open a dedicated (unpooled) connection. Routes use db_connection() instead."""
+    conn = psycopg.connect(**get_connection_kwargs())
     return conn
 
+def int_arg(args, name, default=None) -> int | None:
+    """Integer query parameter; default when absent, 400 when it is not an integer."""
+    value = args.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        abort(400, description=f'{name} must be an integer')
+
+def fetch_json(query, params=None) -> bytes | None:
+    """The JSON document a query builds in Postgres, as raw bytes; None without a row."""
+    with db_connection() as conn, use_raw_json(conn.cursor()) as cursor:
+        execute(cursor, query, params)
+        row = cursor.fetchone()
+    return None if row is None else row[0]
+
 # =============================================================================
 # ORDERS (Primary Resource)
 # =============================================================================
 
+# The whole listing is one JSON array built by Postgres and passed through unparsed
+ORDER_SUMMARY_QUERY = register('order_summary', """\
+    SELECT COALESCE(json_agg(s ORDER BY s.order_id DESC), '[]'::json)
+    FROM user_order_summary s
+    """)
+
+ORDERS_PAGE_MAX_LIMIT = 1000
+
+# The columns of user_order_summary, selected from the tables so that the
+# filters apply to orders directly: status and order_time through
+# idx_orders_status_time / idx_orders_order_time, the user through
+# idx_addresses_user and idx_orders_shipping_address.
+ORDERS_PAGE_QUERY = """\
+    SELECT o.order_id, u.user_id, u.name, u.surname, s.status_name, o.order_time, o.payment_time, o.shipment_time,
+        o.item_count, o.total_amount
+    {from_where}
+    {after}
+    ORDER BY o.order_id DESC
+    LIMIT %(limit)s
+    """
+
+ORDERS_FROM_WHERE = """FROM orders o
+    JOIN addresses a ON o.shipping_address_id = a.address_id
+    JOIN users u ON a.user_id = u.user_id
+    JOIN statuses s ON o.status_id = s.status_id
+    WHERE TRUE
+    {filters}"""
+
+# In the order their parameters are read and named in the registry
+ORDERS_FILTERS = {
+    'status': """AND o.status_id = (
+        SELECT status_id FROM statuses
+        WHERE status_name = %(status)s OR status_id::TEXT = %(status)s
+    )""",
+    'user_id': "AND a.user_id = %(user_id)s",
+    'from': "AND o.order_time >= %(from)s",
+    'to': "AND o.order_time < %(to)s",
+}
+
+
+def encode_orders_cursor(order_id):
+    """Opaque pagination token pointing just after the given order_id."""
+    return base64.urlsafe_b64encode(json.dumps([order_id]).encode()).decode()
+
+
+def decode_orders_cursor(token):
+    try:
+        (order_id,) = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (ValueError, TypeError):
+        abort(400, description='Invalid cursor')
+    if not isinstance(order_id, int):
+        abort(400, description='Invalid cursor')
+    return order_id
+
+
+def orders_filter_params(args):
+    """Filter values of a /user_order_summary request, by ORDERS_FILTERS key."""
+    params = {}
+    if args.get('status'):
+        params['status'] = args['status']
+    if args.get('user_id'):
+        try:
+            params['user_id'] = int(args['user_id'])
+        except ValueError:
+            abort(400, description='user_id must be an integer')
+    for bound in ('from', 'to'):
+        if args.get(bound):
+            try:
+                params[bound] = datetime.fromisoformat(args[bound])
+            except ValueError:
+                abort(400, description=f'{bound} must be an ISO 8601 date or timestamp')
+    return params
+
+
+def orders_page_statement(args):
+    """
+    Page query, total estimate query and params of a /user_order_summary
+    request; returns (query, estimate_query, params, limit).
+    """
+    limit = int_arg(args, 'limit', 100)
+    if not 1 <= limit <= ORDERS_PAGE_MAX_LIMIT:
+        abort(400, description=f'limit must be between 1 and {ORDERS_PAGE_MAX_LIMIT}')
+
+    params = orders_filter_params(args)
+    filters = [name for name in ORDERS_FILTERS if name in params]
+    from_where = ORDERS_FROM_WHERE.format(filters='\n    '.join(ORDERS_FILTERS[name] for name in filters))
+    after = ''
+    if args.get('cursor'):
+        params['after_order_id'] = decode_orders_cursor(args['cursor'])
+        after = 'AND o.order_id < %(after_order_id)s'
+    params['limit'] = limit + 1
+
+    query = register(
+        f"orders_page[{','.join(filters + ['after'] if after else filters)}]",
+        ORDERS_PAGE_QUERY.format(from_where=from_where, after=after),
+    )
+    # The planner's row estimate stands in for a COUNT(*) of every match
+    estimate = register(
+        f"orders_estimate[{','.join(filters)}]",
+        f"EXPLAIN (FORMAT JSON) SELECT 1\n    {from_where}",
+        prepare=False,
+    )
+    return query, estimate, params, limit
+
+
+def orders_page(items, limit, plan, first_page):
+    """{"items", "next_cursor", "estimated_total"} of a page fetched with orders_page_statement()."""
+    # One extra row tells whether another page exists
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_orders_cursor(items[-1]['order_id'])
+    if first_page and next_cursor is None:
+        # Everything matched fits on this page, so the count is exact
+        estimated_total = len(items)
+    else:
+        estimated_total = max(int(plan[0]['Plan']['Plan Rows']), len(items))
+    return {'items': items, 'next_cursor': next_cursor, 'estimated_total': estimated_total}
+
+
 #### ACTUALLY USED ####
 @app.route('/user_order_summary', methods=['GET'])
 def get_orders():
-    """List all orders with summary info: order_id, user_id, status, total_amount"""
-    query = """SELECT * FROM user_order_summary
-    ORDER BY order_id DESC
     """
-    with get_db_connection() as conn:
+    List orders with summary info, newest first.
+
+    Without parameters every order is returned as one JSON array.
+    With ?limit=N[&cursor=...] and/or filters (?status=<name or id>,
+    ?user_id=N, ?from=<ISO date>, ?to=<ISO date>, to exclusive) a single page
+    is returned: {"items": [...], "next_cursor": str | null, "estimated_total": int}
+    estimated_total is the planner's estimate of all matching orders.
+    """
+    if not request.args:
+        return json_response(Response, fetch_json(ORDER_SUMMARY_QUERY)), 200
+
+    query, estimate, params, limit = orders_page_statement(request.args)
+    with db_connection() as conn:
         with conn.cursor(row_factory=dict_row) as cursor:
-            cursor.execute(query)
+            execute(cursor, query, params)
             items = cursor.fetchall()
-            return jsonify(items), 200
+            execute(cursor, estimate, params)
+            plan = cursor.fetchone()['QUERY PLAN']
+    return jsonify(orders_page(items, limit, plan, 'cursor' not in request.args)), 200
+
+# Orders are partitioned by month of order_time, which the primary key
+# (order_id, order_time) ends with. With the order_time of an order (as listed
+# by /user_order_summary) only the partition of its month is read; by order_id
+# alone, the primary key of every month is probed.
+ORDER_DETAILS_QUERY = """
+    SELECT
+        o.*,
+        u.*,
+        st.*,
+        row_to_json(sa.*) as shipping_address,
+        row_to_json(ba.*) as billing_address
+    FROM orders o
+    JOIN addresses sa ON o.shipping_address_id = sa.address_id
+    JOIN addresses ba ON o.billing_address_id = ba.address_id
+    JOIN users u ON sa.user_id = u.user_id
+    JOIN statuses st ON o.status_id = st.status_id
+    WHERE o.order_id = %(order_id)s {order_time}
+    """
+
+ORDER_DETAILS_BY_ID_QUERY = register(
+    'order_details', ORDER_DETAILS_QUERY.format(order_time=''), warmup={'order_id': 0})
+ORDER_DETAILS_AT_QUERY = register(
+    'order_details_at', ORDER_DETAILS_QUERY.format(order_time='AND o.order_time = %(order_time)s'),
+    warmup={'order_id': 0, 'order_time': datetime(2000, 1, 1)})
+
+# Read with the order_time of the order found by the details query
+ORDER_ITEMS_QUERY = register('order_items', """
+    SELECT * FROM order_items oi
+    JOIN prices p ON (oi.price_id = p.price_id)
+    JOIN books b ON (p.isbn = b.isbn)
+    WHERE oi.order_id = %(order_id)s AND oi.order_time = %(order_time)s
+    """, warmup={'order_id': 0, 'order_time': datetime(2000, 1, 1)})
+
+
+def order_details_statement(order_id, args):
+    """Details query and params of a /orders/<order_id> request."""
+    params = {'order_id': order_id}
+    if not args.get('order_time'):
+        return ORDER_DETAILS_BY_ID_QUERY, params
+    try:
+        params['order_time'] = datetime.fromisoformat(args['order_time'])
+    except ValueError:
+        abort(400, description='order_time must be an ISO 8601 timestamp')
+    return ORDER_DETAILS_AT_QUERY, params
+
 
 #### ACTUALLY USED ####
 @app.route('/orders/<int:order_id>', methods=['GET'])
 def get_order(order_id):
-    """Get single order with items and addresses"""
-    with get_db_connection() as conn:
-        order_details_query = """
-            SELECT
-                o.*,
-                u.*,
-                st.*,
-                row_to_json(sa.*) as shipping_address,
-                row_to_json(ba.*) as billing_address
-            FROM orders o
-            JOIN addresses sa ON o.shipping_address_id = sa.address_id
-            JOIN addresses ba ON o.billing_address_id = ba.address_id
-            JOIN users u ON sa.user_id = u.user_id
-            JOIN statuses st ON o.status_id = st.status_id
-            WHERE o.order_id = %s
-        """
-
-        with conn.cursor(row_factory=dict_row) as cursor:
-            cursor.execute(order_details_query, (order_id,))
-            items = cursor.fetchone()
-
-        item_query = """
-        SELECT * FROM order_items oi
-            JOIN prices p ON (oi.price_id = p.price_id)
-            JOIN books b ON (p.isbn = b.isbn)
-            WHERE oi.order_id = %s
-        """
+    """
+    Get single order with items and addresses.
 
+    ?order_time=<ISO timestamp>, the order_time of the order, lets Postgres
+    read only the partition of its month.
+    """
+    query, params = order_details_statement(order_id, request.args)
+    with db_connection() as conn:
         with conn.cursor(row_factory=dict_row) as cursor:
-            cursor.execute(item_query, (order_id,))
-            if items is not None:
-                items['items'] = cursor.fetchall()
-            return jsonify(items), 200
+            execute(cursor, query, params)
+            order = cursor.fetchone()
+            if order is not None:
+                execute(cursor, ORDER_ITEMS_QUERY, {'order_id': order_id, 'order_time': order['order_time']})
+                order['items'] = cursor.fetchall()
+    return jsonify(order), 200
 
 @app.route('/orders', methods=['POST'])
 def create_order():
@@ -151,6 +353,105 @@ def delete_order_item(item_id):
     """Remove item from order"""
     return jsonify(None), 500 #TODO
 
+ORDER_LOCK_MODES = ('wait', 'nowait', 'skip_locked')
+
+# Errors after which the whole order transaction can simply be tried again
+RETRYABLE_ORDER_ERRORS = (
+    psycopg.errors.LockNotAvailable,
+    psycopg.errors.DeadlockDetected,
+    psycopg.errors.SerializationFailure,
+)
+
+
+def get_order_retry_policy() -> dict:
+    """
+    Inventory locking policy for order creation, from environment variables:
+        ORDER_LOCK_MODE: wait (default), nowait or skip_locked
+        ORDER_RETRY_ATTEMPTS: Attempts before giving up with 409 (default: 5)
+        ORDER_RETRY_BACKOFF: Delay before the first retry in seconds, doubled
+            after every attempt (default: 0.05)
+        ORDER_RETRY_MAX_BACKOFF: Upper bound of the delay (default: 1.0)
+    """
+    lock_mode = os.environ.get('ORDER_LOCK_MODE', 'wait')
+    if lock_mode not in ORDER_LOCK_MODES:
+        raise ValueError(f'ORDER_LOCK_MODE must be one of {ORDER_LOCK_MODES}')
+    attempts = int(os.environ.get('ORDER_RETRY_ATTEMPTS', '5'))
+    if attempts < 1:
+        raise ValueError('ORDER_RETRY_ATTEMPTS must be at least 1')
+    return {
+        'lock_mode': lock_mode,
+        'attempts': attempts,
+        'backoff': float(os.environ.get('ORDER_RETRY_BACKOFF', '0.05')),
+        'max_backoff': float(os.environ.get('ORDER_RETRY_MAX_BACKOFF', '1.0')),
+    }
+
+
+def order_retry_delay(policy, attempt) -> float:
+    """Seconds to wait after failed attempt number `attempt` (1-based), with jitter."""
+    delay = min(policy['max_backoff'], policy['backoff'] * 2 ** (attempt - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def run_order_transaction(query, params_for):
+    """
+    Run an order-creating query in its own transaction, retrying with
+    exponential backoff and jitter when inventory rows are busy.
+
+    params_for(lock_mode) returns the query parameters. Returns all fetched rows.
+    """
+    policy = get_order_retry_policy()
+    for attempt in range(1, policy['attempts'] + 1):
+        try:
+            with db_connection() as conn, conn.cursor() as cursor:
+                execute(cursor, query, params_for(policy['lock_mode']))
+                return cursor.fetchall()
+        except RETRYABLE_ORDER_ERRORS as e:
+            if attempt == policy['attempts']:
+                logging.warning(f"Giving up order after {attempt} attempts: {e}")
+                abort(409, description='Inventory is busy, please retry the order')
+            delay = order_retry_delay(policy, attempt)
+            logging.info(f"Order attempt {attempt} failed ({type(e).__name__}), retrying in {delay:.3f}s")
+            time.sleep(delay)
+
+
+CREATE_ORDER_QUERY = register(
+    'create_order', "SELECT create_order_transaction(%s, %s, %s, %s)", read_only=False)
+
+# One round trip: the orders are unpacked and created inside Postgres, after
+# the inventory of every book in the batch is locked in ISBN order
+CREATE_ORDERS_QUERY = register(
+    'create_orders', "SELECT * FROM create_order_transactions(%s::jsonb, %s)", read_only=False)
+
+
+def create_order_params(data):
+    """params_for() of CREATE_ORDER_QUERY for a /create_order request body."""
+    if not data:
+        abort(400, description='No JSON data provided')
+    return lambda lock_mode: (
+        data['shipping_address_id'],
+        data['billing_address_id'],
+        json.dumps(data['items']),
+        lock_mode,
+    )
+
+
+CREATE_ORDERS_MAX_BATCH = 1000
+
+def create_orders_params(data):
+    """Validate a /create_orders request body; params_for() of CREATE_ORDERS_QUERY."""
+    if not data or not data.get('orders'):
+        abort(400, description='No orders provided')
+
+    orders = data['orders']
+    if len(orders) > CREATE_ORDERS_MAX_BATCH:
+        abort(400, description=f'At most {CREATE_ORDERS_MAX_BATCH} orders per call')
+    for order in orders:
+        for field in ['shipping_address_id', 'billing_address_id', 'items']:
+            if field not in order:
+                abort(400, description=f'Missing required field: {field}')
+    return lambda lock_mode: (json.dumps(orders), lock_mode)
+
+
 @app.route('/create_order', methods=['POST'])
 def create_order_transaction_route():
     """
@@ -163,97 +464,239 @@ def create_order_transaction_route():
         "items": [{"isbn": str, "quantity": int}]
     }
 
-    Returns the created order_id and status.
+    Returns the created order_id and status. Lock conflicts are retried
+    according to get_order_retry_policy(); 409 when they persist.
     """
-    data = request.get_json()
-    if not data:
-        abort(400, description='No JSON data provided')
+    rows = run_order_transaction(CREATE_ORDER_QUERY, create_order_params(request.get_json()))
+    return jsonify(rows[0][0]), 201
+
+
+@app.route('/create_orders', methods=['POST'])
+def create_orders_transaction_route():
+    """
+    Create many orders in one call (for import jobs), all or nothing.
+
+    Expected JSON body:
+    {
+        "orders": [
+            {
+                "shipping_address_id": int,
+                "billing_address_id": int,
+                "items": [{"isbn": str, "quantity": int}]
+            }
+        ]
+    }
+
+    Returns the results of create_order_transaction, in request order.
+    """
+    rows = run_order_transaction(CREATE_ORDERS_QUERY, create_orders_params(request.get_json()))
+    return jsonify([row[0] for row in rows]), 201
 
-    with get_db_connection() as conn:
-        with conn.cursor() as cursor:
-            cursor.execute("""
-                SELECT create_order_transaction(%s, %s, %s)
-            """, (
-                data['shipping_address_id'],
-                data['billing_address_id'],
-                json.dumps(data['items'])
-            ))
-            result = cursor.fetchone()[0]
 
-    return jsonify(result), 201
+# Months after the current one whose order partitions exist once a server has
+# started, as with db/order_partitions.py --ahead
+ORDER_PARTITION_MONTHS_AHEAD = 12
+
+CREATE_ORDER_PARTITIONS_QUERY = register('create_order_partitions', """
+    SELECT create_order_partitions(
+        date_trunc('month', NOW())::DATE,
+        (date_trunc('month', NOW()) + make_interval(months => %s::INTEGER + 1))::DATE
+    )
+    """, prepare=False, read_only=False)
+
+
+def create_order_partitions() -> int:
+    """
+    Create the missing partitions of orders and order_items up to
+    ORDER_PARTITION_MONTHS_AHEAD months ahead. Orders for a month without a
+    partition are rejected, so servers run this when they start, on a
+    dedicated connection (before Gunicorn forks its workers).
+
+    Returns the number of months created; 0 when the database cannot be
+    reached or the user may not create tables.
+    """
+    try:
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            execute(cursor, CREATE_ORDER_PARTITIONS_QUERY, (ORDER_PARTITION_MONTHS_AHEAD,))
+            created = cursor.fetchone()[0]
+    except psycopg.Error as e:
+        logging.warning(f"Could not create order partitions: {e}")
+        return 0
+    if created:
+        logging.info(f"Created order partitions for {created} months")
+    return created
 
 
 # =============================================================================
 # USERS
 # =============================================================================
 
+USERS_QUERY = register('users', "SELECT * FROM users")
+USER_QUERY = register('user', "SELECT * FROM users WHERE user_id = %s", warmup=(0,))
+USER_EXISTS_QUERY = register(
+    'user_exists', "SELECT user_id FROM users WHERE user_id = %s", warmup=(0,))
+
+INSERT_USER_QUERY = register('insert_user', """
+    INSERT INTO users (name, surname, passhash, email, email_verified, phone)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    RETURNING user_id, name, surname, email, phone, email_verified
+    """)
+
+INSERT_PRIMARY_ADDRESS_QUERY = register('insert_primary_address', """
+    INSERT INTO addresses (user_id, street, building_nr, apartment_nr, city, postal_code, country, is_primary)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, TRUE)
+    RETURNING address_id
+    """)
+
+USER_UPDATE_FIELDS = ['name', 'surname', 'email', 'phone', 'email_verified']
+
+
+def update_statement(table, key, key_value, data, allowed_fields, returning):
+    """
+    UPDATE of the allowed fields present in data, of the row WHERE key = key_value.
+    Returns (query, params).
+
+    Whatever fields are updated, a table has a single statement, prepared once:
+    the fields are sent as one JSON document, converted to the column types by
+    jsonb_populate_record(), and columns missing from it keep their values.
+    """
+    fields = {field: data[field] for field in allowed_fields if field in data}
+    if not fields:
+        abort(400, description='No valid fields to update')
+
+    values = ',\n                '.join(
+        f"CASE WHEN %(fields)s::JSONB ? '{field}' THEN r.{field} ELSE {table}.{field} END"
+        for field in allowed_fields
+    )
+    query = f"""
+        UPDATE {table}
+        SET ({', '.join(allowed_fields)}) = (
+            SELECT
+                {values}
+            FROM jsonb_populate_record(NULL::{table}, %(fields)s::JSONB) r
+        )
+        WHERE {key} = %(key)s
+        RETURNING {returning}
+    """
+    return register(f"update_{table}", query), {'fields': Jsonb(fields), 'key': key_value}
+
+
+def new_user_params(data):
+    """
+    Validate a POST /users body.
+    Returns (INSERT_USER_QUERY params, address dict or None).
+    """
+    if not data:
+        abort(400, description='No JSON data provided')
+
+    required_fields = ['name', 'surname', 'email', 'passhash']
+    for field in required_fields:
+        if field not in data or not data[field]:
+            abort(400, description=f'Missing required field: {field}')
+
+    user_params = (
+        data['name'],
+        data['surname'],
+        data['passhash'],
+        data['email'],
+        data.get('email_verified', False),
+        data.get('phone')
+    )
+    return user_params, data.get('address') or None
+
+
+def primary_address_params(user_id, addr):
+    """INSERT_PRIMARY_ADDRESS_QUERY params for the address given with a new user."""
+    return (
+        user_id,
+        addr.get('street'),
+        addr.get('building_nr'),
+        addr.get('apartment_nr'),
+        addr.get('city'),
+        addr.get('postal_code'),
+        addr.get('country', 'Polska')
+    )
+
+
 @app.route('/users', methods=['GET'])
 def get_users():
     """List all users"""
-    query = "SELECT * FROM users"
-    with get_db_connection() as conn:
+    with db_connection() as conn:
         with conn.cursor(row_factory=dict_row) as cursor:
-            cursor.execute(query)
+            execute(cursor, USERS_QUERY)
             users = cursor.fetchall()
             return jsonify(users), 200
 
 @app.route('/users/<int:user_id>', methods=['GET'])
 def get_user(user_id):
     """Get single user details"""
-    query = "SELECT * FROM users WHERE user_id = %s"
-    with get_db_connection() as conn:
+    with db_connection() as conn:
         with conn.cursor(row_factory=dict_row) as cursor:
-            cursor.execute(query, (user_id,))
+            execute(cursor, USER_QUERY, (user_id,))
             user = cursor.fetchone()
             if user is None:
                 abort(404, description='User not found')
             return jsonify(user), 200
 
+# One JSON document built by Postgres and passed through unparsed
+USER_FULL_QUERY = register('user_full', """\
+    SELECT to_json(u) FROM (
+        SELECT
+            u.*,
+            (
+                SELECT COALESCE(json_agg(ad ORDER BY ad.address_id), '[]'::json)
+                FROM addresses ad
+                WHERE ad.user_id = u.user_id
+            ) AS addresses,
+            (
+                SELECT COALESCE(json_agg(
+                    to_jsonb(r) || jsonb_build_object(
+                        'title', b.title,
+                        'authors', (
+                            SELECT COALESCE(json_agg(json_build_object(
+                                'author_id', a.author_id,
+                                'name', a.name,
+                                'surname', a.surname
+                            ) ORDER BY a.surname, a.name), '[]'::json)
+                            FROM authorship s
+                            JOIN authors a USING (author_id)
+                            WHERE s.isbn = r.isbn
+                        )
+                    )
+                    ORDER BY r.review_date DESC
+                ), '[]'::json)
+                FROM reviews r
+                JOIN books b USING (isbn)
+                WHERE r.user_id = u.user_id
+            ) AS reviews
+        FROM users u
+        WHERE u.user_id = %s
+    ) AS u
+    """, warmup=(0,))
+
+
+@app.route('/users/<int:user_id>/full', methods=['GET'])
+def get_user_full(user_id):
+    """User details together with their addresses and reviews, in one query"""
+    user = fetch_json(USER_FULL_QUERY, (user_id,))
+    if user is None:
+        abort(404, description='User not found')
+    return json_response(Response, user), 200
+
 @app.route('/users', methods=['POST'])
 def create_user():
     """Create new user with optional primary address"""
-    data = request.get_json()
-    if not data:
-        abort(400, description='No JSON data provided')
+    user_params, addr = new_user_params(request.get_json())
 
-    required_fields = ['name', 'surname', 'email', 'passhash']
-    for field in required_fields:
-        if field not in data or not data[field]:
-            abort(400, description=f'Missing required field: {field}')
-
-    with get_db_connection() as conn:
+    with db_connection() as conn:
         with conn.cursor(row_factory=dict_row) as cursor:
             # Insert the user
-            cursor.execute("""
-                INSERT INTO users (name, surname, passhash, email, email_verified, phone)
-                VALUES (%s, %s, %s, %s, %s, %s)
-                RETURNING user_id, name, surname, email, phone, email_verified
-            """, (
-                data['name'],
-                data['surname'],
-                data['passhash'],
-                data['email'],
-                data.get('email_verified', False),
-                data.get('phone')
-            ))
+            execute(cursor, INSERT_USER_QUERY, user_params)
             user = cursor.fetchone()
 
             # If address data is provided, create the address
-            if data.get('address'):
-                addr = data['address']
-                cursor.execute("""
-                    INSERT INTO addresses (user_id, street, building_nr, apartment_nr, city, postal_code, country, is_primary)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, TRUE)
-                    RETURNING address_id
-                """, (
-                    user['user_id'],
-                    addr.get('street'),
-                    addr.get('building_nr'),
-                    addr.get('apartment_nr'),
-                    addr.get('city'),
-                    addr.get('postal_code'),
-                    addr.get('country', 'Polska')
-                ))
+            if addr:
+                execute(cursor, INSERT_PRIMARY_ADDRESS_QUERY, primary_address_params(user['user_id'], addr))
 
             conn.commit()
             return jsonify(user), 201
@@ -265,36 +708,20 @@ def update_user(user_id):
     if not data:
         abort(400, description='No JSON data provided')
 
-    # Build dynamic update query based on provided fields
-    allowed_fields = ['name', 'surname', 'email', 'phone', 'email_verified']
-    updates = []
-    values = []
-
-    for field in allowed_fields:
-        if field in data:
-            updates.append(f"{field} = %s")
-            values.append(data[field])
-
-    if not updates:
-        abort(400, description='No valid fields to update')
-
-    values.append(user_id)
+    query, params = update_statement(
+        'users', 'user_id', user_id, data, USER_UPDATE_FIELDS,
+        returning='user_id, name, surname, email, phone, email_verified',
+    )
 
-    with get_db_connection() as conn:
+    with db_connection() as conn:
         with conn.cursor(row_factory=dict_row) as cursor:
             # Check if user exists
-            cursor.execute("SELECT user_id FROM users WHERE user_id = %s", (user_id,))
+            execute(cursor, USER_EXISTS_QUERY, (user_id,))
             if cursor.fetchone() is None:
                 abort(404, description='User not found')
 
             # Update user
-            query = f"""
-                UPDATE users
-                SET {', '.join(updates)}
-                WHERE user_id = %s
-                RETURNING user_id, name, surname, email, phone, email_verified
-            """
-            cursor.execute(query, values)
+            execute(cursor, query, params)
             user = cursor.fetchone()
             conn.commit()
             return jsonify(user), 200
@@ -309,58 +736,72 @@ def delete_user(user_id):
 # ADDRESSES
 # =============================================================================
 
+USER_ADDRESSES_QUERY = register(
+    'user_addresses', "SELECT * FROM addresses WHERE user_id = %s ORDER BY address_id", warmup=(0,))
+ADDRESS_QUERY = register('address', "SELECT * FROM addresses WHERE address_id = %s", warmup=(0,))
+UNSET_PRIMARY_ADDRESS_QUERY = register(
+    'unset_primary_address',
+    "UPDATE addresses SET is_primary = FALSE WHERE user_id = %s AND is_primary = TRUE")
+
+INSERT_ADDRESS_QUERY = register('insert_address', """
+    INSERT INTO addresses (user_id, street, building_nr, apartment_nr, city, postal_code, country, is_primary)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    RETURNING *
+    """)
+
+ADDRESS_UPDATE_FIELDS = ['street', 'building_nr', 'apartment_nr', 'city', 'postal_code', 'country', 'is_primary']
+
+
+def new_address_params(user_id, data):
+    """Validate a POST /users/<id>/addresses body; returns INSERT_ADDRESS_QUERY params."""
+    if not data:
+        abort(400, description='No JSON data provided')
+
+    required_fields = ['street', 'city', 'postal_code']
+    for field in required_fields:
+        if field not in data or not data[field]:
+            abort(400, description=f'Missing required field: {field}')
+
+    return (
+        user_id,
+        data['street'],
+        data.get('building_nr'),
+        data.get('apartment_nr'),
+        data['city'],
+        data['postal_code'],
+        data.get('country', 'Polska'),
+        data.get('is_primary', False)
+    )
+
+
 @app.route('/users/<int:user_id>/addresses', methods=['GET'])
 def get_user_addresses(user_id):
     """List addresses for a user, ordered by address_id for consistency"""
-    query = "SELECT * FROM addresses WHERE user_id = %s ORDER BY address_id"
-    with get_db_connection() as conn:
+    with db_connection() as conn:
         with conn.cursor(row_factory=dict_row) as cursor:
-            cursor.execute(query, (user_id,))
+            execute(cursor, USER_ADDRESSES_QUERY, (user_id,))
             addresses = cursor.fetchall()
             return jsonify(addresses), 200
 
 @app.route('/users/<int:user_id>/addresses', methods=['POST'])
 def create_address(user_id):
     """Create new address for a user"""
-    data = request.get_json()
-    if not data:
-        abort(400, description='No JSON data provided')
+    params = new_address_params(user_id, request.get_json())
 
-    required_fields = ['street', 'city', 'postal_code']
-    for field in required_fields:
-        if field not in data or not data[field]:
-            abort(400, description=f'Missing required field: {field}')
-
-    with get_db_connection() as conn:
+    with db_connection() as conn:
         with conn.cursor(row_factory=dict_row) as cursor:
             # Check if user exists
-            cursor.execute("SELECT user_id FROM users WHERE user_id = %s", (user_id,))
+            execute(cursor, USER_EXISTS_QUERY, (user_id,))
             if cursor.fetchone() is None:
                 abort(404, description='User not found')
 
             # If this should be primary, unset other primary addresses first
-            is_primary = data.get('is_primary', False)
+            is_primary = params[-1]
             if is_primary:
-                cursor.execute(
-                    "UPDATE addresses SET is_primary = FALSE WHERE user_id = %s",
-                    (user_id,)
-                )
+                execute(cursor, UNSET_PRIMARY_ADDRESS_QUERY, (user_id,))
 
             # Insert the address
-            cursor.execute("""
-                INSERT INTO addresses (user_id, street, building_nr, apartment_nr, city, postal_code, country, is_primary)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING *
-            """, (
-                user_id,
-                data['street'],
-                data.get('building_nr'),
-                data.get('apartment_nr'),
-                data['city'],
-                data['postal_code'],
-                data.get('country', 'Polska'),
-                is_primary
-            ))
+            execute(cursor, INSERT_ADDRESS_QUERY, params)
             address = cursor.fetchone()
             conn.commit()
             return jsonify(address), 201
@@ -372,46 +813,25 @@ def update_address(address_id):
     if not data:
         abort(400, description='No JSON data provided')
 
-    with get_db_connection() as conn:
+    with db_connection() as conn:
         with conn.cursor(row_factory=dict_row) as cursor:
             # Get the address and its user_id
-            cursor.execute("SELECT * FROM addresses WHERE address_id = %s", (address_id,))
+            execute(cursor, ADDRESS_QUERY, (address_id,))
             address = cursor.fetchone()
             if address is None:
                 abort(404, description='Address not found')
 
             # If setting as primary and it's not already primary, unset other primary addresses first
             if data.get('is_primary', False) and not address['is_primary']:
-                cursor.execute(
-                    "UPDATE addresses SET is_primary = FALSE WHERE user_id = %s AND is_primary = TRUE",
-                    (address['user_id'],)
-                )
+                execute(cursor, UNSET_PRIMARY_ADDRESS_QUERY, (address['user_id'],))
             elif data.get('is_primary', False) and address['is_primary']:
                 # Already primary, just return the current address
                 return jsonify(address), 200
 
-            # Build dynamic update query
-            allowed_fields = ['street', 'building_nr', 'apartment_nr', 'city', 'postal_code', 'country', 'is_primary']
-            updates = []
-            values = []
-
-            for field in allowed_fields:
-                if field in data:
-                    updates.append(f"{field} = %s")
-                    values.append(data[field])
-
-            if not updates:
-                abort(400, description='No valid fields to update')
-
-            values.append(address_id)
-
-            query = f"""
-                UPDATE addresses
-                SET {', '.join(updates)}
-                WHERE address_id = %s
-                RETURNING *
-            """
-            cursor.execute(query, values)
+            query, params = update_statement(
+                'addresses', 'address_id', address_id, data, ADDRESS_UPDATE_FIELDS, returning='*',
+            )
+            execute(cursor, query, params)
             updated_address = cursor.fetchone()
             conn.commit()
             return jsonify(updated_address), 200
@@ -421,81 +841,389 @@ def update_address(address_id):
 # BOOKS
 # =============================================================================
 
+BOOKS_PAGE_MAX_LIMIT = 1000
+BOOKS_STREAM_ITERSIZE = 500
+
+# Books are paged first (keyset on title, isbn) and only then joined with
+# authors, prices and inventory, so a page never aggregates the whole catalog.
+BOOKS_QUERY = """\
+    WITH page AS (
+        SELECT isbn, title, publication_year FROM books
+        {where}
+        ORDER BY title, isbn
+        {limit}
+    )
+    SELECT
+        b.isbn,
+        b.title,
+        b.publication_year,
+        p.unit_price,
+        COALESCE(i.quantity - i.quantity_reserved, 0) AS available_quantity,
+        br.avg_stars AS stars,
+        COALESCE(br.review_count, 0) AS review_count,
+        COALESCE(
+            json_agg(
+                json_build_object(
+                    'author_id', a.author_id,
+                    'name', a.name,
+                    'surname', a.surname
+                ) ORDER BY a.surname, a.name
+            ) FILTER (WHERE a.author_id IS NOT NULL),
+            '[]'::json
+        ) as authors
+    FROM page b
+    LEFT JOIN authorship au ON b.isbn = au.isbn
+    LEFT JOIN authors a ON au.author_id = a.author_id
+    LEFT JOIN prices p ON b.isbn = p.isbn AND p.valid_until IS NULL
+    LEFT JOIN inventory i ON b.isbn = i.isbn
+    LEFT JOIN book_ratings br ON b.isbn = br.isbn
+    GROUP BY b.isbn, b.title, b.publication_year, p.unit_price, i.quantity, i.quantity_reserved,
+        br.avg_stars, br.review_count
+    ORDER BY b.title, b.isbn
+    """
+
+
+BOOKS_PAGE_QUERY = register(
+    'books_page', BOOKS_QUERY.format(where='', limit='LIMIT %(limit)s'), warmup={'limit': 101})
+BOOKS_PAGE_AFTER_QUERY = register('books_page_after', BOOKS_QUERY.format(
+    where='WHERE (title, isbn) > (%(after_title)s, %(after_isbn)s)', limit='LIMIT %(limit)s'))
+# Read through a server-side cursor, which cannot use a prepared statement.
+# Every row is a JSON object built by Postgres and passed through unparsed.
+BOOKS_STREAM_QUERY = register('books_stream', f"""\
+    SELECT to_json(b) FROM (
+    {BOOKS_QUERY.format(where='', limit='')}
+    ) AS b
+    ORDER BY b.title, b.isbn
+    """, prepare=False)
+
+
+def encode_books_cursor(title, isbn):
+    """Opaque pagination token pointing just after the given (title, isbn)."""
+    raw = json.dumps([title, isbn]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_books_cursor(token):
+    try:
+        title, isbn = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (ValueError, TypeError):
+        abort(400, description='Invalid cursor')
+    if not isinstance(title, str) or not isinstance(isbn, str):
+        abort(400, description='Invalid cursor')
+    return title, isbn
+
+
+def books_page_statement(limit, cursor_token):
+    """Query and params of a /books page; returns (query, params, limit)."""
+    if limit is None:
+        limit = 100
+    if not 1 <= limit <= BOOKS_PAGE_MAX_LIMIT:
+        abort(400, description=f'limit must be between 1 and {BOOKS_PAGE_MAX_LIMIT}')
+
+    params = {'limit': limit + 1}
+    if cursor_token is None:
+        return BOOKS_PAGE_QUERY, params, limit
+    params['after_title'], params['after_isbn'] = decode_books_cursor(cursor_token)
+    return BOOKS_PAGE_AFTER_QUERY, params, limit
+
+
+def books_page(items, limit):
+    """{"items", "next_cursor"} of a page fetched with books_page_statement()."""
+    # One extra row tells whether another page exists
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_books_cursor(items[-1]['title'], items[-1]['isbn'])
+    return {'items': items, 'next_cursor': next_cursor}
+
+
+def stream_books(fmt):
+    """
+    Yield the whole catalog from a server-side cursor, BOOKS_STREAM_ITERSIZE
+    rows at a time, as NDJSON lines or as chunks of a single JSON array.
+    """
+    with db_connection() as conn:
+        # The stream always reads every row, so plan for the total cost instead
+        # of the fast-start plan Postgres prefers for cursors by default
+        conn.execute("SET LOCAL cursor_tuple_fraction = 1.0")
+        with use_raw_json(conn.cursor(name='books_stream')) as cursor:
+            cursor.itersize = BOOKS_STREAM_ITERSIZE
+            execute(cursor, BOOKS_STREAM_QUERY)
+            if fmt == 'ndjson':
+                for (book,) in cursor:
+                    yield book + b'\n'
+            else:
+                yield b'['
+                separator = b''
+                for (book,) in cursor:
+                    yield separator + book
+                    separator = b','
+                yield b']'
+
+
 @app.route('/books', methods=['GET'])
+@cached_response('books', 'authorship', 'authors', 'prices', 'inventory', 'book_ratings')
 def get_books():
-    """List all books with their authors aggregated."""
-    query = """\
+    """
+    List books with their authors aggregated, ordered by title.
+
+    Without ?limit the whole catalog is streamed as a JSON array
+    (or newline-delimited JSON with ?format=ndjson).
+    With ?limit=N[&cursor=...] a single page is returned:
+    {"items": [...], "next_cursor": str | null}
+    Pages are cached; the streamed catalog is not.
+    """
+    limit = int_arg(request.args, 'limit')
+    cursor_token = request.args.get('cursor')
+    fmt = request.args.get('format', 'json')
+    if fmt not in ('json', 'ndjson'):
+        abort(400, description='format must be json or ndjson')
+
+    if limit is None and cursor_token is None:
+        mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'application/json'
+        return Response(stream_with_context(stream_books(fmt)), mimetype=mimetype), 200
+
+    query, params, limit = books_page_statement(limit, cursor_token)
+    with db_connection() as conn:
+        with conn.cursor(row_factory=dict_row) as cursor:
+            execute(cursor, query, params)
+            items = cursor.fetchall()
+    return jsonify(books_page(items, limit)), 200
+
+
+BOOK_SEARCH_MAX_LIMIT = 50
+
+BOOK_SEARCH_ISBN_BRANCH = """\
+    SELECT isbn, 3.0 AS score FROM books
+    WHERE isbn LIKE %(isbn_prefix)s
+    """
+
+BOOK_SEARCH_FULLTEXT_BRANCH = """\
+    SELECT isbn, 1.0 + ts_rank_cd(search_vector, to_tsquery('simple', %(tsquery)s), 32) AS score
+    FROM books
+    WHERE search_vector @@ to_tsquery('simple', %(tsquery)s)
+    """
+
+BOOK_SEARCH_TRIGRAM_BRANCH = """\
+    SELECT isbn, similarity(title, %(q)s) AS score FROM books
+    WHERE title %% %(q)s
+    """
+
+# Every branch is answered by its own index (isbn text_pattern_ops, the
+# search_vector GIN and the title trigram GIN); only the top-N candidates are
+# then joined with authors, prices and inventory.
+BOOK_SEARCH_QUERY = """\
+    WITH matches AS (
+        {branches}
+    ),
+    ranked AS (
+        SELECT isbn, MAX(score) AS score FROM matches
+        GROUP BY isbn
+        ORDER BY score DESC, isbn
+        LIMIT %(limit)s
+    )
+    SELECT
+        b.isbn,
+        b.title,
+        b.publication_year,
+        p.unit_price,
+        COALESCE(i.quantity - i.quantity_reserved, 0) AS available_quantity,
+        br.avg_stars AS stars,
+        COALESCE(br.review_count, 0) AS review_count,
+        COALESCE(
+            json_agg(
+                json_build_object(
+                    'author_id', a.author_id,
+                    'name', a.name,
+                    'surname', a.surname
+                ) ORDER BY a.surname, a.name
+            ) FILTER (WHERE a.author_id IS NOT NULL),
+            '[]'::json
+        ) as authors,
+        r.score::float AS score,
+        ts_headline('simple', b.title, to_tsquery('simple', %(tsquery)s),
+                    'HighlightAll=true, StartSel=<mark>, StopSel=</mark>') AS title_highlight,
+        ts_headline('simple',
+                    COALESCE(string_agg(a.name || COALESCE(' ' || a.surname, ''), ', '
+                                        ORDER BY a.surname, a.name), ''),
+                    to_tsquery('simple', %(tsquery)s),
+                    'HighlightAll=true, StartSel=<mark>, StopSel=</mark>') AS authors_highlight
+    FROM ranked r
+    JOIN books b USING (isbn)
+    LEFT JOIN authorship au ON b.isbn = au.isbn
+    LEFT JOIN authors a ON au.author_id = a.author_id
+    LEFT JOIN prices p ON b.isbn = p.isbn AND p.valid_until IS NULL
+    LEFT JOIN inventory i ON b.isbn = i.isbn
+    LEFT JOIN book_ratings br ON b.isbn = br.isbn
+    GROUP BY b.isbn, b.title, b.publication_year, p.unit_price, i.quantity, i.quantity_reserved, r.score,
+        br.avg_stars, br.review_count
+    ORDER BY r.score DESC, b.title, b.isbn
+    """
+
+
+def build_prefix_tsquery(q):
+    """'data bas' -> 'data:* & bas:*', so partially typed words match too."""
+    return ' & '.join(f'{word}:*' for word in re.findall(r'\w+', q))
+
+
+def book_search_statement(q, limit):
+    """Query and params of a /books/search request; only the branches q can match."""
+    if len(q) < 2:
+        abort(400, description='Search query must have at least 2 characters')
+    if not 1 <= limit <= BOOK_SEARCH_MAX_LIMIT:
+        abort(400, description=f'limit must be between 1 and {BOOK_SEARCH_MAX_LIMIT}')
+
+    params = {'q': q, 'tsquery': build_prefix_tsquery(q), 'limit': limit}
+    branches = {'trigram': BOOK_SEARCH_TRIGRAM_BRANCH}
+    if params['tsquery']:
+        branches['fulltext'] = BOOK_SEARCH_FULLTEXT_BRANCH
+
+    # Digits and dashes only, and long enough not to be mistaken for a year
+    isbn_digits = q.replace('-', '')
+    if re.fullmatch(r'[\d-]+', q) and len(isbn_digits) >= 5:
+        params['isbn_prefix'] = isbn_digits + '%'
+        branches['isbn'] = BOOK_SEARCH_ISBN_BRANCH
+
+    query = BOOK_SEARCH_QUERY.format(branches='UNION ALL\n'.join(branches.values()))
+    return register(f"book_search[{','.join(branches)}]", query), params
+
+
+@app.route('/books/search', methods=['GET'])
+def search_books():
+    """
+    Ranked book search over ISBN prefix, title and author names.
+    Params: ?q=<text> (at least 2 characters), ?limit=N (default 10)
+
+    ISBN prefix matches rank first, then full-text matches on title and
+    authors, then fuzzy (trigram) title matches. Matched words are wrapped in
+    <mark> in title_highlight and authors_highlight.
+    """
+    query, params = book_search_statement(
+        request.args.get('q', '').strip(),
+        int_arg(request.args, 'limit', 10),
+    )
+    with db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+        execute(cursor, query, params)
+        items = cursor.fetchall()
+        return jsonify(items), 200
+
+
+BOOK_SUMMARY_QUERY = register('book_summary', """\
+    SELECT title, publication_year, price_id, unit_price, inventory_id,
+        quantity, avg_stars AS stars, COALESCE(review_count, 0) AS review_count
+    FROM books
+    LEFT OUTER JOIN book_ratings USING (isbn)
+    LEFT OUTER JOIN prices USING (isbn)
+    LEFT OUTER JOIN inventory USING (isbn)
+    WHERE isbn = %s
+    AND valid_until IS NULL
+    """, warmup=('',))
+
+@app.route('/books/<isbn>', methods=['GET'])
+def get_book(isbn):
+    """Get book summary with price, inventory and rating."""
+    with db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+        execute(cursor, BOOK_SUMMARY_QUERY, (isbn, ))
+        items = cursor.fetchall()
+        return jsonify(items), 200
+
+# One JSON document built by Postgres and passed through unparsed
+BOOK_FULL_QUERY = register('book_full', """\
+    SELECT to_json(book) FROM (
         SELECT
             b.isbn,
             b.title,
             b.publication_year,
+            p.price_id,
             p.unit_price,
-            COALESCE(i.quantity - i.quantity_reserved, 0) AS available_quantity,
-            COALESCE(
-                json_agg(
-                    json_build_object(
-                        'author_id', a.author_id,
-                        'name', a.name,
-                        'surname', a.surname
-                    ) ORDER BY a.surname, a.name
-                ) FILTER (WHERE a.author_id IS NOT NULL),
-                '[]'::json
-            ) as authors
+            i.inventory_id,
+            i.quantity,
+            br.avg_stars AS stars,
+            COALESCE(br.review_count, 0) AS review_count,
+            (
+                SELECT COALESCE(json_agg(json_build_object(
+                    'author_id', a.author_id,
+                    'name', a.name,
+                    'surname', a.surname
+                ) ORDER BY a.surname, a.name), '[]'::json)
+                FROM authorship au
+                JOIN authors a USING (author_id)
+                WHERE au.isbn = b.isbn
+            ) AS authors,
+            (
+                SELECT COALESCE(json_agg(json_build_object(
+                    'category_id', c.category_id,
+                    'category_name', c.category_name
+                ) ORDER BY c.category_name), '[]'::json)
+                FROM book_categories bc
+                JOIN categories c USING (category_id)
+                WHERE bc.isbn = b.isbn
+            ) AS categories,
+            (
+                SELECT COALESCE(json_agg(json_build_object(
+                    'price_id', ph.price_id,
+                    'unit_price', ph.unit_price,
+                    'valid_from', ph.valid_from,
+                    'valid_until', ph.valid_until
+                ) ORDER BY ph.valid_from), '[]'::json)
+                FROM prices ph
+                WHERE ph.isbn = b.isbn
+            ) AS prices,
+            (
+                SELECT COALESCE(json_agg(
+                    to_jsonb(r) || jsonb_build_object('name', u.name, 'surname', u.surname)
+                    ORDER BY r.review_date DESC
+                ), '[]'::json)
+                FROM reviews r
+                LEFT JOIN users u USING (user_id)
+                WHERE r.isbn = b.isbn
+            ) AS reviews
         FROM books b
-        LEFT JOIN authorship au ON b.isbn = au.isbn
-        LEFT JOIN authors a ON au.author_id = a.author_id
         LEFT JOIN prices p ON b.isbn = p.isbn AND p.valid_until IS NULL
         LEFT JOIN inventory i ON b.isbn = i.isbn
-        GROUP BY b.isbn, b.title, b.publication_year, p.unit_price, i.quantity, i.quantity_reserved
-        ORDER BY b.title
-        """
-    with get_db_connection() as conn:
-        with conn.cursor(row_factory=dict_row) as cursor:
-            cursor.execute(query)
-            items = cursor.fetchall()
-            return jsonify(items), 200
+        LEFT JOIN book_ratings br ON b.isbn = br.isbn
+        WHERE b.isbn = %s
+    ) AS book
+    """, warmup=('',))
 
 
-@app.route('/books/<isbn>', methods=['GET'])
-def get_book(isbn):
-    """Get book summary with price, inventory and rating."""
-    query = """\
-        SELECT title, publication_year, price_id, unit_price, inventory_id,
-            quantity, stars FROM books
-        JOIN avg_rating USING (isbn)
-        LEFT OUTER JOIN prices USING (isbn)
-        LEFT OUTER JOIN inventory USING (isbn)
-        WHERE isbn = %s
-        AND valid_until IS NULL
-        """
-    with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
-        cursor.execute(query, (isbn, ))
-        items = cursor.fetchall()
-        return jsonify(items), 200
+@app.route('/books/<isbn>/full', methods=['GET'])
+def get_book_full(isbn):
+    """
+    Book summary together with its authors, categories, price history
+    (oldest first) and reviews (newest first), in one query.
+    """
+    book = fetch_json(BOOK_FULL_QUERY, (isbn, ))
+    if book is None:
+        abort(404, description='Book not found')
+    return json_response(Response, book), 200
+
+BOOK_AUTHORS_QUERY = register('book_authors', """\
+    SELECT author_id, name, surname FROM authors
+    JOIN authorship USING (author_id)
+    WHERE isbn = %s
+    """, warmup=('',))
 
 @app.route('/books/<isbn>/authors', methods=['GET'])
+@cached_response('authors', 'authorship')
 def get_book_authors(isbn):
     """Get all authors of a book"""
-    query = """\
-        SELECT author_id, name, surname FROM authors
-        JOIN authorship USING (author_id)
-        WHERE isbn = %s
-        """
-    with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
-        cursor.execute(query, (isbn, ))
+    with db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+        execute(cursor, BOOK_AUTHORS_QUERY, (isbn, ))
         items = cursor.fetchall()
         return jsonify(items), 200
 
+BOOK_CATEGORIES_QUERY = register('book_categories', """\
+    SELECT category_id, category_name FROM categories
+    JOIN book_categories USING (category_id)
+    WHERE isbn = %s
+    """, warmup=('',))
+
 @app.route('/books/<isbn>/categories', methods=['GET'])
 def get_book_categories(isbn):
     """Get all categories that the book is in"""
-    query = """\
-        SELECT category_id, category_name FROM categories
-        JOIN book_categories USING (category_id)
-        WHERE isbn = %s
-        """
-    with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
-        cursor.execute(query, (isbn, ))
+    with db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+        execute(cursor, BOOK_CATEGORIES_QUERY, (isbn, ))
         items = cursor.fetchall()
         return jsonify(items), 200
 
@@ -503,19 +1231,112 @@ def get_book_categories(isbn):
 # INVENTORY
 # =============================================================================
 
+INVENTORY_QUERY = register('inventory', """SELECT * FROM inventory""")
+
+# The predicate and order of idx_inventory_low_stock, so only the rows in
+# that partial index are read, already sorted
+LOW_STOCK_QUERY = register('low_stock', """\
+    SELECT * FROM inventory
+    WHERE available <= reorder_threshold
+    ORDER BY available, inventory_id
+    """)
+
+REORDER_QUEUE_MAX_LIMIT = 1000
+
+# Keyset pagination on (available, inventory_id) through idx_inventory_low_stock;
+# titles are looked up for the rows of the page only
+REORDER_QUEUE_QUERY = """\
+    SELECT i.inventory_id, i.isbn, b.title, i.quantity, i.quantity_reserved, i.available,
+        i.reorder_threshold, i.last_restocked
+    FROM inventory i
+    JOIN books b USING (isbn)
+    WHERE i.available <= i.reorder_threshold
+    {after}
+    ORDER BY i.available, i.inventory_id
+    LIMIT %(limit)s
+    """
+
+REORDER_QUEUE_PAGE_QUERY = register(
+    'reorder_queue', REORDER_QUEUE_QUERY.format(after=''), warmup={'limit': 101})
+REORDER_QUEUE_AFTER_QUERY = register('reorder_queue_after', REORDER_QUEUE_QUERY.format(
+    after='AND (i.available, i.inventory_id) > (%(after_available)s, %(after_inventory_id)s)'))
+
+
+def inventory_statement(low_stock):
+    """Query of an /inventory request, given its ?low_stock value."""
+    low_stock = (low_stock or 'false').lower()
+    if low_stock not in ('true', 'false'):
+        abort(400, description='low_stock must be true or false')
+    return LOW_STOCK_QUERY if low_stock == 'true' else INVENTORY_QUERY
+
+
+def encode_reorder_cursor(available, inventory_id):
+    """Opaque pagination token pointing just after the given (available, inventory_id)."""
+    return base64.urlsafe_b64encode(json.dumps([available, inventory_id]).encode()).decode()
+
+
+def decode_reorder_cursor(token):
+    try:
+        available, inventory_id = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (ValueError, TypeError):
+        abort(400, description='Invalid cursor')
+    if not isinstance(available, int) or not isinstance(inventory_id, int):
+        abort(400, description='Invalid cursor')
+    return available, inventory_id
+
+
+def reorder_queue_statement(limit, cursor_token):
+    """Query and params of a /inventory/reorder-queue page; returns (query, params, limit)."""
+    if limit is None:
+        limit = 100
+    if not 1 <= limit <= REORDER_QUEUE_MAX_LIMIT:
+        abort(400, description=f'limit must be between 1 and {REORDER_QUEUE_MAX_LIMIT}')
+
+    params = {'limit': limit + 1}
+    if cursor_token is None:
+        return REORDER_QUEUE_PAGE_QUERY, params, limit
+    params['after_available'], params['after_inventory_id'] = decode_reorder_cursor(cursor_token)
+    return REORDER_QUEUE_AFTER_QUERY, params, limit
+
+
+def reorder_queue_page(items, limit):
+    """{"items", "next_cursor"} of a page fetched with reorder_queue_statement()."""
+    # One extra row tells whether another page exists
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_reorder_cursor(items[-1]['available'], items[-1]['inventory_id'])
+    return {'items': items, 'next_cursor': next_cursor}
+
+
 @app.route('/inventory', methods=['GET'])
 def get_inventory():
-    """List all inventory. Filter: ?low_stock=true"""
-    low_stock = request.args.get('low_stock', type=str)
-    if low_stock is not None:
-        return jsonify({'error': "low stock argument is not yet handled"}), 500 #TODO
-
-    query = """SELECT * FROM inventory"""
-    with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
-        cursor.execute(query)
+    """
+    List all inventory. Filter: ?low_stock=true
+    Low stock rows (available <= reorder_threshold) come fewest available first.
+    """
+    query = inventory_statement(request.args.get('low_stock'))
+    with db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+        execute(cursor, query)
         items = cursor.fetchall()
         return jsonify(items), 200
 
+@app.route('/inventory/reorder-queue', methods=['GET'])
+@cached_response('inventory', 'books')
+def get_reorder_queue():
+    """
+    Books at or below their reorder threshold, most urgent (fewest available
+    copies) first, with their titles.
+    ?limit=N (default 100) and ?cursor=... page through them:
+    {"items": [...], "next_cursor": str | null}
+    """
+    query, params, limit = reorder_queue_statement(
+        int_arg(request.args, 'limit'), request.args.get('cursor'))
+    with db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+        execute(cursor, query, params)
+        items = cursor.fetchall()
+    return jsonify(reorder_queue_page(items, limit)), 200
+
 @app.route('/inventory/<int:inventory_id>', methods=['PATCH'])
 def update_inventory(inventory_id):
     """Update"""
@@ -525,39 +1346,90 @@ def update_inventory(inventory_id):
 # PRICES
 # =============================================================================
 
+OFFERS_QUERY = register('offers', """\
+    SELECT price_id, unit_price, quantity FROM prices
+    JOIN books USING (isbn)
+    LEFT OUTER JOIN inventory USING (isbn)
+    """)
+
 @app.route('/offers', methods=['GET'])
+@cached_response('prices', 'books', 'inventory')
 def get_offers():
     """List all current sell offers with price_id, unit_price and stocked quantity"""
-    query = """\
-        SELECT price_id, unit_price, quantity FROM prices
-        JOIN books USING (isbn)
-        LEFT OUTER JOIN inventory USING (isbn)
-        """
-    with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
-        cursor.execute(query)
+    with db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+        execute(cursor, OFFERS_QUERY)
         items = cursor.fetchall()
         return jsonify(items), 200
 
+CURRENT_PRICE_QUERY = register('current_price', """\
+    SELECT price_id, unit_price, valid_from, valid_until FROM prices
+    WHERE isbn = %s AND valid_until IS NULL
+    ORDER BY valid_from DESC
+    """, warmup=('',))
+
+PRICE_HISTORY_QUERY = register('price_history', """\
+    SELECT price_id, unit_price, valid_from, valid_until FROM prices
+    WHERE isbn = %s
+    ORDER BY valid_from ASC
+    """, warmup=('',))
+
 @app.route('/price/<isbn>', methods=['GET'])
 def get_price_of(isbn):
     """Get all prices of a book. Filter: ?valid_only=true"""
     valid_only = request.args.get('valid_only', type=bool, default=False)
+    query = CURRENT_PRICE_QUERY if valid_only else PRICE_HISTORY_QUERY
 
-    if valid_only:
-        query = """\
-            SELECT price_id, unit_price, valid_from, valid_until FROM prices
-            WHERE isbn = %s AND valid_until IS NULL
-            ORDER BY valid_from DESC
-            """
-    else:
-        query = """\
-            SELECT price_id, unit_price, valid_from, valid_until FROM prices
-            WHERE isbn = %s
-            ORDER BY valid_from ASC
-            """
-
-    with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
-        cursor.execute(query, (isbn, ))
+    with db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+        execute(cursor, query, (isbn, ))
+        items = cursor.fetchall()
+        return jsonify(items), 200
+
+PRICES_MAX_ISBNS = 1000
+
+# Index-only scan of ux_prices_current
+CURRENT_PRICES_QUERY = register('current_prices', """\
+    SELECT isbn, price_id, unit_price FROM prices
+    WHERE isbn = ANY(%(isbns)s) AND valid_until IS NULL
+    ORDER BY isbn
+    """, warmup={'isbns': ['']})
+
+# One probe of the prices_no_overlap GiST index per ISBN
+PRICES_AT_QUERY = register('prices_at', """\
+    SELECT p.isbn, p.price_id, p.unit_price FROM (
+        SELECT DISTINCT unnest(%(isbns)s::TEXT[]) AS isbn
+    ) AS q
+    JOIN prices p ON p.isbn = q.isbn AND p.valid_during @> %(at)s::TIMESTAMP
+    ORDER BY p.isbn
+    """, warmup={'isbns': [''], 'at': datetime(2000, 1, 1)})
+
+
+def prices_statement(isbns, at):
+    """Query and params of a /prices request."""
+    # ?isbn=a&isbn=b and ?isbn=a,b are both accepted
+    isbns = [isbn.strip() for value in isbns for isbn in value.split(',') if isbn.strip()]
+    if not isbns:
+        abort(400, description='At least one isbn is required')
+    if len(isbns) > PRICES_MAX_ISBNS:
+        abort(400, description=f'At most {PRICES_MAX_ISBNS} isbns can be looked up at once')
+    if at is None:
+        return CURRENT_PRICES_QUERY, {'isbns': isbns}
+    try:
+        return PRICES_AT_QUERY, {'isbns': isbns, 'at': datetime.fromisoformat(at)}
+    except ValueError:
+        abort(400, description='at must be an ISO 8601 date or timestamp')
+
+
+@app.route('/prices', methods=['GET'])
+@cached_response('prices')
+def get_prices():
+    """
+    Prices of many books at once: ?isbn=<isbn>[,<isbn>...] (repeatable),
+    ?at=<ISO timestamp> for the prices valid at that time (default: current).
+    Returns [{"isbn", "price_id", "unit_price"}] for the ISBNs that had a price.
+    """
+    query, params = prices_statement(request.args.getlist('isbn'), request.args.get('at'))
+    with db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+        execute(cursor, query, params)
         items = cursor.fetchall()
         return jsonify(items), 200
 
@@ -565,12 +1437,14 @@ def get_price_of(isbn):
 # STATUSES
 # =============================================================================
 
+STATUSES_QUERY = register('statuses', "SELECT * FROM statuses", warmup=())
+
 @app.route('/statuses', methods=['GET'])
+@cached_response('statuses')
 def get_statuses():
     """List all order statuses"""
-    query = "SELECT * FROM statuses"
-    with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
-        cursor.execute(query)
+    with db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+        execute(cursor, STATUSES_QUERY)
         items = cursor.fetchall()
         return jsonify(items), 200
 
@@ -579,12 +1453,14 @@ def get_statuses():
 # AUTHORS
 # =============================================================================
 
+AUTHORS_QUERY = register('authors', "SELECT * FROM authors", warmup=())
+
 @app.route('/authors', methods=['GET'])
+@cached_response('authors')
 def get_authors():
     """List all authors"""
-    query = "SELECT * FROM authors"
-    with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
-        cursor.execute(query)
+    with db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+        execute(cursor, AUTHORS_QUERY)
         items = cursor.fetchall()
         return jsonify(items), 200
 
@@ -598,12 +1474,14 @@ def create_author():
 # CATEGORIES
 # =============================================================================
 
+CATEGORIES_QUERY = register('categories', "SELECT * FROM categories", warmup=())
+
 @app.route('/categories', methods=['GET'])
+@cached_response('categories')
 def get_categories():
     """List all categories"""
-    query = "SELECT * FROM categories"
-    with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
-        cursor.execute(query)
+    with db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+        execute(cursor, CATEGORIES_QUERY)
         items = cursor.fetchall()
         return jsonify(items), 200
 
@@ -611,67 +1489,139 @@ def get_categories():
 # REVIEWS
 # =============================================================================
 
+USER_REVIEWS_QUERY = register('user_reviews', """
+    SELECT r.*, b.title,
+        COALESCE(
+            json_agg(
+                json_build_object(
+                    'author_id', a.author_id,
+                    'name', a.name,
+                    'surname', a.surname
+                ) ORDER BY a.surname, a.name
+            ) FILTER (WHERE a.author_id IS NOT NULL),
+            '[]'::json
+        ) as authors
+    FROM reviews r
+    JOIN books b USING (isbn)
+    LEFT JOIN authorship s USING (isbn)
+    LEFT JOIN authors a USING (author_id)
+    WHERE r.user_id = %s
+    GROUP BY r.review_id, b.title
+    ORDER BY r.review_date DESC
+    """, warmup=(0,))
+
 @app.route('/users/<int:user_id>/reviews', methods=['GET'])
 def get_user_reviews(user_id):
     """Get reviews written by a user"""
-    query = """
-        SELECT r.*, b.title,
-            COALESCE(
-                json_agg(
-                    json_build_object(
-                        'author_id', a.author_id,
-                        'name', a.name,
-                        'surname', a.surname
-                    ) ORDER BY a.surname, a.name
-                ) FILTER (WHERE a.author_id IS NOT NULL),
-                '[]'::json
-            ) as authors
-        FROM reviews r
-        JOIN books b USING (isbn)
-        LEFT JOIN authorship s USING (isbn)
-        LEFT JOIN authors a USING (author_id)
-        WHERE r.user_id = %s
-        GROUP BY r.review_id, b.title
-        ORDER BY r.review_date DESC
-    """
-    with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
-        cursor.execute(query, (user_id,))
+    with db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+        execute(cursor, USER_REVIEWS_QUERY, (user_id,))
         items = cursor.fetchall()
         return jsonify(items), 200
 
 
+BOOK_REVIEWS_QUERY = register('book_reviews', """
+    SELECT r.*, u.name, u.surname
+    FROM reviews r
+    JOIN users u USING (user_id)
+    WHERE r.isbn = %s
+    ORDER BY r.review_date DESC
+    """, warmup=('',))
+
 @app.route('/books/<isbn>/reviews', methods=['GET'])
 def get_book_reviews(isbn):
     """Get reviews for a book with user info"""
-    query = """
-        SELECT r.*, u.name, u.surname
-        FROM reviews r
-        JOIN users u USING (user_id)
-        WHERE r.isbn = %s
-        ORDER BY r.review_date DESC
-    """
-    with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
-        cursor.execute(query, (isbn, ))
+    with db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+        execute(cursor, BOOK_REVIEWS_QUERY, (isbn, ))
         items = cursor.fetchall()
         return jsonify(items), 200
 
+BESTSELLERS_ALL_TIME = "SELECT isbn, copies_sold FROM book_sales"
+
+BESTSELLERS_WINDOW = """\
+    SELECT isbn, SUM(copies_sold) AS copies_sold FROM book_sales_daily
+    WHERE sale_date >= CURRENT_DATE - %(days)s::INTEGER
+    GROUP BY isbn
+    """
+
+BESTSELLERS_CATEGORY_FILTER = """\
+    AND EXISTS (
+        SELECT 1 FROM book_categories bc
+        JOIN categories c USING (category_id)
+        WHERE bc.isbn = b.isbn
+          AND (c.category_name = %(category)s OR c.category_id::TEXT = %(category)s)
+    )
+    """
+
+
+def bestsellers_statement(limit, days, category):
+    """Query and params of a /books/bestsellers request."""
+    if limit is not None and limit < 1:
+        abort(400, description='limit must be positive')
+    if days is not None and days < 1:
+        abort(400, description='days must be positive')
+
+    sales = BESTSELLERS_ALL_TIME if days is None else BESTSELLERS_WINDOW
+    # A top-N ranking only needs sold books, the full listing shows all of them
+    join = 'JOIN' if limit is not None else 'RIGHT JOIN'
+    query = f"""\
+        SELECT b.isbn, b.title, b.publication_year, COALESCE(s.copies_sold, 0) AS sold_copies
+        FROM ({sales}) AS s
+        {join} books AS b USING (isbn)
+        WHERE TRUE
+        {BESTSELLERS_CATEGORY_FILTER if category else ''}
+        ORDER BY sold_copies DESC, b.isbn
+        LIMIT %(limit)s
+        """
+    name = (f"bestsellers[{'all_time' if days is None else 'window'},"
+            f"{'all' if limit is None else 'top'}{',category' if category else ''}]")
+    return register(name, query), {'limit': limit, 'days': days, 'category': category}
+
+
 @app.route('/books/bestsellers', methods=['GET'])
 def get_bestsellers():
-    """Get books that were bought the most times"""
-    query = """\
-        SELECT b.isbn, b.title, b.publication_year, COALESCE(SUM(oi.quantity), 0) as sold_copies 
-        FROM books as b
-        JOIN prices as p USING (isbn)
-        LEFT JOIN order_items as oi USING (price_id)
-
-        GROUP BY b.isbn
-        ORDER BY sold_copies DESC
-        """
-    with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
-        cursor.execute(query)
+    """
+    Get books that were bought the most times, from the book_sales counters.
+    Params: ?limit=N (top N sold books), ?category=<name or id>,
+            ?days=N (only sales from the last N days)
+
+    Without ?limit every book is listed, including ones never sold.
+    """
+    query, params = bestsellers_statement(
+        int_arg(request.args, 'limit'),
+        int_arg(request.args, 'days'),
+        request.args.get('category'),
+    )
+    with db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+        execute(cursor, query, params)
         items = cursor.fetchall()
         return jsonify(items), 200
 
 
+# =============================================================================
+# DIAGNOSTICS
+# =============================================================================
+
+@app.route('/pool/stats', methods=['GET'])
+def get_pool_stats():
+    """Connection pool configuration and usage counters"""
+    return jsonify(pool_stats()), 200
+
+@app.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Response cache size, hit/miss counters and listener state"""
+    return jsonify(cache_stats()), 200
+
+@app.route('/queries/stats', methods=['GET'])
+def get_query_stats():
+    """Calls, rows and prepare/execute time of every registered query that ran"""
+    return jsonify(query_stats()), 200
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Per-route latency, SQL and response size histograms in Prometheus text format"""
+    return Response(render_metrics(), content_type=PROMETHEUS_CONTENT_TYPE), 200
+
+
 if __name__ == '__main__':
+    create_order_partitions()
     app.run(port=5000)
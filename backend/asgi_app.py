@@ -0,0 +1,480 @@
+"""
+Asyncio version of the backend, for ASGI servers.
+
+Serves the routes of app.py with the same JSON, but on psycopg AsyncConnections
+borrowed from an async pool (db_pool.async_db_connection()), so one worker
+process keeps hundreds of requests in flight while they wait for Postgres.
+The SQL and the request validation are shared with app.py.
+
+Run with:
+    python asgi_app.py                                   # 127.0.0.1:5000
+    hypercorn asgi_app:app --bind 0.0.0.0:5000 --workers 4
+"""
+
+import asyncio
+import logging
+import os
+
+from psycopg.rows import dict_row
+from quart import Quart, Response, abort, jsonify, request
+from quart_cors import cors
+
+from app import (
+    ADDRESS_QUERY,
+    ADDRESS_UPDATE_FIELDS,
+    AUTHORS_QUERY,
+    BOOK_AUTHORS_QUERY,
+    BOOK_CATEGORIES_QUERY,
+    BOOK_FULL_QUERY,
+    BOOK_REVIEWS_QUERY,
+    BOOK_SUMMARY_QUERY,
+    BOOKS_STREAM_ITERSIZE,
+    BOOKS_STREAM_QUERY,
+    CATEGORIES_QUERY,
+    CREATE_ORDER_QUERY,
+    CREATE_ORDERS_QUERY,
+    CURRENT_PRICE_QUERY,
+    INSERT_ADDRESS_QUERY,
+    INSERT_PRIMARY_ADDRESS_QUERY,
+    INSERT_USER_QUERY,
+    OFFERS_QUERY,
+    ORDER_ITEMS_QUERY,
+    ORDER_SUMMARY_QUERY,
+    PRICE_HISTORY_QUERY,
+    RETRYABLE_ORDER_ERRORS,
+    STATUSES_QUERY,
+    UNSET_PRIMARY_ADDRESS_QUERY,
+    USER_ADDRESSES_QUERY,
+    USER_EXISTS_QUERY,
+    USER_FULL_QUERY,
+    USER_QUERY,
+    USER_REVIEWS_QUERY,
+    USER_UPDATE_FIELDS,
+    USERS_QUERY,
+    bestsellers_statement,
+    book_search_statement,
+    books_page,
+    books_page_statement,
+    create_order_params,
+    create_order_partitions,
+    create_orders_params,
+    get_order_retry_policy,
+    int_arg,
+    inventory_statement,
+    new_address_params,
+    new_user_params,
+    order_details_statement,
+    order_retry_delay,
+    orders_page,
+    orders_page_statement,
+    prices_statement,
+    primary_address_params,
+    reorder_queue_page,
+    reorder_queue_statement,
+    update_statement,
+)
+from db_pool import async_db_connection, async_pool_stats, close_async_pool, get_async_pool
+from json_encoding import init_app as init_json, json_response, use_raw_json
+from metrics import PROMETHEUS_CONTENT_TYPE, init_asgi_app as init_metrics, render_metrics
+from query_registry import execute_async, query_stats
+from response_cache import cache_stats, cached_response, get_response_cache
+
+app = cors(Quart(__name__))
+init_json(app)
+init_metrics(app)
+
+
+async def fetch_all(query, params=None):
+    async with async_db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+        await execute_async(cursor, query, params)
+        return await cursor.fetchall()
+
+
+async def fetch_one(query, params=None):
+    async with async_db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+        await execute_async(cursor, query, params)
+        return await cursor.fetchone()
+
+
+async def fetch_json(query, params=None):
+    """Async app.fetch_json(): a JSON document built by Postgres, as raw bytes."""
+    async with async_db_connection() as conn, use_raw_json(conn.cursor()) as cursor:
+        await execute_async(cursor, query, params)
+        row = await cursor.fetchone()
+    return None if row is None else row[0]
+
+
+@app.before_serving
+async def open_pool():
+    await asyncio.to_thread(create_order_partitions)
+    await get_async_pool()
+
+
+@app.after_serving
+async def close_pool():
+    await close_async_pool()
+
+
+# Error handlers - the same responses as app.py
+@app.errorhandler(400)
+async def handle_bad_request(e):
+    logging.warning(f"Bad request: {e.description}")
+    return jsonify({'error': e.description}), 400
+
+@app.errorhandler(404)
+async def handle_not_found(e):
+    logging.warning(f"Not found: {e.description}")
+    return jsonify({'error': e.description}), 404
+
+@app.errorhandler(409)
+async def handle_conflict(e):
+    logging.warning(f"Conflict: {e.description}")
+    return jsonify({'error': e.description}), 409
+
+@app.errorhandler(Exception)
+async def handle_exception(e):
+    logging.error(f"Unhandled exception: {e}", exc_info=True)
+    # For psycopg errors, extract just the main message (before CONTEXT:)
+    error_msg = str(e).split('\nCONTEXT:')[0]
+    return jsonify({'error': error_msg}), 500
+
+@app.after_request
+async def invalidate_cache_after_write(response):
+    """See app.invalidate_cache_after_write()."""
+    if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+        cache = get_response_cache()
+        if cache is not None:
+            cache.invalidate()
+    return response
+
+
+# =============================================================================
+# ORDERS
+# =============================================================================
+
+@app.route('/user_order_summary', methods=['GET'])
+async def get_orders():
+    if not request.args:
+        return json_response(Response, await fetch_json(ORDER_SUMMARY_QUERY)), 200
+
+    query, estimate, params, limit = orders_page_statement(request.args)
+    async with async_db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+        await execute_async(cursor, query, params)
+        items = await cursor.fetchall()
+        await execute_async(cursor, estimate, params)
+        plan = (await cursor.fetchone())['QUERY PLAN']
+    return jsonify(orders_page(items, limit, plan, 'cursor' not in request.args)), 200
+
+@app.route('/orders/<int:order_id>', methods=['GET'])
+async def get_order(order_id):
+    query, params = order_details_statement(order_id, request.args)
+    async with async_db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+        await execute_async(cursor, query, params)
+        order = await cursor.fetchone()
+        if order is not None:
+            await execute_async(cursor, ORDER_ITEMS_QUERY, {'order_id': order_id, 'order_time': order['order_time']})
+            order['items'] = await cursor.fetchall()
+    return jsonify(order), 200
+
+@app.route('/orders', methods=['POST'])
+@app.route('/orders/<int:order_id>', methods=['PATCH', 'DELETE'])
+@app.route('/orders/<int:order_id>/items', methods=['GET', 'POST'])
+@app.route('/order-items/<int:item_id>', methods=['DELETE'])
+@app.route('/users/<int:user_id>', methods=['DELETE'])
+@app.route('/inventory/<int:inventory_id>', methods=['PATCH'])
+@app.route('/authors', methods=['POST'])
+async def not_implemented(**kwargs):
+    return jsonify(None), 500 #TODO, as in app.py
+
+
+async def run_order_transaction(query, params_for):
+    """Async app.run_order_transaction(): retries busy inventory with backoff."""
+    policy = get_order_retry_policy()
+    for attempt in range(1, policy['attempts'] + 1):
+        try:
+            async with async_db_connection() as conn, conn.cursor() as cursor:
+                await execute_async(cursor, query, params_for(policy['lock_mode']))
+                return await cursor.fetchall()
+        except RETRYABLE_ORDER_ERRORS as e:
+            if attempt == policy['attempts']:
+                logging.warning(f"Giving up order after {attempt} attempts: {e}")
+                abort(409, description='Inventory is busy, please retry the order')
+            delay = order_retry_delay(policy, attempt)
+            logging.info(f"Order attempt {attempt} failed ({type(e).__name__}), retrying in {delay:.3f}s")
+            await asyncio.sleep(delay)
+
+@app.route('/create_order', methods=['POST'])
+async def create_order_transaction_route():
+    rows = await run_order_transaction(CREATE_ORDER_QUERY, create_order_params(await request.get_json()))
+    return jsonify(rows[0][0]), 201
+
+@app.route('/create_orders', methods=['POST'])
+async def create_orders_transaction_route():
+    rows = await run_order_transaction(CREATE_ORDERS_QUERY, create_orders_params(await request.get_json()))
+    return jsonify([row[0] for row in rows]), 201
+
+
+# =============================================================================
+# USERS AND ADDRESSES
+# =============================================================================
+
+@app.route('/users', methods=['GET'])
+async def get_users():
+    return jsonify(await fetch_all(USERS_QUERY)), 200
+
+@app.route('/users/<int:user_id>', methods=['GET'])
+async def get_user(user_id):
+    user = await fetch_one(USER_QUERY, (user_id,))
+    if user is None:
+        abort(404, description='User not found')
+    return jsonify(user), 200
+
+@app.route('/users/<int:user_id>/full', methods=['GET'])
+async def get_user_full(user_id):
+    user = await fetch_json(USER_FULL_QUERY, (user_id,))
+    if user is None:
+        abort(404, description='User not found')
+    return json_response(Response, user), 200
+
+@app.route('/users', methods=['POST'])
+async def create_user():
+    user_params, addr = new_user_params(await request.get_json())
+
+    async with async_db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+        await execute_async(cursor, INSERT_USER_QUERY, user_params)
+        user = await cursor.fetchone()
+        if addr:
+            await execute_async(cursor, INSERT_PRIMARY_ADDRESS_QUERY, primary_address_params(user['user_id'], addr))
+        await conn.commit()
+        return jsonify(user), 201
+
+@app.route('/users/<int:user_id>', methods=['PATCH'])
+async def update_user(user_id):
+    data = await request.get_json()
+    if not data:
+        abort(400, description='No JSON data provided')
+
+    query, params = update_statement(
+        'users', 'user_id', user_id, data, USER_UPDATE_FIELDS,
+        returning='user_id, name, surname, email, phone, email_verified',
+    )
+
+    async with async_db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+        await execute_async(cursor, USER_EXISTS_QUERY, (user_id,))
+        if await cursor.fetchone() is None:
+            abort(404, description='User not found')
+        await execute_async(cursor, query, params)
+        user = await cursor.fetchone()
+        await conn.commit()
+        return jsonify(user), 200
+
+@app.route('/users/<int:user_id>/addresses', methods=['GET'])
+async def get_user_addresses(user_id):
+    return jsonify(await fetch_all(USER_ADDRESSES_QUERY, (user_id,))), 200
+
+@app.route('/users/<int:user_id>/addresses', methods=['POST'])
+async def create_address(user_id):
+    params = new_address_params(user_id, await request.get_json())
+
+    async with async_db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+        await execute_async(cursor, USER_EXISTS_QUERY, (user_id,))
+        if await cursor.fetchone() is None:
+            abort(404, description='User not found')
+        is_primary = params[-1]
+        if is_primary:
+            await execute_async(cursor, UNSET_PRIMARY_ADDRESS_QUERY, (user_id,))
+        await execute_async(cursor, INSERT_ADDRESS_QUERY, params)
+        address = await cursor.fetchone()
+        await conn.commit()
+        return jsonify(address), 201
+
+@app.route('/addresses/<int:address_id>', methods=['PATCH'])
+async def update_address(address_id):
+    data = await request.get_json()
+    if not data:
+        abort(400, description='No JSON data provided')
+
+    async with async_db_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+        await execute_async(cursor, ADDRESS_QUERY, (address_id,))
+        address = await cursor.fetchone()
+        if address is None:
+            abort(404, description='Address not found')
+
+        if data.get('is_primary', False) and not address['is_primary']:
+            await execute_async(cursor, UNSET_PRIMARY_ADDRESS_QUERY, (address['user_id'],))
+        elif data.get('is_primary', False) and address['is_primary']:
+            return jsonify(address), 200
+
+        query, params = update_statement(
+            'addresses', 'address_id', address_id, data, ADDRESS_UPDATE_FIELDS, returning='*',
+        )
+        await execute_async(cursor, query, params)
+        updated_address = await cursor.fetchone()
+        await conn.commit()
+        return jsonify(updated_address), 200
+
+@app.route('/users/<int:user_id>/reviews', methods=['GET'])
+async def get_user_reviews(user_id):
+    return jsonify(await fetch_all(USER_REVIEWS_QUERY, (user_id,))), 200
+
+
+# =============================================================================
+# BOOKS
+# =============================================================================
+
+async def stream_books(fmt):
+    """Async app.stream_books(): the whole catalog from a server-side cursor."""
+    async with async_db_connection() as conn:
+        await conn.execute("SET LOCAL cursor_tuple_fraction = 1.0")
+        async with use_raw_json(conn.cursor(name='books_stream')) as cursor:
+            cursor.itersize = BOOKS_STREAM_ITERSIZE
+            await execute_async(cursor, BOOKS_STREAM_QUERY)
+            if fmt == 'ndjson':
+                async for (book,) in cursor:
+                    yield book + b'\n'
+            else:
+                yield b'['
+                separator = b''
+                async for (book,) in cursor:
+                    yield separator + book
+                    separator = b','
+                yield b']'
+
+@app.route('/books', methods=['GET'])
+@cached_response('books', 'authorship', 'authors', 'prices', 'inventory', 'book_ratings')
+async def get_books():
+    limit = int_arg(request.args, 'limit')
+    cursor_token = request.args.get('cursor')
+    fmt = request.args.get('format', 'json')
+    if fmt not in ('json', 'ndjson'):
+        abort(400, description='format must be json or ndjson')
+
+    if limit is None and cursor_token is None:
+        mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'application/json'
+        return Response(stream_books(fmt), mimetype=mimetype), 200
+
+    query, params, limit = books_page_statement(limit, cursor_token)
+    return jsonify(books_page(await fetch_all(query, params), limit)), 200
+
+@app.route('/books/search', methods=['GET'])
+async def search_books():
+    query, params = book_search_statement(
+        request.args.get('q', '').strip(),
+        int_arg(request.args, 'limit', 10),
+    )
+    return jsonify(await fetch_all(query, params)), 200
+
+@app.route('/books/<isbn>', methods=['GET'])
+async def get_book(isbn):
+    return jsonify(await fetch_all(BOOK_SUMMARY_QUERY, (isbn, ))), 200
+
+@app.route('/books/<isbn>/full', methods=['GET'])
+async def get_book_full(isbn):
+    book = await fetch_json(BOOK_FULL_QUERY, (isbn, ))
+    if book is None:
+        abort(404, description='Book not found')
+    return json_response(Response, book), 200
+
+@app.route('/books/<isbn>/authors', methods=['GET'])
+@cached_response('authors', 'authorship')
+async def get_book_authors(isbn):
+    return jsonify(await fetch_all(BOOK_AUTHORS_QUERY, (isbn, ))), 200
+
+@app.route('/books/<isbn>/categories', methods=['GET'])
+async def get_book_categories(isbn):
+    return jsonify(await fetch_all(BOOK_CATEGORIES_QUERY, (isbn, ))), 200
+
+@app.route('/books/<isbn>/reviews', methods=['GET'])
+async def get_book_reviews(isbn):
+    return jsonify(await fetch_all(BOOK_REVIEWS_QUERY, (isbn, ))), 200
+
+@app.route('/books/bestsellers', methods=['GET'])
+async def get_bestsellers():
+    query, params = bestsellers_statement(
+        int_arg(request.args, 'limit'),
+        int_arg(request.args, 'days'),
+        request.args.get('category'),
+    )
+    return jsonify(await fetch_all(query, params)), 200
+
+
+# =============================================================================
+# INVENTORY, PRICES AND DICTIONARIES
+# =============================================================================
+
+@app.route('/inventory', methods=['GET'])
+async def get_inventory():
+    return jsonify(await fetch_all(inventory_statement(request.args.get('low_stock')))), 200
+
+@app.route('/inventory/reorder-queue', methods=['GET'])
+@cached_response('inventory', 'books')
+async def get_reorder_queue():
+    query, params, limit = reorder_queue_statement(
+        int_arg(request.args, 'limit'), request.args.get('cursor'))
+    return jsonify(reorder_queue_page(await fetch_all(query, params), limit)), 200
+
+@app.route('/offers', methods=['GET'])
+@cached_response('prices', 'books', 'inventory')
+async def get_offers():
+    return jsonify(await fetch_all(OFFERS_QUERY)), 200
+
+@app.route('/price/<isbn>', methods=['GET'])
+async def get_price_of(isbn):
+    valid_only = request.args.get('valid_only', type=bool, default=False)
+    query = CURRENT_PRICE_QUERY if valid_only else PRICE_HISTORY_QUERY
+    return jsonify(await fetch_all(query, (isbn, ))), 200
+
+@app.route('/prices', methods=['GET'])
+@cached_response('prices')
+async def get_prices():
+    query, params = prices_statement(request.args.getlist('isbn'), request.args.get('at'))
+    return jsonify(await fetch_all(query, params)), 200
+
+@app.route('/statuses', methods=['GET'])
+@cached_response('statuses')
+async def get_statuses():
+    return jsonify(await fetch_all(STATUSES_QUERY)), 200
+
+@app.route('/authors', methods=['GET'])
+@cached_response('authors')
+async def get_authors():
+    return jsonify(await fetch_all(AUTHORS_QUERY)), 200
+
+@app.route('/categories', methods=['GET'])
+@cached_response('categories')
+async def get_categories():
+    return jsonify(await fetch_all(CATEGORIES_QUERY)), 200
+
+
+# =============================================================================
+# DIAGNOSTICS
+# =============================================================================
+
+@app.route('/pool/stats', methods=['GET'])
+async def get_pool_stats():
+    return jsonify(async_pool_stats()), 200
+
+@app.route('/cache/stats', methods=['GET'])
+async def get_cache_stats():
+    return jsonify(cache_stats()), 200
+
+@app.route('/queries/stats', methods=['GET'])
+async def get_query_stats():
+    return jsonify(query_stats()), 200
+
+@app.route('/metrics', methods=['GET'])
+async def get_metrics():
+    return Response(render_metrics(), content_type=PROMETHEUS_CONTENT_TYPE), 200
+
+
+def main():
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = [os.environ.get('ASGI_BIND', '127.0.0.1:5000')]
+    asyncio.run(serve(app, config))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Side-by-side throughput benchmark of the backend servers.
+
+Starts each server on its own port against the database from .env, sends it
+the same mix of GET requests from --concurrency keep-alive connections for
+--duration seconds, and prints requests/s and latency percentiles:
+
+    python benchmark_servers.py --concurrency 64 --duration 10
+    python benchmark_servers.py --servers asgi --path "/books?limit=50"
+
+Servers:
+    flask:    app.py on Flask's threaded development server
+    gunicorn: app.py on Gunicorn via serve.py, WEB_WORKERS x WEB_THREADS (what Electron runs)
+    asgi:     asgi_app.py on Hypercorn, one worker process
+
+The response cache is off unless --cache is given, so that every request
+reaches Postgres. All servers use the same DB_POOL_* settings.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent
+
+SERVERS = {
+    'flask': lambda port: [
+        sys.executable, '-m', 'flask', '--app', 'app', 'run',
+        '--port', str(port), '--with-threads',
+    ],
+    'gunicorn': lambda port: [
+        sys.executable, 'serve.py', '--bind', f'127.0.0.1:{port}',
+    ],
+    'asgi': lambda port: [
+        sys.executable, '-m', 'hypercorn', 'asgi_app:app',
+        '--bind', f'127.0.0.1:{port}',
+    ],
+}
+
+DEFAULT_PATHS = [
+    '/books?limit=50',
+    '/books/search?q=data',
+    '/books/bestsellers?limit=10',
+    '/books/{isbn}/full',
+    '/users/{user_id}/full',
+]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with code {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', '/statuses')
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server did not start on port {port}")
+
+
+def sample_ids(port):
+    """ISBNs and user ids to fill the {isbn} and {user_id} placeholders."""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    conn.request('GET', '/books?limit=200')
+    isbns = [book['isbn'] for book in json.loads(conn.getresponse().read())['items']]
+    conn.request('GET', '/users')
+    user_ids = [user['user_id'] for user in json.loads(conn.getresponse().read())]
+    conn.close()
+    return isbns, user_ids
+
+
+def run_load(port, paths, isbns, user_ids, concurrency, duration):
+    """Hammer the server; returns (latencies in seconds, error count)."""
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def client(seed):
+        nonlocal errors
+        rng = random.Random(seed)
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        mine = []
+        failed = 0
+        while time.monotonic() < stop_at:
+            path = rng.choice(paths).format(isbn=rng.choice(isbns), user_id=rng.choice(user_ids))
+            started = time.perf_counter()
+            try:
+                conn.request('GET', path)
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    failed += 1
+                    continue
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+                continue
+            mine.append(time.perf_counter() - started)
+        conn.close()
+        with lock:
+            latencies.extend(mine)
+            errors += failed
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors
+
+
+def benchmark(name, args, env):
+    port = free_port()
+    process = subprocess.Popen(
+        SERVERS[name](port), cwd=BACKEND_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_up(port, process)
+        isbns, user_ids = sample_ids(port)
+        # Warm up connections and plans before measuring
+        run_load(port, args.paths, isbns, user_ids, args.concurrency, 1)
+        latencies, errors = run_load(port, args.paths, isbns, user_ids, args.concurrency, args.duration)
+    finally:
+        process.terminate()
+        process.wait()
+
+    latencies.sort()
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000 if latencies else 0.0
+    return {
+        'server': name,
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / args.duration,
+        'mean_ms': statistics.fmean(latencies) * 1000 if latencies else 0.0,
+        'p50_ms': percentile(0.50),
+        'p99_ms': percentile(0.99),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the throughput of the backend servers.")
+    parser.add_argument('--servers', nargs='+', choices=sorted(SERVERS), default=['flask', 'gunicorn', 'asgi'])
+    parser.add_argument('--concurrency', type=int, default=64, help='parallel keep-alive connections')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of load per server')
+    parser.add_argument('--path', dest='paths', action='append',
+                        help='GET path to request (repeatable); {isbn} and {user_id} are filled in')
+    parser.add_argument('--cache', action='store_true', help='keep the response cache on')
+    args = parser.parse_args(argv)
+    args.paths = args.paths or DEFAULT_PATHS
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    env = dict(os.environ)
+    if not args.cache:
+        env['RESPONSE_CACHE'] = 'off'
+
+    print(f"{args.concurrency} connections, {args.duration:g}s per server, paths: {', '.join(args.paths)}")
+    print(f"{'server':<9} {'requests':>9} {'errors':>7} {'req/s':>9} {'mean ms':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for name in args.servers:
+        r = benchmark(name, args, env)
+        print(f"{r['server']:<9} {r['requests']:>9} {r['errors']:>7} {r['rps']:>9.1f} "
+              f"{r['mean_ms']:>9.1f} {r['p50_ms']:>8.1f} {r['p99_ms']:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
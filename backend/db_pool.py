@@ -0,0 +1,178 @@
+"""
+Database connection handling for the Flask backend.
+
+Routes borrow connections from a shared psycopg_pool.ConnectionPool instead of
+opening a new connection (TCP + auth handshake) for every request. The pool can
+be turned off with DB_POOL=off to compare against plain connect-per-request.
+The asyncio backend (asgi_app.py) uses an AsyncConnectionPool configured by the
+same variables, one per event loop.
+
+Environment variables:
+    DB_POOL: "on" (default) or "off"
+    DB_POOL_MIN_SIZE: Connections kept open even when idle (default: 1)
+    DB_POOL_MAX_SIZE: Upper bound of open connections (default: 10)
+    DB_POOL_MAX_IDLE: Seconds an idle connection above min size is kept (default: 300)
+    DB_POOL_TIMEOUT: Seconds a request waits for a free connection (default: 30)
+"""
+
+import asyncio
+import atexit
+import logging
+import os
+import threading
+from contextlib import asynccontextmanager, contextmanager
+
+import psycopg
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
+
+_pool = None
+_pool_lock = threading.Lock()
+
+_async_pool = None
+_async_pool_lock = None
+
+
+def get_connection_kwargs() -> dict:
+    """Connection parameters read from DB_* environment variables."""
+    return {
+        'host': os.environ.get('DB_HOST', 'localhost'),
+        'port': os.environ.get('DB_PORT', '5432'),
+        'dbname': os.environ.get('DB_NAME', 'inventory_db'),
+        'user': os.environ.get('DB_USER', 'inventory_user'),
+        'password': os.environ.get('DB_PASSWORD', 'secure_password'),
+    }
+
+
+def pool_enabled() -> bool:
+    return os.environ.get('DB_POOL', 'on').lower() not in ('0', 'off', 'false', 'no')
+
+
+def get_pool_kwargs() -> dict:
+    """Size and timeout settings shared by the sync and async pools."""
+    return {
+        'kwargs': get_connection_kwargs(),
+        'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '1')),
+        'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '10')),
+        'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', '300')),
+        'timeout': float(os.environ.get('DB_POOL_TIMEOUT', '30')),
+    }
+
+
+def get_pool() -> ConnectionPool | None:
+    """Return the shared pool, creating it on first use. None when pooling is off."""
+    global _pool
+    if not pool_enabled():
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    **get_pool_kwargs(),
+                    # Health check on checkout: broken connections are replaced
+                    # instead of failing the request
+                    check=ConnectionPool.check_connection,
+                    name='backend',
+                    open=True,
+                )
+                atexit.register(_pool.close)
+                logging.info(
+                    f"Connection pool opened (min={_pool.min_size}, max={_pool.max_size})"
+                )
+    return _pool
+
+
+def close_pool():
+    """Close the shared pool (if any); the next get_pool() call opens a new one."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+@contextmanager
+def db_connection():
+    """
+    Borrow a connection for the duration of a `with` block.
+
+    The transaction is committed when the block exits normally and rolled back
+    on an exception, exactly like `with psycopg.connect(...) as conn`.
+    """
+    pool = get_pool()
+    if pool is None:
+        with psycopg.connect(**get_connection_kwargs()) as conn:
+            yield conn
+    else:
+        with pool.connection() as conn:
+            yield conn
+
+
+async def get_async_pool() -> AsyncConnectionPool | None:
+    """
+    Return the shared async pool, opening it on first use. None when pooling is off.
+    Must be called from the event loop the pool will be used in.
+    """
+    global _async_pool, _async_pool_lock
+    if not pool_enabled():
+        return None
+    if _async_pool is None:
+        if _async_pool_lock is None:
+            _async_pool_lock = asyncio.Lock()
+        async with _async_pool_lock:
+            if _async_pool is None:
+                pool = AsyncConnectionPool(
+                    **get_pool_kwargs(),
+                    check=AsyncConnectionPool.check_connection,
+                    name='backend-async',
+                    open=False,
+                )
+                await pool.open()
+                _async_pool = pool
+                logging.info(
+                    f"Async connection pool opened (min={pool.min_size}, max={pool.max_size})"
+                )
+    return _async_pool
+
+
+async def close_async_pool():
+    """Close the shared async pool (if any); the next get_async_pool() call opens a new one."""
+    global _async_pool, _async_pool_lock
+    pool, _async_pool, _async_pool_lock = _async_pool, None, None
+    if pool is not None:
+        await pool.close()
+
+
+@asynccontextmanager
+async def async_db_connection():
+    """Async counterpart of db_connection(), for asgi_app.py."""
+    pool = await get_async_pool()
+    if pool is None:
+        async with await psycopg.AsyncConnection.connect(**get_connection_kwargs()) as conn:
+            yield conn
+    else:
+        async with pool.connection() as conn:
+            yield conn
+
+
+def pool_stats() -> dict:
+    """Current pool configuration and psycopg_pool counters."""
+    return _stats(_pool)
+
+
+def async_pool_stats() -> dict:
+    """pool_stats() of the async pool."""
+    return _stats(_async_pool)
+
+
+def _stats(pool) -> dict:
+    if not pool_enabled() or pool is None:
+        return {'enabled': pool_enabled(), 'open': False}
+    return {
+        'enabled': True,
+        'open': not pool.closed,
+        'min_size': pool.min_size,
+        'max_size': pool.max_size,
+        'max_idle': pool.max_idle,
+        'timeout': pool.timeout,
+        **pool.get_stats(),
+    }
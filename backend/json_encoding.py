@@ -0,0 +1,115 @@
+"""
+Fast JSON encoding of responses, and JSON documents passed through from Postgres.
+
+OrjsonProvider replaces Flask's (and Quart's) stdlib-based JSON provider.
+orjson encodes the dict rows of psycopg in C, straight to bytes. Keys stay
+sorted unless the app sets sort_keys off.
+
+Endpoints whose result is already built by Postgres (json_agg, row_to_json)
+read it with use_raw_json(): json and jsonb columns then arrive as the bytes
+Postgres sent and are written to the response unparsed, without building
+Python objects at all.
+
+Both providers encode values the way Postgres' to_json does, so a row has the
+same JSON whichever way it is served: Decimals are JSON numbers, datetimes and
+dates are ISO 8601 strings (not the RFC 822 dates of Flask's default provider).
+
+Environment variables:
+    JSON_SERIALIZER: "orjson" (default when installed) or "stdlib"
+"""
+
+import os
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask.json.provider import DefaultJSONProvider
+from psycopg.adapt import Loader
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_MIMETYPE = 'application/json'
+
+
+def serializer_name() -> str:
+    name = os.environ.get('JSON_SERIALIZER', 'orjson' if orjson is not None else 'stdlib').lower()
+    if name not in ('orjson', 'stdlib'):
+        raise ValueError('JSON_SERIALIZER must be orjson or stdlib')
+    if name == 'orjson' and orjson is None:
+        raise ValueError('JSON_SERIALIZER=orjson but orjson is not installed')
+    return name
+
+
+def default(obj):
+    """Encode the types json and orjson do not know, as Postgres' to_json does."""
+    if isinstance(obj, Decimal):
+        # The numeric columns have at most 12 digits, which a float holds exactly
+        return float(obj)
+    if isinstance(obj, datetime):
+        # Postgres writes fractional seconds without trailing zeros
+        text = obj.replace(microsecond=0).isoformat()
+        if obj.microsecond:
+            text = text[:19] + f".{obj.microsecond:06d}".rstrip('0') + text[19:]
+        return text
+    if isinstance(obj, date):
+        return obj.isoformat()
+    return DefaultJSONProvider.default(obj)
+
+
+class StdlibProvider(DefaultJSONProvider):
+    """Flask's DefaultJSONProvider, encoding values like OrjsonProvider."""
+
+    default = staticmethod(default)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """DefaultJSONProvider encoding with orjson; dumps() ignores json.dumps options."""
+
+    default = staticmethod(default)
+
+    def _option(self) -> int:
+        # Datetimes go through default() too, to be formatted like Postgres does
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return option
+
+    def dumps_bytes(self, obj) -> bytes:
+        # default() is only reached for Decimal, dates and other types orjson leaves out
+        return orjson.dumps(obj, default=self.default, option=self._option())
+
+    def dumps(self, obj, **kwargs) -> str:
+        return self.dumps_bytes(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
+
+
+def init_app(app):
+    """Install the JSON provider chosen by JSON_SERIALIZER on a Flask or Quart app."""
+    app.json = OrjsonProvider(app) if serializer_name() == 'orjson' else StdlibProvider(app)
+
+
+class RawJSONLoader(Loader):
+    """Loads json and jsonb values as their bytes, without parsing them."""
+
+    def load(self, data):
+        return bytes(data)
+
+
+def use_raw_json(cursor):
+    """Make cursor return json and jsonb columns as raw bytes; returns cursor."""
+    cursor.adapters.register_loader('json', RawJSONLoader)
+    cursor.adapters.register_loader('jsonb', RawJSONLoader)
+    return cursor
+
+
+def json_response(response_class, body, status=200):
+    """Response carrying an already encoded JSON document."""
+    return response_class(body, status=status, mimetype=JSON_MIMETYPE)
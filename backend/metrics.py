@@ -0,0 +1,323 @@
+"""
+Per-request latency and SQL metrics, served in Prometheus text format.
+
+A WSGI middleware (app.py) or ASGI middleware (asgi_app.py) times every
+request from the moment the server hands it over until the last byte of the
+body is sent, so streamed responses are measured in full. While the request
+runs, the query registry reports each statement's duration and rows, and the
+JSON provider its serialization time. The totals are recorded per route as
+histograms:
+
+    http_request_duration_seconds       wall time
+    http_request_db_seconds             time spent executing queries
+    http_request_db_rows                rows returned by those queries
+    http_request_serialization_seconds  time spent encoding JSON
+    http_response_size_bytes            body size
+
+plus http_requests_total by status and the per-query counters of the
+registry. Every worker process keeps its own numbers.
+
+Environment variables:
+    METRICS: "on" (default) or "off"
+"""
+
+import contextlib
+import contextvars
+import os
+import threading
+import time
+
+from flask import request
+
+from query_registry import registry
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROWS_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+HISTOGRAMS = (
+    ('http_request_duration_seconds', 'Wall time of a request.', DURATION_BUCKETS),
+    ('http_request_db_seconds', 'Time a request spent executing SQL.', DURATION_BUCKETS),
+    ('http_request_db_rows', 'Rows returned by the SQL of a request.', ROWS_BUCKETS),
+    ('http_request_serialization_seconds', 'Time a request spent encoding JSON.', DURATION_BUCKETS),
+    ('http_response_size_bytes', 'Size of the response body.', SIZE_BUCKETS),
+)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+def metrics_enabled() -> bool:
+    return os.environ.get('METRICS', 'on').lower() not in ('0', 'off', 'false', 'no')
+
+
+class RequestMetrics:
+    """What one request spent, filled in while it runs."""
+
+    def __init__(self, method):
+        self.method = method
+        self.route = 'unmatched'
+        self.status = 0
+        self.started = time.perf_counter()
+        self.db_time = 0.0
+        self.db_rows = 0
+        self.serialization_time = 0.0
+        self.size = 0
+
+    def values(self, duration):
+        """Observations in the order of HISTOGRAMS."""
+        return (duration, self.db_time, self.db_rows, self.serialization_time, self.size)
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observed values."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels) -> str:
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """Histograms per (route, method) and request counts per status."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {name: {} for name, _, _ in HISTOGRAMS}
+        self._requests = {}
+
+    def observe(self, request_metrics):
+        duration = time.perf_counter() - request_metrics.started
+        key = (request_metrics.route, request_metrics.method)
+        with self._lock:
+            for (name, _, buckets), value in zip(HISTOGRAMS, request_metrics.values(duration)):
+                histogram = self._histograms[name].get(key)
+                if histogram is None:
+                    histogram = self._histograms[name][key] = Histogram(buckets)
+                histogram.observe(value)
+            status_key = key + (request_metrics.status,)
+            self._requests[status_key] = self._requests.get(status_key, 0) + 1
+
+    def render(self) -> str:
+        lines = [
+            '# HELP http_requests_total Requests handled, by route, method and status.',
+            '# TYPE http_requests_total counter',
+        ]
+        with self._lock:
+            for (route, method, status), count in sorted(self._requests.items()):
+                lines.append(f'http_requests_total{_labels(route=route, method=method, status=status)} {count}')
+            for name, help_text, buckets in HISTOGRAMS:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for (route, method), histogram in sorted(self._histograms[name].items()):
+                    for bound, count in zip(buckets, histogram.counts):
+                        labels = _labels(route=route, method=method, le=_number(bound))
+                        lines.append(f'{name}_bucket{labels} {count}')
+                    labels = _labels(route=route, method=method, le='+Inf')
+                    lines.append(f'{name}_bucket{labels} {histogram.count}')
+                    labels = _labels(route=route, method=method)
+                    lines.append(f'{name}_sum{labels} {_number(histogram.sum)}')
+                    lines.append(f'{name}_count{labels} {histogram.count}')
+        lines.extend(_query_lines())
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {name: {} for name, _, _ in HISTOGRAMS}
+            self._requests = {}
+
+
+QUERY_COUNTERS = (
+    ('db_query_calls_total', 'Executions of a registered query.', 'calls'),
+    ('db_query_rows_total', 'Rows returned by a registered query.', 'rows'),
+    ('db_query_prepares_total', 'Executions that prepared the query on their connection.', 'prepares'),
+    ('db_query_slow_total', 'Executions slower than SLOW_QUERY_MS.', 'slow_calls'),
+    ('db_query_seconds_total', 'Time spent executing a registered query.', 'seconds'),
+)
+
+
+def _query_lines():
+    """Counters of the query registry, labelled by query name."""
+    stats = registry.stats()
+    for query in stats:
+        query['seconds'] = query['total_ms'] / 1000
+    lines = []
+    for name, help_text, field in QUERY_COUNTERS:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        for query in stats:
+            lines.append(f'{name}{_labels(query=query["name"])} {_number(query[field])}')
+    return lines
+
+
+metrics = Metrics()
+
+
+def _record_query(query, elapsed, rowcount):
+    request_metrics = _current.get()
+    if request_metrics is not None:
+        request_metrics.db_time += elapsed
+        request_metrics.db_rows += max(rowcount, 0)
+
+
+registry.observers.append(_record_query)
+
+
+def set_route(rule):
+    """Label the current request with its URL rule (called from before_request)."""
+    request_metrics = _current.get()
+    if request_metrics is not None and rule is not None:
+        request_metrics.route = rule.rule
+
+
+def timed_json_provider(base):
+    """Subclass of a Flask/Quart JSON provider that adds encoding time to the request."""
+    class TimedJSONProvider(base):
+        def dumps(self, obj, **kwargs):
+            with _timed_serialization():
+                return super().dumps(obj, **kwargs)
+
+        def dumps_bytes(self, obj):
+            # Only providers that encode straight to bytes (json_encoding.OrjsonProvider)
+            with _timed_serialization():
+                return super().dumps_bytes(obj)
+
+    TimedJSONProvider.__name__ = f'Timed{base.__name__}'
+    return TimedJSONProvider
+
+
+@contextlib.contextmanager
+def _timed_serialization():
+    request_metrics = _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if request_metrics is not None:
+            request_metrics.serialization_time += time.perf_counter() - started
+
+
+class _MeteredBody:
+    """
+    WSGI response iterable that counts bytes and records the request once the
+    body is exhausted or closed, whichever comes first.
+    """
+
+    def __init__(self, body, request_metrics):
+        self._body = body
+        self._metrics = request_metrics
+        self._recorded = False
+
+    def __iter__(self):
+        # Streamed bodies run their queries while being iterated
+        _current.set(self._metrics)
+        try:
+            for chunk in self._body:
+                self._metrics.size += len(chunk)
+                yield chunk
+        finally:
+            _current.set(None)
+        self._record()
+
+    def close(self):
+        try:
+            if hasattr(self._body, 'close'):
+                self._body.close()
+        finally:
+            self._record()
+
+    def _record(self):
+        if not self._recorded:
+            self._recorded = True
+            metrics.observe(self._metrics)
+
+
+class WSGIMetricsMiddleware:
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        request_metrics = RequestMetrics(environ.get('REQUEST_METHOD', 'GET'))
+
+        def metered_start_response(status, headers, exc_info=None):
+            request_metrics.status = int(status.split(' ', 1)[0])
+            return start_response(status, headers, exc_info)
+
+        token = _current.set(request_metrics)
+        try:
+            body = self.wsgi_app(environ, metered_start_response)
+        finally:
+            _current.reset(token)
+        return _MeteredBody(body, request_metrics)
+
+
+class ASGIMetricsMiddleware:
+    def __init__(self, asgi_app):
+        self.asgi_app = asgi_app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.asgi_app(scope, receive, send)
+        request_metrics = RequestMetrics(scope['method'])
+
+        async def metered_send(message):
+            if message['type'] == 'http.response.start':
+                request_metrics.status = message['status']
+            elif message['type'] == 'http.response.body':
+                request_metrics.size += len(message.get('body', b''))
+            await send(message)
+
+        token = _current.set(request_metrics)
+        try:
+            await self.asgi_app(scope, receive, metered_send)
+        finally:
+            _current.reset(token)
+            metrics.observe(request_metrics)
+
+
+def init_app(app):
+    """Instrument a Flask app: middleware, route labels and JSON timing."""
+    if not metrics_enabled():
+        return
+    app.json = timed_json_provider(type(app.json))(app)
+    app.before_request(lambda: set_route(request.url_rule))
+    app.wsgi_app = WSGIMetricsMiddleware(app.wsgi_app)
+
+
+def init_asgi_app(app):
+    """Instrument a Quart app: middleware, route labels and JSON timing."""
+    if not metrics_enabled():
+        return
+    from quart import request as quart_request
+
+    async def label_route():
+        set_route(quart_request.url_rule)
+
+    app.json = timed_json_provider(type(app.json))(app)
+    app.before_request(label_route)
+    app.asgi_app = ASGIMetricsMiddleware(app.asgi_app)
+
+
+def render_metrics() -> str:
+    return metrics.render()
@@ -0,0 +1,266 @@
+"""
+Named SQL statements, prepared once per pooled connection, with counters.
+
+Routes execute a Query from the registry instead of a bare SQL string. Queries
+run with prepare=True: the first execution on a connection has Postgres parse
+and plan the statement as a server-side prepared statement, which psycopg keeps
+for the lifetime of the connection, and later executions on that connection
+only bind the new parameters. Statements assembled at runtime (the
+/books/search branches, the /user_order_summary filters) are registered under
+one name per variant, so every variant is prepared once as well. psycopg keeps
+at most prepared_max (100) statements per connection, so the variants of a
+statement should stay few.
+
+For every query the registry counts calls and rows and accumulates time:
+    prepare_ms: executions that prepared the statement on their connection,
+        i.e. parsing and planning plus the first run
+    execute_ms: executions of a statement already prepared on the connection
+
+Executions slower than SLOW_QUERY_MS are written to the `slow_queries` logger
+with their parameters and plan. Read-only queries are run again under
+EXPLAIN (ANALYZE, BUFFERS) in a savepoint that is rolled back; statements that
+write only get a plain EXPLAIN, so nothing is executed twice. Statements that
+are EXPLAINs themselves are logged without a plan.
+
+Environment variables:
+    DB_PREPARE: "on" (default) or "off" to run every statement unprepared
+    SLOW_QUERY_MS: Duration above which a query is logged, 0 to disable (default: 500)
+    SLOW_QUERY_LOG: File the slow query log is appended to (default: the app log)
+"""
+
+import logging
+import os
+import threading
+import time
+import weakref
+
+import psycopg
+
+slow_query_log = logging.getLogger('slow_queries')
+if os.environ.get('SLOW_QUERY_LOG'):
+    _handler = logging.FileHandler(os.environ['SLOW_QUERY_LOG'])
+    _handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+    slow_query_log.addHandler(_handler)
+
+
+def prepare_enabled() -> bool:
+    return os.environ.get('DB_PREPARE', 'on').lower() not in ('0', 'off', 'false', 'no')
+
+
+def slow_query_threshold() -> float:
+    """Seconds above which an execution is logged; 0 when the log is off."""
+    return float(os.environ.get('SLOW_QUERY_MS', '500')) / 1000
+
+
+def explain_statement(query) -> str:
+    if query.read_only:
+        return 'EXPLAIN (ANALYZE, BUFFERS) ' + query.sql
+    return 'EXPLAIN ' + query.sql
+
+
+class Query:
+    """
+    A named statement and its counters.
+
+    warmup holds parameters of the right types to prepare a read-only query
+    before any request needs it (see prepare_connection()); None for
+    statements that must not run outside a request, such as writes.
+    read_only defaults to whether the statement is a SELECT or WITH; pass
+    False for a SELECT of a function that writes. explain is whether the
+    statement is an EXPLAIN, which the slow query log cannot EXPLAIN again.
+    """
+
+    def __init__(self, name, sql, prepare=True, warmup=None, read_only=None):
+        self.name = name
+        self.sql = sql
+        self.prepare = prepare
+        self.warmup = warmup
+        keyword = sql.lstrip().split(None, 1)[0].upper()
+        if read_only is None:
+            read_only = keyword in ('SELECT', 'WITH')
+        self.read_only = read_only
+        self.explain = keyword == 'EXPLAIN'
+        self.calls = 0
+        self.rows = 0
+        self.prepares = 0
+        self.prepare_time = 0.0
+        self.execute_time = 0.0
+        self.slow_calls = 0
+
+    def __repr__(self):
+        return f"Query({self.name!r})"
+
+    def stats(self) -> dict:
+        total = self.prepare_time + self.execute_time
+        return {
+            'name': self.name,
+            'calls': self.calls,
+            'rows': self.rows,
+            'prepares': self.prepares,
+            'slow_calls': self.slow_calls,
+            'prepare_ms': round(self.prepare_time * 1000, 3),
+            'execute_ms': round(self.execute_time * 1000, 3),
+            'total_ms': round(total * 1000, 3),
+            'mean_ms': round(total * 1000 / self.calls, 3) if self.calls else 0.0,
+        }
+
+
+class QueryRegistry:
+    """Queries by name, and the names prepared on each open connection."""
+
+    def __init__(self):
+        self._queries = {}
+        self._lock = threading.Lock()
+        # Connections are dropped from here when they are garbage collected
+        self._prepared = weakref.WeakKeyDictionary()
+        # Called with (query, seconds, rowcount) after every execution
+        self.observers = []
+
+    def register(self, name, sql, prepare=True, warmup=None, read_only=None) -> Query:
+        """Return the query registered as name, registering it first if new."""
+        with self._lock:
+            query = self._queries.get(name)
+            if query is None:
+                query = self._queries[name] = Query(name, sql, prepare, warmup, read_only)
+            elif query.sql != sql:
+                raise ValueError(f"Query {name!r} is already registered with different SQL")
+            return query
+
+    def __getitem__(self, name) -> Query:
+        return self._queries[name]
+
+    def __iter__(self):
+        return iter(list(self._queries.values()))
+
+    def _begin(self, cursor, query):
+        """psycopg's prepare argument, and whether this call prepares on the connection."""
+        if not query.prepare:
+            return None, False
+        if not prepare_enabled():
+            return False, False
+        with self._lock:
+            names = self._prepared.setdefault(cursor.connection, set())
+            preparing = query.name not in names
+            names.add(query.name)
+        return True, preparing
+
+    def _record(self, query, preparing, elapsed, rowcount):
+        with self._lock:
+            query.calls += 1
+            query.rows += max(rowcount, 0)
+            if preparing:
+                query.prepares += 1
+                query.prepare_time += elapsed
+            else:
+                query.execute_time += elapsed
+        for observer in self.observers:
+            observer(query, elapsed, rowcount)
+
+    def execute(self, cursor, query, params=None):
+        """cursor.execute() of a registered query, prepared and counted."""
+        prepare, preparing = self._begin(cursor, query)
+        started = time.perf_counter()
+        try:
+            if prepare is None:
+                # Server-side cursors take no prepare argument
+                cursor.execute(query.sql, params)
+            else:
+                cursor.execute(query.sql, params, prepare=prepare)
+        except BaseException:
+            self._forget(cursor, query, preparing)
+            raise
+        elapsed = time.perf_counter() - started
+        self._record(query, preparing, elapsed, cursor.rowcount)
+        if 0 < slow_query_threshold() < elapsed:
+            self._log_slow_query(cursor.connection, query, params, elapsed)
+        return cursor
+
+    async def execute_async(self, cursor, query, params=None):
+        """execute() for an AsyncCursor."""
+        prepare, preparing = self._begin(cursor, query)
+        started = time.perf_counter()
+        try:
+            if prepare is None:
+                await cursor.execute(query.sql, params)
+            else:
+                await cursor.execute(query.sql, params, prepare=prepare)
+        except BaseException:
+            self._forget(cursor, query, preparing)
+            raise
+        elapsed = time.perf_counter() - started
+        self._record(query, preparing, elapsed, cursor.rowcount)
+        if 0 < slow_query_threshold() < elapsed:
+            await self._log_slow_query_async(cursor.connection, query, params, elapsed)
+        return cursor
+
+    def _log_slow_query(self, conn, query, params, elapsed):
+        if query.explain:
+            self._write_slow_query(query, params, elapsed, None)
+            return
+        try:
+            # The savepoint undoes whatever EXPLAIN ANALYZE did; the cursor
+            # of the request already holds its own result
+            with conn.transaction(force_rollback=True), conn.cursor() as cursor:
+                cursor.execute(explain_statement(query), params)
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+        except psycopg.Error as e:
+            plan = f"EXPLAIN failed: {e}"
+        self._write_slow_query(query, params, elapsed, plan)
+
+    async def _log_slow_query_async(self, conn, query, params, elapsed):
+        if query.explain:
+            self._write_slow_query(query, params, elapsed, None)
+            return
+        try:
+            async with conn.transaction(force_rollback=True), conn.cursor() as cursor:
+                await cursor.execute(explain_statement(query), params)
+                plan = '\n'.join(row[0] for row in await cursor.fetchall())
+        except psycopg.Error as e:
+            plan = f"EXPLAIN failed: {e}"
+        self._write_slow_query(query, params, elapsed, plan)
+
+    def _write_slow_query(self, query, params, elapsed, plan):
+        with self._lock:
+            query.slow_calls += 1
+        message = f"Slow query {query.name}: {elapsed * 1000:.1f} ms, params {params!r}"
+        slow_query_log.warning(message if plan is None else f"{message}\n{plan}")
+
+    def _forget(self, cursor, query, preparing):
+        # A failed execution left nothing prepared on the connection
+        if preparing:
+            with self._lock:
+                self._prepared.get(cursor.connection, set()).discard(query.name)
+
+    def prepare_connection(self, conn) -> int:
+        """Prepare every query that has warmup parameters on conn; returns how many."""
+        prepared = 0
+        with conn.cursor() as cursor:
+            for query in self:
+                if query.warmup is not None and query.prepare:
+                    self.execute(cursor, query, query.warmup)
+                    prepared += 1
+        return prepared
+
+    def stats(self) -> list:
+        """Counters of every query that ran, most total time first."""
+        with self._lock:
+            stats = [query.stats() for query in self._queries.values() if query.calls]
+        return sorted(stats, key=lambda s: s['total_ms'], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            for query in self._queries.values():
+                query.calls = query.rows = query.prepares = query.slow_calls = 0
+                query.prepare_time = query.execute_time = 0.0
+
+
+registry = QueryRegistry()
+
+register = registry.register
+execute = registry.execute
+execute_async = registry.execute_async
+prepare_connection = registry.prepare_connection
+
+
+def query_stats() -> dict:
+    return {'prepare': prepare_enabled(), 'queries': registry.stats()}
@@ -0,0 +1,277 @@
+"""
+In-process cache of GET responses for read-mostly catalog endpoints.
+
+Cached bodies carry a strong ETag, so clients revalidating with If-None-Match
+get an empty 304 when nothing changed. Entries are tagged with the tables they
+were read from and dropped as soon as Postgres reports a change to one of them:
+statement-level triggers in create_tables.sql NOTIFY the `catalog_changed`
+channel with the table name, and a background thread LISTENs on a dedicated
+connection. While that connection is down the cache is empty and bypassed, so
+it never serves answers it could not invalidate.
+
+Environment variables:
+    RESPONSE_CACHE: "on" (default) or "off"
+    RESPONSE_CACHE_MAX_ENTRIES: Responses kept, least recently used dropped first (default: 256)
+    RESPONSE_CACHE_TTL: Seconds a response is kept at most (default: 300)
+"""
+
+import atexit
+import functools
+import hashlib
+import inspect
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import psycopg
+from flask import Response, current_app, request
+
+from db_pool import get_connection_kwargs
+
+NOTIFY_CHANNEL = 'catalog_changed'
+
+# Seconds between reconnection attempts of the listener
+LISTEN_RETRY_DELAY = 1.0
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def cache_enabled() -> bool:
+    return os.environ.get('RESPONSE_CACHE', 'on').lower() not in ('0', 'off', 'false', 'no')
+
+
+class CachedResponse:
+    """Body and validators of a cached 200 response."""
+
+    def __init__(self, body, mimetype, tables, expires):
+        self.body = body
+        self.mimetype = mimetype
+        self.tables = tables
+        self.expires = expires
+        self.etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+class ResponseCache:
+    """
+    LRU/TTL map from request path to CachedResponse, invalidated per table.
+
+    Every table has a generation counter bumped on invalidation (and an epoch
+    covers all tables at once). A response is only stored if none of its
+    tables changed while it was being computed, so a write committed during
+    the query cannot leave a stale entry behind.
+    """
+
+    def __init__(self, max_entries=256, ttl=300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self._listening = threading.Event()
+        self._stop = threading.Event()
+        self._listener = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def listening(self) -> bool:
+        return self._listening.is_set()
+
+    def wait_listening(self, timeout=None) -> bool:
+        """Block until the listener is connected; False if timeout expired first."""
+        return self._listening.wait(timeout)
+
+    def generations(self, tables):
+        with self._lock:
+            return self._generations_of(tables)
+
+    def _generations_of(self, tables):
+        return (self._epoch, *(self._generations.get(table, 0) for table in tables))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires <= time.monotonic():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, mimetype, tables, generations):
+        """Store a response computed at the given table generations; None if outdated."""
+        with self._lock:
+            if self._generations_of(tables) != generations or not self.listening:
+                return None
+            entry = CachedResponse(body, mimetype, tables, time.monotonic() + self.ttl)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return entry
+
+    def invalidate(self, table=None):
+        """Drop the responses read from table, or every response when table is None."""
+        with self._lock:
+            self.invalidations += 1
+            if table is None:
+                self._epoch += 1
+                self._entries.clear()
+                return
+            self._generations[table] = self._generations.get(table, 0) + 1
+            for key in [key for key, entry in self._entries.items() if table in entry.tables]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'enabled': True,
+                'listening': self.listening,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+            }
+
+    def start_listener(self):
+        if self._listener is None:
+            self._listener = threading.Thread(
+                target=self._listen, name='response-cache-listener', daemon=True
+            )
+            self._listener.start()
+
+    def stop_listener(self):
+        self._stop.set()
+        if self._listener is not None:
+            self._listener.join()
+            self._listener = None
+
+    def _listen(self):
+        while not self._stop.is_set():
+            try:
+                with psycopg.connect(**get_connection_kwargs(), autocommit=True) as conn:
+                    conn.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                    # Whatever was cached before LISTEN took effect may be stale
+                    self.invalidate()
+                    self._listening.set()
+                    logging.info(f"Response cache listening on {NOTIFY_CHANNEL}")
+                    while not self._stop.is_set():
+                        for notify in conn.notifies(timeout=1.0):
+                            self.invalidate(notify.payload or None)
+            except psycopg.Error as e:
+                logging.warning(f"Response cache listener disconnected: {e}")
+            finally:
+                self._listening.clear()
+                self.invalidate()
+            self._stop.wait(LISTEN_RETRY_DELAY)
+
+
+def get_response_cache() -> ResponseCache | None:
+    """Return the shared cache, starting its listener on first use. None when caching is off."""
+    global _cache
+    if not cache_enabled():
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(
+                    max_entries=int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', '256')),
+                    ttl=float(os.environ.get('RESPONSE_CACHE_TTL', '300')),
+                )
+                _cache.start_listener()
+                atexit.register(_cache.stop_listener)
+    return _cache
+
+
+def close_response_cache():
+    """Stop the listener and drop the shared cache; the next use starts a new one."""
+    global _cache
+    with _cache_lock:
+        if _cache is not None:
+            _cache.stop_listener()
+            _cache = None
+
+
+def cache_stats() -> dict:
+    cache = _cache
+    if not cache_enabled() or cache is None:
+        return {'enabled': cache_enabled(), 'listening': False}
+    return cache.stats()
+
+
+def _respond(entry, request, response_class):
+    """200 with the cached body, or 304 if the client already has it."""
+    if request.if_none_match.contains_weak(entry.etag):
+        response = response_class(status=304)
+    else:
+        response = response_class(entry.body, status=200, mimetype=entry.mimetype)
+    response.set_etag(entry.etag)
+    # Clients may keep the body but must revalidate before using it
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def cached_response(*tables):
+    """
+    Cache the 200 responses of a GET view, keyed by path and query string.
+
+    tables lists every table the view reads; a change to any of them drops
+    the response. Streamed responses are passed through uncached. Coroutine
+    views are taken to be Quart views (asgi_app.py).
+    """
+    def decorator(view):
+        if inspect.iscoroutinefunction(view):
+            return _async_wrapper(view, tables)
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = get_response_cache()
+            if cache is None or not cache.listening:
+                return view(*args, **kwargs)
+
+            key = request.full_path
+            entry = cache.get(key)
+            if entry is None:
+                generations = cache.generations(tables)
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                entry = cache.put(key, response.get_data(), response.mimetype, tables, generations)
+                if entry is None:
+                    return response
+            return _respond(entry, request, Response)
+        return wrapper
+    return decorator
+
+
+def _async_wrapper(view, tables):
+    from quart import Response as QuartResponse, current_app as quart_app, request as quart_request
+    from quart.wrappers.response import DataBody
+
+    @functools.wraps(view)
+    async def wrapper(*args, **kwargs):
+        cache = get_response_cache()
+        if cache is None or not cache.listening:
+            return await view(*args, **kwargs)
+
+        key = quart_request.full_path
+        entry = cache.get(key)
+        if entry is None:
+            generations = cache.generations(tables)
+            response = await quart_app.make_response(await view(*args, **kwargs))
+            if response.status_code != 200 or not isinstance(response.response, DataBody):
+                return response
+            body = await response.get_data()
+            entry = cache.put(key, body, response.mimetype, tables, generations)
+            if entry is None:
+                return response
+        return _respond(entry, quart_request, QuartResponse)
+    return wrapper
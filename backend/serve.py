@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Production launcher for the backend (app.py) on Gunicorn.
+
+The master process imports app.py once (pre-fork loading), creates the
+order partitions of the coming months (app.create_order_partitions()) and forks
+WEB_WORKERS worker processes serving WEB_THREADS requests each. No pooled
+connection is opened in the master: every worker builds its own connection
+pool and response cache listener after the fork, then warms up before it
+accepts traffic:
+
+    - the pool opens its DB_POOL_MIN_SIZE connections,
+    - the registered read queries are prepared on each of them,
+    - the WEB_WARMUP_PATHS are requested once, which fills the response cache.
+
+On Windows, where Gunicorn does not run, the app is warmed up the same way
+and served by Flask's threaded server.
+
+    python serve.py
+    python serve.py --workers 8 --threads 4 --bind 0.0.0.0:8000
+
+Environment variables:
+    WEB_BIND: Address to listen on (default: 127.0.0.1:5000)
+    WEB_WORKERS: Worker processes (default: number of CPUs, at most 4)
+    WEB_THREADS: Threads per worker (default: 8)
+    WEB_TIMEOUT: Seconds before a silent worker is restarted (default: 30)
+    WEB_WARMUP: "on" (default) or "off"
+    WEB_WARMUP_PATHS: Comma-separated GET paths requested during warmup
+        (default: /statuses,/categories,/authors,/books?limit=100)
+    LOG_LEVEL: Logging level of the app and server (default: info)
+"""
+
+import argparse
+import logging
+import os
+import time
+from contextlib import ExitStack
+
+import psycopg
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    # Gunicorn is POSIX only
+    BaseApplication = None
+
+import app as app_module
+import db_pool
+from query_registry import prepare_connection
+from response_cache import get_response_cache
+
+DEFAULT_WARMUP_PATHS = '/statuses,/categories,/authors,/books?limit=100'
+
+# Seconds a worker waits for the response cache listener before warming up without it
+WARMUP_LISTEN_TIMEOUT = 5.0
+
+
+def warmup_enabled() -> bool:
+    return os.environ.get('WEB_WARMUP', 'on').lower() not in ('0', 'off', 'false', 'no')
+
+
+def prepare_statements(pool):
+    """Prepare the registered queries on every connection the pool keeps open."""
+    prepared = 0
+    with ExitStack() as stack:
+        # Hold min_size connections at once so each one gets the statements
+        for _ in range(pool.min_size):
+            prepared = prepare_connection(stack.enter_context(pool.connection()))
+    return prepared
+
+
+def warmup():
+    """Open the pool, prepare statements and prime the response cache."""
+    started = time.perf_counter()
+    pool = db_pool.get_pool()
+    if pool is not None:
+        try:
+            pool.wait(timeout=pool.timeout)
+            prepared = prepare_statements(pool)
+            logging.info(f"Prepared {prepared} statements on {pool.min_size} pooled connections")
+        except psycopg.Error as e:
+            # Serve anyway; requests fail until the database is back
+            logging.warning(f"Warmup could not reach the database: {e}")
+            return
+
+    cache = get_response_cache()
+    if cache is not None and not cache.wait_listening(WARMUP_LISTEN_TIMEOUT):
+        logging.warning("Response cache listener not connected; warming up without cache")
+
+    client = app_module.app.test_client()
+    paths = [p.strip() for p in os.environ.get('WEB_WARMUP_PATHS', DEFAULT_WARMUP_PATHS).split(',')]
+    for path in filter(None, paths):
+        response = client.get(path)
+        if response.status_code != 200:
+            logging.warning(f"Warmup request {path} returned {response.status_code}")
+    logging.info(f"Warmup finished in {time.perf_counter() - started:.2f}s")
+
+
+def post_worker_init(worker):
+    # Runs in the worker after the fork, before it accepts connections. The
+    # master never opens the pool: connections and the pool's threads would
+    # not survive the fork.
+    if warmup_enabled():
+        warmup()
+    else:
+        db_pool.get_pool()
+
+
+def gunicorn_options(args) -> dict:
+    return {
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread',
+        'timeout': args.timeout,
+        'preload_app': True,
+        'loglevel': args.log_level,
+        'accesslog': '-' if args.log_level == 'debug' else None,
+        'post_worker_init': post_worker_init,
+    }
+
+
+if BaseApplication is not None:
+    class BackendApplication(BaseApplication):
+        """Gunicorn application serving app.py with options set from Python."""
+
+        def __init__(self, application, options):
+            self.application = application
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the backend with several workers.")
+    parser.add_argument('--bind', default=os.environ.get('WEB_BIND', '127.0.0.1:5000'))
+    parser.add_argument('--workers', type=int,
+                        default=int(os.environ.get('WEB_WORKERS', min(4, os.cpu_count() or 1))))
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('WEB_THREADS', '8')))
+    parser.add_argument('--timeout', type=int, default=int(os.environ.get('WEB_TIMEOUT', '30')))
+    parser.add_argument('--log-level', default=os.environ.get('LOG_LEVEL', 'info').lower(),
+                        choices=['debug', 'info', 'warning', 'error', 'critical'])
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # app.py logs at DEBUG for the development server
+    logging.getLogger().setLevel(args.log_level.upper())
+    app_module.create_order_partitions()
+
+    if BaseApplication is None:
+        logging.warning("Gunicorn is not available; serving with Flask's threaded server")
+        if warmup_enabled():
+            warmup()
+        host, _, port = args.bind.rpartition(':')
+        app_module.app.run(host=host or '127.0.0.1', port=int(port), threaded=True)
+        return
+
+    logging.info(f"Serving on {args.bind} with {args.workers} workers x {args.threads} threads")
+    BackendApplication(app_module.app, gunicorn_options(args)).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+Tests for the asyncio backend (asgi_app.py).
+Every route must answer exactly like its Flask counterpart in app.py.
+"""
+
+import asyncio
+import os
+import sys
+import pytest
+from pathlib import Path
+
+# Add db directory to path so we can import db_loader
+DB_DIR = Path(__file__).resolve().parent.parent.parent / "db"
+sys.path.insert(0, str(DB_DIR))
+
+# For CI compatibility: Map DATABASE_* vars (used in CI) to DB_* vars
+# This must happen BEFORE loading .env so env vars take precedence
+for ci_var, db_var in [("DATABASE_HOST", "DB_HOST"), ("DATABASE_PORT", "DB_PORT"),
+                        ("DATABASE_NAME", "DB_NAME"), ("DATABASE_USER", "DB_USER"),
+                        ("DATABASE_PASSWORD", "DB_PASSWORD")]:
+    if os.environ.get(ci_var):
+        os.environ[db_var] = os.environ[ci_var]
+
+# Load environment variables from .env file (won't override vars already set above)
+from db_loader import load_env, get_db_connection, setup_database
+load_env()
+
+from app import app as flask_app
+from asgi_app import app as asgi_app
+import db_pool
+
+
+@pytest.fixture(scope="module")
+def db_setup():
+    """Module-scoped fixture that resets the schema and example data."""
+    setup_database(snapshot=True)
+
+
+@pytest.fixture(scope="module")
+def sample(db_setup):
+    """An ISBN with reviews and categories, and a user with reviews."""
+    with get_db_connection() as conn:
+        isbn = conn.execute("""
+            SELECT isbn FROM reviews JOIN book_categories USING (isbn)
+            ORDER BY isbn LIMIT 1
+        """).fetchone()[0]
+        user_id = conn.execute("SELECT user_id FROM reviews ORDER BY user_id LIMIT 1").fetchone()[0]
+    return {"isbn": isbn, "user_id": user_id}
+
+
+def asgi_request(method, path, **kwargs):
+    """Response (status, body) of asgi_app, on a fresh event loop and async pool."""
+    async def send():
+        try:
+            response = await asgi_app.test_client().open(path, method=method, **kwargs)
+            return response.status_code, await response.get_data()
+        finally:
+            await db_pool.close_async_pool()
+    return asyncio.run(send())
+
+
+def flask_request(method, path, **kwargs):
+    response = flask_app.test_client().open(path, method=method, **kwargs)
+    return response.status_code, response.get_data()
+
+
+class TestSameOutput:
+    """The ASGI app answers byte for byte like the Flask app."""
+
+    @pytest.mark.parametrize("path", [
+        "/books?limit=5",
+        "/books?format=ndjson",
+        "/books/search?q=data",
+        "/books/{isbn}",
+        "/books/{isbn}/full",
+        "/books/{isbn}/authors",
+        "/books/{isbn}/categories",
+        "/books/{isbn}/reviews",
+        "/books/bestsellers?limit=5",
+        "/price/{isbn}",
+        "/prices?isbn={isbn}&at=2010-06-01",
+        "/users",
+        "/users/{user_id}",
+        "/users/{user_id}/full",
+        "/users/{user_id}/addresses",
+        "/users/{user_id}/reviews",
+        "/user_order_summary",
+        "/user_order_summary?limit=3&status=1&user_id={user_id}",
+        "/orders/1",
+        "/orders/1?order_time=2025-12-01T00:00:00",
+        "/orders/1?order_time=yesterday",
+        "/statuses",
+        "/categories",
+        "/offers",
+        "/inventory?low_stock=true",
+        "/inventory/reorder-queue?limit=5",
+        "/users/999999",
+        "/books/search?q=a",
+        "/books?limit=0&cursor=not-a-cursor",
+        "/books?limit=abc",
+    ])
+    def test_get(self, sample, path):
+        """Test that a GET gets the same status and body from both apps."""
+        path = path.format(**sample)
+        assert asgi_request("GET", path) == flask_request("GET", path)
+
+    def test_invalid_order_batch(self, db_setup):
+        """Test that an invalid /create_orders batch is rejected with the same response by both apps."""
+        body = {"orders": []}
+        assert asgi_request("POST", "/create_orders", json=body) == \
+            flask_request("POST", "/create_orders", json=body)
+
+
+class TestAsyncPool:
+    """Tests for db_pool.async_db_connection()."""
+
+    def test_many_requests_in_flight(self, db_setup, monkeypatch):
+        """Test that more concurrent requests than pooled connections all complete."""
+        monkeypatch.setenv("DB_POOL_MAX_SIZE", "4")
+
+        async def run():
+            client = asgi_app.test_client()
+            try:
+                responses = await asyncio.gather(*[
+                    client.get(f"/books/search?q=data&limit={n % 10 + 1}") for n in range(100)
+                ])
+                return [r.status_code for r in responses], db_pool.async_pool_stats()
+            finally:
+                await db_pool.close_async_pool()
+
+        statuses, stats = asyncio.run(run())
+        assert statuses == [200] * 100
+        assert stats["pool_max"] == 4
+        assert stats["requests_num"] >= 100
+
+    def test_pool_can_be_disabled(self, db_setup, monkeypatch):
+        """Test that DB_POOL=off opens an AsyncConnection per request."""
+        monkeypatch.setenv("DB_POOL", "off")
+        assert asgi_request("GET", "/statuses") == flask_request("GET", "/statuses")
@@ -3,10 +3,15 @@ Database integration tests.
 These tests verify that the app can connect to PostgreSQL and perform CRUD operations.
 """
 
+import json
 import os
 import sys
+import threading
+import time
 import pytest
+import psycopg
 from psycopg.rows import dict_row
+from datetime import timedelta
 from pathlib import Path
 
 # Add db directory to path so we can import db_loader
@@ -22,11 +27,17 @@ for ci_var, db_var in [("DATABASE_HOST", "DB_HOST"), ("DATABASE_PORT", "DB_PORT"
         os.environ[db_var] = os.environ[ci_var]
 
 # Load environment variables from .env file (won't override vars already set above)
-from db_loader import load_env
+from db_loader import load_env, setup_database
 load_env()
 
 # Import the actual app code we're testing
 from app import get_db_connection, app
+import app as app_module
+import db_pool
+import metrics
+import query_registry
+import response_cache
+import serve
 
 
 @pytest.fixture
@@ -46,6 +57,12 @@ def db_cursor(db_connection):
     cursor.close()
 
 
+@pytest.fixture(scope="module")
+def db_setup():
+    """Module-scoped fixture that resets the schema and example data for route tests."""
+    setup_database(snapshot=True)
+
+
 @pytest.fixture
 def client():
     """Fixture that provides a Flask test client."""
@@ -73,3 +90,820 @@ class TestDatabaseConnection:
         db_cursor.execute("SELECT version()")
         result = db_cursor.fetchone()
         assert "PostgreSQL" in result["version"]
+
+
+class TestConnectionPool:
+    """Tests for the shared connection pool used by the routes."""
+
+    def test_pooled_connection_executes_query(self):
+        """Test that a connection borrowed from the pool can run queries."""
+        with db_pool.db_connection() as conn:
+            assert conn.execute("SELECT 1").fetchone()[0] == 1
+
+    def test_pool_stats_endpoint(self, client):
+        """Test that /pool/stats reports the pool configuration and usage."""
+        with db_pool.db_connection() as conn:
+            conn.execute("SELECT 1")
+
+        response = client.get('/pool/stats')
+        assert response.status_code == 200
+        stats = response.get_json()
+        assert stats["enabled"] is True
+        assert stats["open"] is True
+        assert stats["min_size"] <= stats["max_size"]
+        assert stats["requests_num"] >= 1
+
+    def test_pool_can_be_disabled(self, monkeypatch):
+        """Test that DB_POOL=off falls back to a connection per request."""
+        monkeypatch.setenv("DB_POOL", "off")
+        with db_pool.db_connection() as conn:
+            assert conn.execute("SELECT 1").fetchone()[0] == 1
+        assert db_pool.pool_stats() == {"enabled": False, "open": False}
+
+
+class TestBooksListing:
+    """Tests for the paginated and streamed /books endpoint."""
+
+    def test_pages_follow_each_other(self, db_setup, client):
+        """Test that the cursor of one page continues exactly after its last book."""
+        first = client.get('/books?limit=50').get_json()
+        assert len(first["items"]) == 50
+        assert first["next_cursor"] is not None
+
+        second = client.get(f'/books?limit=50&cursor={first["next_cursor"]}').get_json()
+        assert len(second["items"]) == 50
+        last, following = first["items"][-1], second["items"][0]
+        assert (last["title"], last["isbn"]) < (following["title"], following["isbn"])
+
+        first_isbns = {book["isbn"] for book in first["items"]}
+        assert first_isbns.isdisjoint(book["isbn"] for book in second["items"])
+
+    def test_paging_and_streaming_return_whole_catalog(self, db_setup, client, db_cursor):
+        """Test that walking all pages, the JSON stream and NDJSON stream agree."""
+        db_cursor.execute("SELECT COUNT(*) AS count FROM books")
+        total = db_cursor.fetchone()["count"]
+
+        paged = []
+        url = '/books?limit=1000'
+        while True:
+            page = client.get(url).get_json()
+            paged.extend(book["isbn"] for book in page["items"])
+            if page["next_cursor"] is None:
+                break
+            url = f'/books?limit=1000&cursor={page["next_cursor"]}'
+
+        streamed = client.get('/books').get_json()
+        ndjson = client.get('/books?format=ndjson').get_data(as_text=True).splitlines()
+
+        assert len(paged) == total
+        assert [book["isbn"] for book in streamed] == paged
+        assert len(ndjson) == total
+        assert json.loads(ndjson[0]) == streamed[0]
+
+    def test_invalid_cursor_is_rejected(self, db_setup, client):
+        """Test that a malformed cursor results in 400 instead of a server error."""
+        response = client.get('/books?limit=10&cursor=not-a-cursor')
+        assert response.status_code == 400
+
+    def test_invalid_limit_is_rejected(self, db_setup, client):
+        """Test that a zero, out of range or non-integer limit results in 400 instead of a page or the stream."""
+        for limit in ('0', '-1', '5000', 'abc', ''):
+            assert client.get(f'/books?limit={limit}').status_code == 400
+
+
+class TestOrderListing:
+    """Tests for the paginated and filtered /user_order_summary endpoint."""
+
+    def test_pages_cover_all_orders(self, db_setup, client):
+        """Test that walking the pages returns the same orders as the full listing."""
+        expected = [order["order_id"] for order in client.get('/user_order_summary').get_json()]
+
+        paged = []
+        url = '/user_order_summary?limit=7'
+        while True:
+            page = client.get(url).get_json()
+            assert len(page["items"]) <= 7
+            assert page["estimated_total"] >= len(page["items"])
+            paged.extend(order["order_id"] for order in page["items"])
+            if page["next_cursor"] is None:
+                break
+            url = f'/user_order_summary?limit=7&cursor={page["next_cursor"]}'
+
+        assert paged == expected
+
+    def test_filters(self, db_setup, client, db_cursor):
+        """Test that status, user and order_time filters match the view."""
+        db_cursor.execute("SELECT * FROM user_order_summary ORDER BY order_id DESC LIMIT 1")
+        order = db_cursor.fetchone()
+        db_cursor.execute(
+            """SELECT order_id FROM user_order_summary
+               WHERE status_name = %s AND user_id = %s AND order_time >= %s
+               ORDER BY order_id DESC""",
+            (order["status_name"], order["user_id"], order["order_time"]),
+        )
+        expected = [row["order_id"] for row in db_cursor.fetchall()]
+
+        page = client.get('/user_order_summary', query_string={
+            'status': order["status_name"],
+            'user_id': order["user_id"],
+            'from': order["order_time"].isoformat(),
+        }).get_json()
+        assert [item["order_id"] for item in page["items"]] == expected
+        assert page["estimated_total"] == len(expected)
+
+        page = client.get('/user_order_summary', query_string={
+            'user_id': order["user_id"], 'to': order["order_time"].isoformat(),
+        }).get_json()
+        assert order["order_id"] not in [item["order_id"] for item in page["items"]]
+
+    def test_invalid_parameters_are_rejected(self, db_setup, client):
+        """Test that malformed filters and cursors result in 400."""
+        for query in ('limit=5000', 'limit=0', 'limit=abc', 'cursor=not-a-cursor', 'user_id=abc', 'from=yesterday'):
+            assert client.get(f'/user_order_summary?{query}').status_code == 400
+
+    def test_order_detail_by_listed_time(self, db_setup, client):
+        """Test that /orders/<id> with the listed order_time returns the same order and items as without it."""
+        order = client.get('/user_order_summary?limit=1').get_json()["items"][0]
+        expected = client.get(f'/orders/{order["order_id"]}').get_json()
+        assert expected["items"]
+
+        response = client.get(f'/orders/{order["order_id"]}', query_string={'order_time': order["order_time"]})
+        assert response.get_json() == expected
+        response = client.get(f'/orders/{order["order_id"]}', query_string={'order_time': '2000-01-01T00:00:00'})
+        assert response.get_json() is None
+        assert client.get(f'/orders/{order["order_id"]}?order_time=yesterday').status_code == 400
+
+
+class TestPrices:
+    """Tests for the batch /prices endpoint."""
+
+    def test_current_prices(self, db_setup, client, db_cursor):
+        """Test that without ?at every ISBN gets its current price."""
+        db_cursor.execute("""
+            SELECT isbn, price_id FROM prices WHERE valid_until IS NULL ORDER BY isbn LIMIT 3
+        """)
+        expected = db_cursor.fetchall()
+        isbns = ','.join(row["isbn"] for row in expected)
+        prices = client.get(f'/prices?isbn={isbns}&isbn=0000000000').get_json()
+        assert [(p["isbn"], p["price_id"]) for p in prices] == \
+            [(row["isbn"], row["price_id"]) for row in expected]
+
+    def test_prices_at_a_point_in_time(self, db_setup, client, db_cursor):
+        """Test that ?at resolves the period containing it, with valid_until exclusive."""
+        db_cursor.execute("""
+            SELECT isbn, price_id, valid_until FROM prices
+            WHERE valid_until IS NOT NULL ORDER BY isbn, valid_from LIMIT 1
+        """)
+        closed = db_cursor.fetchone()
+        db_cursor.execute("""
+            SELECT price_id FROM prices WHERE isbn = %s AND valid_from = %s
+        """, (closed["isbn"], closed["valid_until"]))
+        following = db_cursor.fetchone()
+
+        def price_at(at):
+            prices = client.get('/prices', query_string={'isbn': closed["isbn"], 'at': at}).get_json()
+            return [p["price_id"] for p in prices]
+
+        before_end = closed["valid_until"] - timedelta(seconds=1)
+        assert price_at(before_end.isoformat()) == [closed["price_id"]]
+        assert price_at(closed["valid_until"].isoformat()) == [following["price_id"]]
+        assert price_at('1900-01-01') == []
+
+    def test_invalid_parameters_are_rejected(self, db_setup, client):
+        """Test that a missing isbn or malformed ?at results in 400."""
+        assert client.get('/prices').status_code == 400
+        assert client.get('/prices?isbn=9780534391140&at=yesterday').status_code == 400
+
+
+class TestInventory:
+    """Tests for the low stock filter of /inventory and the reorder queue."""
+
+    def test_low_stock_filter(self, db_setup, client, db_cursor):
+        """Test that ?low_stock=true returns the rows at or below their threshold, fewest available first."""
+        db_cursor.execute("""
+            SELECT inventory_id FROM inventory
+            WHERE quantity - quantity_reserved <= reorder_threshold
+            ORDER BY quantity - quantity_reserved, inventory_id
+        """)
+        expected = [row["inventory_id"] for row in db_cursor.fetchall()]
+        assert len(expected) > 0
+
+        items = client.get('/inventory?low_stock=true').get_json()
+        assert [item["inventory_id"] for item in items] == expected
+        assert all(item["available"] == item["quantity"] - item["quantity_reserved"] for item in items)
+
+        db_cursor.execute("SELECT COUNT(*) AS count FROM inventory")
+        assert len(client.get('/inventory?low_stock=false').get_json()) == db_cursor.fetchone()["count"]
+
+    def test_reorder_queue_pages_cover_low_stock(self, db_setup, client):
+        """Test that walking the reorder queue returns the low stock rows in order, with titles."""
+        expected = [item["inventory_id"] for item in client.get('/inventory?low_stock=true').get_json()]
+
+        paged = []
+        url = '/inventory/reorder-queue?limit=7'
+        while True:
+            page = client.get(url).get_json()
+            assert len(page["items"]) <= 7
+            assert all(item["title"] for item in page["items"])
+            paged.extend(item["inventory_id"] for item in page["items"])
+            if page["next_cursor"] is None:
+                break
+            url = f'/inventory/reorder-queue?limit=7&cursor={page["next_cursor"]}'
+
+        assert paged == expected
+
+    def test_invalid_parameters_are_rejected(self, db_setup, client):
+        """Test that a malformed flag, limit or cursor results in 400."""
+        assert client.get('/inventory?low_stock=maybe').status_code == 400
+        for query in ('limit=5000', 'limit=0', 'limit=abc', 'cursor=not-a-cursor'):
+            assert client.get(f'/inventory/reorder-queue?{query}').status_code == 400
+
+
+class TestBookSearch:
+    """Tests for the server-side /books/search endpoint."""
+
+    def test_isbn_prefix_ranks_first(self, db_setup, client):
+        """Test that an ISBN prefix returns the matching books before anything else."""
+        results = client.get('/books/search?q=978-0534391').get_json()
+        assert "9780534391140" in [book["isbn"] for book in results]
+        assert all(book["isbn"].startswith("9780534391") for book in results)
+
+    def test_title_words_are_highlighted(self, db_setup, client):
+        """Test that partially typed title words match and are wrapped in <mark>."""
+        results = client.get('/books/search?q=datab').get_json()
+        assert len(results) > 0
+        assert "<mark>" in results[0]["title_highlight"]
+        assert "datab" in results[0]["title"].lower()
+
+    def test_author_name_matches(self, db_setup, client):
+        """Test that books can be found by their author's surname."""
+        results = client.get('/books/search?q=Forouzan').get_json()
+        isbns = [book["isbn"] for book in results]
+        assert "9780534391140" in isbns
+        match = results[isbns.index("9780534391140")]
+        assert "<mark>Forouzan</mark>" in match["authors_highlight"]
+
+    def test_typo_falls_back_to_trigram_match(self, db_setup, client):
+        """Test that a misspelled title still finds similar titles."""
+        results = client.get('/books/search?q=Databse').get_json()
+        assert any(book["title"] == "Database" for book in results)
+
+    def test_limit_is_respected(self, db_setup, client):
+        """Test that at most ?limit results are returned, best score first."""
+        results = client.get('/books/search?q=data&limit=5').get_json()
+        assert len(results) == 5
+        scores = [book["score"] for book in results]
+        assert scores == sorted(scores, reverse=True)
+
+    def test_query_too_short(self, db_setup, client):
+        """Test that one-character queries are rejected."""
+        assert client.get('/books/search?q=a').status_code == 400
+
+
+class TestBookDetail:
+    """Tests for /books/<isbn>."""
+
+    def test_rating_comes_from_summary(self, db_setup, client, db_cursor):
+        """Test that the book summary reports average stars and review count."""
+        db_cursor.execute("""
+            SELECT isbn, AVG(stars)::NUMERIC(3, 2) AS stars, COUNT(*) AS review_count
+            FROM reviews GROUP BY isbn LIMIT 1
+        """)
+        expected = db_cursor.fetchone()
+
+        book = client.get(f'/books/{expected["isbn"]}').get_json()[0]
+        assert float(book["stars"]) == float(expected["stars"])
+        assert book["review_count"] == expected["review_count"]
+
+    def test_full_matches_separate_endpoints(self, db_setup, client, db_cursor):
+        """Test that /books/<isbn>/full combines what four calls used to return."""
+        db_cursor.execute("""
+            SELECT isbn FROM reviews JOIN book_categories USING (isbn)
+            ORDER BY isbn LIMIT 1
+        """)
+        isbn = db_cursor.fetchone()["isbn"]
+
+        response = client.get(f'/books/{isbn}/full')
+        assert response.status_code == 200
+        book = response.get_json()
+        summary = client.get(f'/books/{isbn}').get_json()[0]
+        for field in ["title", "publication_year", "price_id", "quantity", "review_count"]:
+            assert book[field] == summary[field]
+
+        def ids(items, key):
+            return [item[key] for item in items]
+        assert sorted(ids(book["authors"], "author_id")) == \
+            sorted(ids(client.get(f'/books/{isbn}/authors').get_json(), "author_id"))
+        assert sorted(ids(book["categories"], "category_id")) == \
+            sorted(ids(client.get(f'/books/{isbn}/categories').get_json(), "category_id"))
+        assert ids(book["prices"], "price_id") == ids(client.get(f'/price/{isbn}').get_json(), "price_id")
+        reviews = client.get(f'/books/{isbn}/reviews').get_json()
+        assert len(book["reviews"]) == len(reviews) > 0
+        assert {r["review_id"] for r in book["reviews"]} == {r["review_id"] for r in reviews}
+        assert all("name" in r and "surname" in r for r in book["reviews"])
+
+    def test_full_unknown_book(self, db_setup, client):
+        assert client.get('/books/0000000000000/full').status_code == 404
+
+
+class TestUserDetail:
+    """Tests for /users/<id>/full."""
+
+    def test_full_matches_separate_endpoints(self, db_setup, client, db_cursor):
+        """Test that one call returns the user with addresses and reviews."""
+        db_cursor.execute("SELECT user_id FROM reviews ORDER BY user_id LIMIT 1")
+        user_id = db_cursor.fetchone()["user_id"]
+
+        response = client.get(f'/users/{user_id}/full')
+        assert response.status_code == 200
+        user = response.get_json()
+        assert {k: v for k, v in user.items() if k not in ("addresses", "reviews")} == \
+            client.get(f'/users/{user_id}').get_json()
+
+        addresses = client.get(f'/users/{user_id}/addresses').get_json()
+        assert [a["address_id"] for a in user["addresses"]] == [a["address_id"] for a in addresses]
+        reviews = client.get(f'/users/{user_id}/reviews').get_json()
+        assert [r["review_id"] for r in user["reviews"]] == [r["review_id"] for r in reviews]
+        assert [r["authors"] for r in user["reviews"]] == [r["authors"] for r in reviews]
+        assert [r["title"] for r in user["reviews"]] == [r["title"] for r in reviews]
+
+    def test_full_unknown_user(self, db_setup, client):
+        assert client.get('/users/999999/full').status_code == 404
+
+
+class TestBestsellers:
+    """Tests for /books/bestsellers."""
+
+    def test_full_listing_matches_order_items(self, db_setup, client, db_cursor):
+        """Test that the listing covers every book and agrees with the raw order items."""
+        db_cursor.execute("""
+            SELECT p.isbn, SUM(oi.quantity) AS sold
+            FROM order_items oi JOIN prices p USING (price_id)
+            GROUP BY p.isbn
+        """)
+        expected = {row["isbn"]: row["sold"] for row in db_cursor.fetchall()}
+        db_cursor.execute("SELECT COUNT(*) AS count FROM books")
+        book_count = db_cursor.fetchone()["count"]
+
+        books = client.get('/books/bestsellers').get_json()
+        assert len(books) == book_count
+        sold = [book["sold_copies"] for book in books]
+        assert sold == sorted(sold, reverse=True)
+        assert {b["isbn"]: b["sold_copies"] for b in books if b["sold_copies"]} == expected
+
+    def test_top_n(self, db_setup, client):
+        """Test that ?limit returns only the best selling books."""
+        full = client.get('/books/bestsellers').get_json()
+        top = client.get('/books/bestsellers?limit=3').get_json()
+        assert top == full[:3]
+
+    def test_category_filter(self, db_setup, client, db_cursor):
+        """Test that ?category keeps only books of that category."""
+        books = client.get('/books/bestsellers?limit=50&category=databases').get_json()
+        assert len(books) > 0
+        db_cursor.execute("""
+            SELECT isbn FROM book_categories JOIN categories USING (category_id)
+            WHERE category_name = 'databases'
+        """)
+        database_isbns = {row["isbn"] for row in db_cursor.fetchall()}
+        assert all(book["isbn"] in database_isbns for book in books)
+
+    def test_time_window(self, db_setup, client, db_cursor):
+        """Test that ?days only counts orders placed within the window."""
+        db_cursor.execute("SELECT (CURRENT_DATE - MIN(order_time)::DATE) + 1 AS days FROM orders")
+        all_days = db_cursor.fetchone()["days"]
+
+        assert client.get(f'/books/bestsellers?limit=5&days={all_days}').get_json() == \
+            client.get('/books/bestsellers?limit=5').get_json()
+        assert client.get('/books/bestsellers?limit=5&days=1').status_code == 200
+        assert client.get('/books/bestsellers?days=0').status_code == 400
+
+
+class TestCreateOrders:
+    """Tests for /create_order and the bulk /create_orders endpoint."""
+
+    def reserved(self, db_cursor, isbn):
+        db_cursor.execute("SELECT quantity_reserved FROM inventory WHERE isbn = %s", (isbn,))
+        return db_cursor.fetchone()["quantity_reserved"]
+
+    def in_stock_isbns(self, db_cursor, count):
+        db_cursor.execute("""
+            SELECT isbn FROM inventory
+            WHERE quantity - quantity_reserved >= 10
+            ORDER BY isbn LIMIT %s
+        """, (count,))
+        return [row["isbn"] for row in db_cursor.fetchall()]
+
+    def test_bulk_create_orders(self, db_setup, client, db_connection, db_cursor):
+        """Test that many orders are created in one call, in request order."""
+        first, second = self.in_stock_isbns(db_cursor, 2)
+        reserved_before = self.reserved(db_cursor, first)
+        db_connection.rollback()
+
+        response = client.post('/create_orders', json={"orders": [
+            {"shipping_address_id": 1, "billing_address_id": 1,
+             "items": [{"isbn": first, "quantity": 1}, {"isbn": second, "quantity": 2}]},
+            {"shipping_address_id": 3, "billing_address_id": 3,
+             "items": [{"isbn": first, "quantity": 2}]},
+        ]})
+        assert response.status_code == 201
+        results = response.get_json()
+        assert [r["success"] for r in results] == [True, True]
+        assert results[0]["order_id"] < results[1]["order_id"]
+
+        assert self.reserved(db_cursor, first) == reserved_before + 3
+        db_cursor.execute("""
+            SELECT COUNT(*) AS count FROM order_items WHERE order_id = %s
+        """, (results[0]["order_id"],))
+        assert db_cursor.fetchone()["count"] == 2
+
+    def test_bulk_create_orders_is_all_or_nothing(self, db_setup, client, db_connection, db_cursor):
+        """Test that one failing order rolls back the whole batch."""
+        (isbn,) = self.in_stock_isbns(db_cursor, 1)
+        reserved_before = self.reserved(db_cursor, isbn)
+        db_connection.rollback()
+
+        response = client.post('/create_orders', json={"orders": [
+            {"shipping_address_id": 1, "billing_address_id": 1,
+             "items": [{"isbn": isbn, "quantity": 1}]},
+            {"shipping_address_id": 1, "billing_address_id": 1,
+             "items": [{"isbn": isbn, "quantity": 1000000}]},
+        ]})
+        assert response.status_code == 500
+        assert "Insufficient stock" in response.get_json()["error"]
+        assert self.reserved(db_cursor, isbn) == reserved_before
+
+    def test_repeated_isbn_is_combined(self, db_setup, client, db_connection, db_cursor):
+        """Test that the same ISBN listed twice becomes one order item."""
+        (isbn,) = self.in_stock_isbns(db_cursor, 1)
+        reserved_before = self.reserved(db_cursor, isbn)
+        db_connection.rollback()
+
+        response = client.post('/create_order', json={
+            "shipping_address_id": 1, "billing_address_id": 1,
+            "items": [{"isbn": isbn, "quantity": 1}, {"isbn": isbn, "quantity": 2}],
+        })
+        assert response.status_code == 201
+        order_id = response.get_json()["order_id"]
+
+        db_cursor.execute("SELECT quantity FROM order_items WHERE order_id = %s", (order_id,))
+        assert [row["quantity"] for row in db_cursor.fetchall()] == [3]
+        assert self.reserved(db_cursor, isbn) == reserved_before + 3
+
+    def test_invalid_items_are_rejected(self, db_setup, client):
+        """Test the error messages for unknown books and non-positive quantities."""
+        response = client.post('/create_order', json={
+            "shipping_address_id": 1, "billing_address_id": 1,
+            "items": [{"isbn": "0000000000", "quantity": 1}],
+        })
+        assert "Book 0000000000 not found or price missing." in response.get_json()["error"]
+
+        response = client.post('/create_order', json={
+            "shipping_address_id": 1, "billing_address_id": 1,
+            "items": [{"isbn": "9780534391140", "quantity": 0}],
+        })
+        assert "Quantity must be positive for ISBN 9780534391140" in response.get_json()["error"]
+
+    def test_bulk_requires_orders(self, db_setup, client):
+        """Test that an empty batch is a bad request."""
+        assert client.post('/create_orders', json={"orders": []}).status_code == 400
+
+
+class TestOrderLockRetry:
+    """Tests for the lock-mode and retry policy of /create_order."""
+
+    @pytest.fixture
+    def nowait_policy(self, monkeypatch):
+        monkeypatch.setenv("ORDER_LOCK_MODE", "nowait")
+        monkeypatch.setenv("ORDER_RETRY_ATTEMPTS", "3")
+        monkeypatch.setenv("ORDER_RETRY_BACKOFF", "0.2")
+
+    def lock_inventory(self, isbn):
+        conn = get_db_connection()
+        conn.execute("SELECT 1 FROM inventory WHERE isbn = %s FOR UPDATE", (isbn,))
+        return conn
+
+    def in_stock_isbn(self, db_connection, db_cursor):
+        db_cursor.execute("""
+            SELECT isbn FROM inventory
+            WHERE quantity - quantity_reserved >= 10
+            ORDER BY isbn DESC LIMIT 1
+        """)
+        isbn = db_cursor.fetchone()["isbn"]
+        db_connection.rollback()
+        return isbn
+
+    def test_policy_rejects_invalid_settings(self, monkeypatch):
+        """Test that an unknown lock mode or fewer than one attempt is a configuration error."""
+        monkeypatch.setenv("ORDER_LOCK_MODE", "sometimes")
+        with pytest.raises(ValueError):
+            app_module.get_order_retry_policy()
+        monkeypatch.setenv("ORDER_LOCK_MODE", "wait")
+        for attempts in ("0", "-1"):
+            monkeypatch.setenv("ORDER_RETRY_ATTEMPTS", attempts)
+            with pytest.raises(ValueError, match="ORDER_RETRY_ATTEMPTS"):
+                app_module.get_order_retry_policy()
+
+    def test_busy_inventory_returns_conflict(self, db_setup, client, nowait_policy,
+                                             db_connection, db_cursor):
+        """Test that a lock held past all retries gives 409 instead of waiting."""
+        isbn = self.in_stock_isbn(db_connection, db_cursor)
+        holder = self.lock_inventory(isbn)
+        try:
+            response = client.post('/create_order', json={
+                "shipping_address_id": 1, "billing_address_id": 1,
+                "items": [{"isbn": isbn, "quantity": 1}],
+            })
+        finally:
+            holder.close()
+        assert response.status_code == 409
+        assert "retry" in response.get_json()["error"]
+
+    def test_order_succeeds_once_lock_is_released(self, db_setup, client, nowait_policy,
+                                                  db_connection, db_cursor):
+        """Test that the order is retried after a short-lived lock goes away."""
+        isbn = self.in_stock_isbn(db_connection, db_cursor)
+        holder = self.lock_inventory(isbn)
+        release = threading.Timer(0.1, holder.close)
+        release.start()
+        try:
+            response = client.post('/create_order', json={
+                "shipping_address_id": 1, "billing_address_id": 1,
+                "items": [{"isbn": isbn, "quantity": 1}],
+            })
+        finally:
+            release.join()
+        assert response.status_code == 201
+        assert response.get_json()["success"] is True
+
+    def test_skip_locked_mode_reports_locked_isbn(self, db_setup, nowait_policy,
+                                                  db_connection, db_cursor):
+        """Test that skip_locked raises lock_not_available naming the ISBN."""
+        isbn = self.in_stock_isbn(db_connection, db_cursor)
+        holder = self.lock_inventory(isbn)
+        try:
+            with pytest.raises(psycopg.errors.LockNotAvailable, match=isbn):
+                db_cursor.execute(
+                    "SELECT create_order_transaction(1, 1, %s, 'skip_locked')",
+                    (json.dumps([{"isbn": isbn, "quantity": 1}]),),
+                )
+        finally:
+            holder.close()
+
+
+class TestResponseCache:
+    """Tests for the ETag response cache of the catalog endpoints."""
+
+    @pytest.fixture
+    def cache(self, db_setup):
+        cache = response_cache.get_response_cache()
+        deadline = time.monotonic() + 10
+        while not cache.listening:
+            assert time.monotonic() < deadline, "cache listener did not connect"
+            time.sleep(0.05)
+        return cache
+
+    def wait_for_change(self, client, path, etag):
+        deadline = time.monotonic() + 5
+        while True:
+            response = client.get(path)
+            if response.headers["ETag"] != etag or time.monotonic() > deadline:
+                return response
+            time.sleep(0.02)
+
+    def test_revalidation_returns_not_modified(self, cache, client):
+        """Test that a matching If-None-Match gets an empty 304 from the cache."""
+        first = client.get('/statuses')
+        assert first.status_code == 200
+        etag = first.headers["ETag"]
+
+        hits = cache.hits
+        second = client.get('/statuses', headers={"If-None-Match": etag})
+        assert second.status_code == 304
+        assert second.data == b""
+        assert second.headers["ETag"] == etag
+        assert cache.hits == hits + 1
+
+    def test_database_write_invalidates(self, cache, client, db_connection, db_cursor):
+        """Test that a write made outside the app is seen through NOTIFY."""
+        first = client.get('/authors')
+        db_cursor.execute("SELECT author_id FROM authors ORDER BY author_id LIMIT 1")
+        author_id = db_cursor.fetchone()["author_id"]
+        db_cursor.execute(
+            "UPDATE authors SET surname = 'Cache-Test' WHERE author_id = %s", (author_id,)
+        )
+        db_connection.commit()
+
+        second = self.wait_for_change(client, '/authors', first.headers["ETag"])
+        assert second.status_code == 200
+        changed = next(a for a in second.get_json() if a["author_id"] == author_id)
+        assert changed["surname"] == "Cache-Test"
+
+    def test_order_invalidates_book_pages(self, cache, client, db_connection, db_cursor):
+        """Test that reserving inventory changes the cached /books page at once."""
+        db_cursor.execute("""
+            SELECT isbn, title FROM inventory JOIN books USING (isbn)
+            WHERE quantity - quantity_reserved >= 10
+            ORDER BY title, isbn LIMIT 1
+        """)
+        book = db_cursor.fetchone()
+        db_connection.rollback()
+        cursor = app_module.encode_books_cursor(book["title"], book["isbn"][:-1])
+        path = f'/books?limit=1&cursor={cursor}'
+
+        before = client.get(path).get_json()["items"][0]
+        assert before["isbn"] == book["isbn"]
+        response = client.post('/create_order', json={
+            "shipping_address_id": 1, "billing_address_id": 1,
+            "items": [{"isbn": book["isbn"], "quantity": 2}],
+        })
+        assert response.status_code == 201
+
+        after = client.get(path).get_json()["items"][0]
+        assert after["available_quantity"] == before["available_quantity"] - 2
+
+    def test_outdated_response_is_not_stored(self):
+        """Test that a response computed across an invalidation is not cached."""
+        cache = response_cache.ResponseCache()
+        cache._listening.set()
+        generations = cache.generations(('authors',))
+        cache.invalidate('authors')
+        assert cache.put('/authors?', b'[]', 'application/json', ('authors',), generations) is None
+
+        generations = cache.generations(('authors',))
+        cache.invalidate('categories')
+        assert cache.put('/authors?', b'[]', 'application/json', ('authors',), generations)
+        cache.invalidate()
+        assert cache.get('/authors?') is None
+
+
+class TestQueryRegistry:
+    """Tests for the named, prepared queries and their counters."""
+
+    def test_name_cannot_be_reused_for_other_sql(self):
+        """Test that registering a name twice returns the same query, unless the SQL differs."""
+        query = query_registry.register('test_select_one', "SELECT 1")
+        assert query_registry.register('test_select_one', "SELECT 1") is query
+        with pytest.raises(ValueError):
+            query_registry.register('test_select_one', "SELECT 2")
+
+    def test_statement_is_prepared_once_per_connection(self, db_setup):
+        """Test that repeated calls on one connection prepare the statement only the first time."""
+        query = app_module.BOOK_FULL_QUERY
+        with db_pool.db_connection() as conn, conn.cursor() as cursor:
+            calls, prepares = query.calls, query.prepares
+            for _ in range(3):
+                query_registry.execute(cursor, query, ('0000000000000',))
+            assert query.calls == calls + 3
+            assert query.prepares <= prepares + 1
+            count = conn.execute(
+                "SELECT count(*) FROM pg_prepared_statements WHERE statement LIKE %s",
+                ('%json_agg%',)).fetchone()[0]
+            assert count >= 1
+
+    def test_update_is_one_query_for_any_fields(self, db_setup, client, db_cursor):
+        """Test that PATCH /users runs the same query whatever fields it updates, and keeps the others."""
+        db_cursor.execute("SELECT * FROM users ORDER BY user_id LIMIT 1")
+        user = db_cursor.fetchone()
+
+        response = client.patch(f'/users/{user["user_id"]}', json={"phone": "123456789"})
+        assert response.status_code == 200
+        assert response.get_json()["phone"] == "123456789"
+        assert response.get_json()["email"] == user["email"]
+        response = client.patch(f'/users/{user["user_id"]}',
+                                json={"phone": user["phone"], "email_verified": user["email_verified"]})
+        assert response.status_code == 200
+        assert response.get_json() == {field: user[field] for field in response.get_json()}
+        assert [q.name for q in query_registry.registry if q.name.startswith('update_users')] == ['update_users']
+        assert query_registry.registry['update_users'].calls >= 2
+
+    def test_stats_endpoint(self, db_setup, client):
+        """Test that /queries/stats lists the queries a request ran."""
+        client.get('/statuses')
+        stats = client.get('/queries/stats').get_json()
+        assert stats["prepare"] is True
+        statuses = next(q for q in stats["queries"] if q["name"] == "statuses")
+        assert statuses["calls"] >= 1
+        assert statuses["rows"] >= 1
+
+
+class TestMetrics:
+    """Tests for the per-request histograms at /metrics and the slow query log."""
+
+    def sample(self, text, name, **labels):
+        prefix = name + metrics._labels(**labels) + ' '
+        return next(float(line[len(prefix):]) for line in text.splitlines() if line.startswith(prefix))
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test that an observation counts in every bucket at or above its value."""
+        registry = metrics.Metrics()
+        request_metrics = metrics.RequestMetrics('GET')
+        request_metrics.route = '/test'
+        request_metrics.db_rows = 5
+        registry.observe(request_metrics)
+        text = registry.render()
+        assert self.sample(text, 'http_request_db_rows_bucket', route='/test', method='GET', le='1') == 0
+        assert self.sample(text, 'http_request_db_rows_bucket', route='/test', method='GET', le='10') == 1
+        assert self.sample(text, 'http_request_db_rows_bucket', route='/test', method='GET', le='+Inf') == 1
+        assert self.sample(text, 'http_request_db_rows_sum', route='/test', method='GET') == 5
+
+    def test_request_is_recorded_per_route(self, db_setup, client):
+        """Test that wall time, SQL rows and body size of a request show up under its route."""
+        user_id = client.get('/users').get_json()[0]["user_id"]
+        metrics.metrics.reset()
+        body = client.get(f'/users/{user_id}/addresses').get_data()
+        text = client.get('/metrics').get_data(as_text=True)
+
+        labels = {'route': '/users/<int:user_id>/addresses', 'method': 'GET'}
+        assert self.sample(text, 'http_request_duration_seconds_count', **labels) == 1
+        assert self.sample(text, 'http_request_db_seconds_sum', **labels) > 0
+        assert self.sample(text, 'http_response_size_bytes_sum', **labels) >= len(body)
+        assert self.sample(text, 'http_requests_total', status='200', **labels) == 1
+
+    def test_slow_query_is_logged_with_plan(self, db_setup, client, monkeypatch, caplog):
+        """Test that a query over SLOW_QUERY_MS is logged with its EXPLAIN ANALYZE output."""
+        monkeypatch.setenv("SLOW_QUERY_MS", "0.001")
+        user_id = client.get('/users').get_json()[0]["user_id"]
+        with caplog.at_level("WARNING", logger="slow_queries"):
+            assert client.get(f'/users/{user_id}/full').status_code == 200
+        message = next(r.getMessage() for r in caplog.records if "Slow query user_full" in r.getMessage())
+        assert "actual time=" in message
+
+    def test_slow_explain_is_logged_without_plan(self, db_setup, client, monkeypatch, caplog):
+        """Test that the row estimate of /user_order_summary, itself an EXPLAIN, is not explained again."""
+        monkeypatch.setenv("SLOW_QUERY_MS", "0.001")
+        with caplog.at_level("WARNING", logger="slow_queries"):
+            assert client.get('/user_order_summary?limit=5&user_id=1').status_code == 200
+        message = next(r.getMessage() for r in caplog.records if "Slow query orders_estimate" in r.getMessage())
+        assert "EXPLAIN failed" not in message
+        assert "\n" not in message
+
+
+class TestJSONEncoding:
+    """Tests for the orjson provider and the JSON passed through from Postgres."""
+
+    def test_providers_encode_like_postgres(self):
+        """Test that both providers write Decimals as numbers, dates as Postgres' ISO 8601 and sort keys."""
+        pytest.importorskip("orjson")
+        from datetime import date, datetime
+        from decimal import Decimal
+        from json_encoding import OrjsonProvider, StdlibProvider
+
+        row = {"unit_price": Decimal("12.50"), "valid_from": datetime(2024, 1, 2, 3, 4, 5, 120000),
+               "sale_date": date(2024, 1, 2), "isbn": "9780534391140"}
+        expected = {"isbn": "9780534391140", "sale_date": "2024-01-02",
+                    "unit_price": 12.5, "valid_from": "2024-01-02T03:04:05.12"}
+        assert OrjsonProvider(app).dumps(row) == ('{"isbn":"9780534391140","sale_date":"2024-01-02",'
+                                                  '"unit_price":12.5,"valid_from":"2024-01-02T03:04:05.12"}')
+        assert json.loads(StdlibProvider(app).dumps(row)) == expected
+
+    def test_order_summary_is_passed_through(self, db_setup, client, db_cursor):
+        """Test that /user_order_summary returns every order, newest first, as built by Postgres."""
+        db_cursor.execute("SELECT order_id FROM user_order_summary ORDER BY order_id DESC")
+        expected = [row["order_id"] for row in db_cursor.fetchall()]
+        response = client.get('/user_order_summary')
+        assert response.status_code == 200
+        assert response.mimetype == 'application/json'
+        assert [order["order_id"] for order in response.get_json()] == expected
+
+    def test_paginated_summary_matches_passed_through(self, db_setup, client):
+        """Test that a page of /user_order_summary has the same rows, with the same JSON types, as the full listing."""
+        full = client.get('/user_order_summary').get_json()
+        page = client.get('/user_order_summary?limit=1000').get_json()
+        assert page["next_cursor"] is None
+        assert page["items"] == full
+
+
+class TestWarmup:
+    """Tests for the worker warmup of serve.py."""
+
+    def test_warmup_prepares_statements_and_fills_cache(self, db_setup, monkeypatch):
+        """Test that warmup prepares the hot queries on pooled connections and caches the warm paths."""
+        monkeypatch.setenv("DB_POOL_MIN_SIZE", "2")
+        monkeypatch.setenv("WEB_WARMUP_PATHS", "/statuses,/categories")
+        db_pool.close_pool()
+        response_cache.close_response_cache()
+        try:
+            serve.warmup()
+            pool = db_pool.get_pool()
+            with pool.connection() as first, pool.connection() as second:
+                for conn in (first, second):
+                    prepared = conn.execute("SELECT count(*) FROM pg_prepared_statements").fetchone()[0]
+                    assert prepared == len([q for q in query_registry.registry if q.warmup is not None])
+            assert response_cache.cache_stats()["entries"] == 2
+        finally:
+            db_pool.close_pool()
+            response_cache.close_response_cache()
+
+    def test_startup_creates_upcoming_order_partitions(self, db_setup, db_connection, db_cursor):
+        """Test that create_order_partitions() adds the missing months up to ORDER_PARTITION_MONTHS_AHEAD."""
+        db_cursor.execute("SELECT to_char(date_trunc('month', NOW()) + make_interval(months => %s), 'YYYY_MM') AS suffix",
+                          (app_module.ORDER_PARTITION_MONTHS_AHEAD,))
+        suffix = db_cursor.fetchone()["suffix"]
+        db_cursor.execute(f"DROP TABLE order_items_{suffix}, orders_{suffix}")
+        db_connection.commit()
+
+        assert app_module.create_order_partitions() == 1
+        assert app_module.create_order_partitions() == 0
+        db_cursor.execute(f"SELECT to_regclass('orders_{suffix}') IS NOT NULL AS exists")
+        assert db_cursor.fetchone()["exists"]
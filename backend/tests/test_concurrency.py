@@ -0,0 +1,149 @@
+"""
+Concurrency stress tests for order creation.
+Many connections reserve the same hot books with their items listed in random
+order; create_order_transaction must lock inventory in a fixed order so that
+no deadlocks occur. Batches of orders (create_order_transactions) must do the
+same across all their orders.
+"""
+
+import json
+import os
+import random
+import sys
+import threading
+import time
+import pytest
+import psycopg
+from pathlib import Path
+
+# Add db directory to path so we can import db_loader
+DB_DIR = Path(__file__).resolve().parent.parent.parent / "db"
+sys.path.insert(0, str(DB_DIR))
+
+# For CI compatibility: Map DATABASE_* vars (used in CI) to DB_* vars
+# This must happen BEFORE loading .env so env vars take precedence
+for ci_var, db_var in [("DATABASE_HOST", "DB_HOST"), ("DATABASE_PORT", "DB_PORT"),
+                        ("DATABASE_NAME", "DB_NAME"), ("DATABASE_USER", "DB_USER"),
+                        ("DATABASE_PASSWORD", "DB_PASSWORD")]:
+    if os.environ.get(ci_var):
+        os.environ[db_var] = os.environ[ci_var]
+
+# Load environment variables from .env file (won't override vars already set above)
+from db_loader import load_env, get_db_connection, setup_database
+load_env()
+
+WORKERS = 8
+ORDERS_PER_WORKER = 25
+HOT_BOOKS = 5
+
+
+HOT_BOOK_TOTALS = """
+    SELECT
+        (SELECT SUM(quantity_reserved) FROM inventory WHERE isbn = ANY(%(isbns)s)),
+        (SELECT COALESCE(SUM(oi.quantity), 0)
+         FROM order_items oi JOIN prices p ON p.price_id = oi.price_id
+         WHERE p.isbn = ANY(%(isbns)s))
+"""
+
+
+@pytest.fixture(scope="module")
+def hot_isbns():
+    """Load the example data and give a few books plenty of stock to fight over."""
+    setup_database(snapshot=True)
+    conn = get_db_connection()
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT i.isbn FROM inventory i
+            JOIN prices p ON p.isbn = i.isbn AND p.valid_until IS NULL
+            ORDER BY i.isbn LIMIT %s
+        """, (HOT_BOOKS,))
+        isbns = [row[0] for row in cursor.fetchall()]
+        cursor.execute("""
+            UPDATE inventory SET quantity = quantity_reserved + 1000000
+            WHERE isbn = ANY(%s)
+        """, (isbns,))
+        cursor.execute(HOT_BOOK_TOTALS, {"isbns": isbns})
+        baseline = cursor.fetchone()
+    conn.commit()
+    yield isbns, baseline
+    conn.close()
+
+
+def run_workers(isbns, lock_mode, batch=False):
+    """
+    Create orders from WORKERS threads; returns (created, errors by type, seconds).
+    With batch, every call creates one single-book order per book instead, in
+    one transaction.
+    """
+    created = 0
+    errors = {}
+    lock = threading.Lock()
+
+    def worker(seed):
+        nonlocal created
+        rng = random.Random(seed)
+        with get_db_connection() as conn:
+            for _ in range(ORDERS_PER_WORKER):
+                items = [{"isbn": isbn, "quantity": 1}
+                         for isbn in rng.sample(isbns, rng.randint(2, len(isbns)))]
+                try:
+                    if batch:
+                        orders = [{"shipping_address_id": 1, "billing_address_id": 1, "items": [item]}
+                                  for item in items]
+                        conn.execute(
+                            "SELECT * FROM create_order_transactions(%s, %s)",
+                            (json.dumps(orders), lock_mode),
+                        )
+                    else:
+                        conn.execute(
+                            "SELECT create_order_transaction(1, 1, %s, %s)",
+                            (json.dumps(items), lock_mode),
+                        )
+                    conn.commit()
+                    with lock:
+                        created += 1
+                except psycopg.Error as e:
+                    conn.rollback()
+                    with lock:
+                        errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(WORKERS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    print(f"\n{lock_mode}: {created} orders in {elapsed:.2f}s "
+          f"({created / elapsed:.0f} orders/s), errors: {errors}")
+    return created, errors, elapsed
+
+
+class TestOrderConcurrency:
+    """Stress tests for concurrent inventory reservation."""
+
+    def test_wait_mode_has_no_deadlocks(self, hot_isbns):
+        """Test that blocking locks taken in ISBN order never deadlock."""
+        created, errors, _ = run_workers(hot_isbns[0], 'wait')
+        assert errors == {}
+        assert created == WORKERS * ORDERS_PER_WORKER
+
+    def test_batches_in_opposite_order_do_not_deadlock(self, hot_isbns):
+        """Test that batches ordering the same books differently lock them all up front, in ISBN order."""
+        created, errors, _ = run_workers(hot_isbns[0], 'wait', batch=True)
+        assert errors == {}
+        assert created == WORKERS * ORDERS_PER_WORKER
+
+    def test_nowait_mode_fails_fast(self, hot_isbns):
+        """Test that nowait only ever fails with lock_not_available, never a deadlock."""
+        created, errors, _ = run_workers(hot_isbns[0], 'nowait')
+        assert "DeadlockDetected" not in errors
+        assert set(errors) <= {"LockNotAvailable"}
+        assert created + sum(errors.values()) == WORKERS * ORDERS_PER_WORKER
+
+    def test_reservations_match_order_items(self, hot_isbns):
+        """Test that every created order item was reserved exactly once."""
+        isbns, (reserved_before, ordered_before) = hot_isbns
+        with get_db_connection() as conn:
+            reserved, ordered = conn.execute(HOT_BOOK_TOTALS, {"isbns": isbns}).fetchone()
+        assert reserved - reserved_before == ordered - ordered_before
@@ -6,9 +6,12 @@ Uses db_loader module to load schema and test data.
 
 import os
 import sys
+import numpy as np
 import pytest
 import psycopg
 from psycopg.rows import dict_row
+from datetime import date
+from decimal import Decimal
 from pathlib import Path
 
 # Add db directory to path so we can import db_loader
@@ -24,18 +27,22 @@ for ci_var, db_var in [("DATABASE_HOST", "DB_HOST"), ("DATABASE_PORT", "DB_PORT"
         os.environ[db_var] = os.environ[ci_var]
 
 # Load environment variables from .env file (won't override vars already set above)
-from db_loader import load_env, get_db_connection, setup_database
+from db_loader import (load_env, get_db_connection, get_db_name, setup_database,
+                       template_database_name, copy_csv_file, EXAMPLE_DATA_DIR)
+from sql_values import iter_inserts, split_statements, sql_to_csv, NotLiteralInsert
+from generate_inventory import (parse_books, generate_dataset, generate_price_history_batch,
+                                generate_inventory_batch, isbn_keys)
 load_env()
 
 
 @pytest.fixture(scope="module")
 def db_setup():
     """
-    Module-scoped fixture that sets up the database schema and loads example data.
-    This runs once per test module.
+    Module-scoped fixture that resets the database to the schema and example data
+    from the template database. This runs once per test module.
     """
+    setup_database(snapshot=True)
     conn = get_db_connection()
-    setup_database(conn, close_conn=False)
     yield conn
     conn.close()
 
@@ -116,6 +123,354 @@ class TestSchemaLoaded:
         assert result["count"] >= 5  # We have 5 statuses defined
 
 
+class TestBookSearchVector:
+    """Tests for the triggers maintaining books.search_vector."""
+
+    def test_search_vector_follows_authorship(self, db_connection, db_cursor):
+        """Test that adding and removing an author updates the book's search document."""
+        db_cursor.execute("""
+            INSERT INTO books (isbn, title, publication_year)
+            VALUES ('9999999999999', 'Search Vector Test', 2024)
+        """)
+        db_cursor.execute("""
+            INSERT INTO authors (author_id, name, surname)
+            VALUES ('test_zzyzx', 'Test', 'Zzyzx')
+        """)
+
+        def matches(term):
+            db_cursor.execute("""
+                SELECT search_vector @@ to_tsquery('simple', %s) AS found
+                FROM books WHERE isbn = '9999999999999'
+            """, (term,))
+            return db_cursor.fetchone()["found"]
+
+        assert matches("vector")
+        assert not matches("zzyzx")
+
+        db_cursor.execute("INSERT INTO authorship VALUES ('9999999999999', 'test_zzyzx')")
+        assert matches("zzyzx")
+
+        db_cursor.execute("UPDATE authors SET surname = 'Qwxyz' WHERE author_id = 'test_zzyzx'")
+        assert matches("qwxyz")
+        assert not matches("zzyzx")
+
+        db_cursor.execute("DELETE FROM authorship WHERE isbn = '9999999999999'")
+        assert not matches("qwxyz")
+
+        db_connection.rollback()
+
+
+class TestBookRatings:
+    """Tests for the book_ratings summary maintained by triggers on reviews."""
+
+    def rating_of(self, db_cursor, isbn):
+        db_cursor.execute("""
+            SELECT review_count, stars_sum, avg_stars FROM book_ratings WHERE isbn = %s
+        """, (isbn,))
+        return db_cursor.fetchone()
+
+    def test_summary_matches_reviews(self, db_cursor):
+        """Test that the loaded summary equals aggregating all reviews."""
+        db_cursor.execute("""
+            SELECT isbn, COUNT(*) AS review_count, SUM(stars) AS stars_sum,
+                   AVG(stars)::NUMERIC(3, 2) AS avg_stars
+            FROM reviews GROUP BY isbn ORDER BY isbn
+        """)
+        expected = db_cursor.fetchall()
+        db_cursor.execute("""
+            SELECT isbn, review_count, stars_sum, avg_stars FROM book_ratings ORDER BY isbn
+        """)
+        assert db_cursor.fetchall() == expected
+
+    def test_summary_follows_review_changes(self, db_connection, db_cursor):
+        """Test that inserting, updating and deleting reviews keeps the summary in sync."""
+        isbn = "9780130354624"
+        db_cursor.execute("DELETE FROM reviews WHERE isbn = %s", (isbn,))
+        assert self.rating_of(db_cursor, isbn) is None
+
+        db_cursor.execute("SELECT user_id FROM users LIMIT 1")
+        user_id = db_cursor.fetchone()["user_id"]
+        db_cursor.execute("""
+            INSERT INTO reviews (user_id, isbn, review_body, stars, review_date)
+            VALUES (%s, %s, 'Good', 4, NOW()), (%s, %s, 'Bad', 1, NOW())
+            RETURNING review_id
+        """, (user_id, isbn, user_id, isbn))
+        review_ids = [row["review_id"] for row in db_cursor.fetchall()]
+
+        rating = self.rating_of(db_cursor, isbn)
+        assert rating["review_count"] == 2
+        assert rating["stars_sum"] == 5
+        assert float(rating["avg_stars"]) == 2.5
+
+        db_cursor.execute("UPDATE reviews SET stars = 5 WHERE review_id = %s", (review_ids[1],))
+        rating = self.rating_of(db_cursor, isbn)
+        assert rating["review_count"] == 2
+        assert float(rating["avg_stars"]) == 4.5
+
+        db_cursor.execute("DELETE FROM reviews WHERE review_id = %s", (review_ids[0],))
+        assert float(self.rating_of(db_cursor, isbn)["avg_stars"]) == 5.0
+
+        db_cursor.execute("DELETE FROM reviews WHERE review_id = %s", (review_ids[1],))
+        assert self.rating_of(db_cursor, isbn) is None
+
+        db_connection.rollback()
+
+    def test_avg_rating_view_reads_summary(self, db_cursor):
+        """Test that avg_rating still lists every book, NULL when unreviewed."""
+        db_cursor.execute("SELECT COUNT(*) AS count FROM avg_rating")
+        view_count = db_cursor.fetchone()["count"]
+        db_cursor.execute("SELECT COUNT(*) AS count FROM books")
+        assert view_count == db_cursor.fetchone()["count"]
+
+        db_cursor.execute("""
+            SELECT a.stars FROM avg_rating a
+            WHERE NOT EXISTS (SELECT 1 FROM reviews r WHERE r.isbn = a.isbn)
+            LIMIT 1
+        """)
+        assert db_cursor.fetchone()["stars"] is None
+
+
+class TestBookSales:
+    """Tests for the book_sales counters maintained by triggers on order_items."""
+
+    def test_counters_match_order_items(self, db_cursor):
+        """Test that the loaded counters equal aggregating all order items."""
+        db_cursor.execute("""
+            SELECT p.isbn, SUM(oi.quantity)::INTEGER AS copies_sold
+            FROM order_items oi JOIN prices p USING (price_id)
+            GROUP BY p.isbn ORDER BY p.isbn
+        """)
+        expected = db_cursor.fetchall()
+
+        db_cursor.execute("SELECT isbn, copies_sold FROM book_sales ORDER BY isbn")
+        assert db_cursor.fetchall() == expected
+
+        db_cursor.execute("""
+            SELECT isbn, SUM(copies_sold)::INTEGER AS copies_sold
+            FROM book_sales_daily GROUP BY isbn ORDER BY isbn
+        """)
+        assert db_cursor.fetchall() == expected
+
+    def test_counters_follow_order_item_changes(self, db_connection, db_cursor):
+        """Test that adding, changing and removing an order item updates the counters."""
+        isbn = "9780077077037"
+
+        def sold():
+            db_cursor.execute("SELECT copies_sold FROM book_sales WHERE isbn = %s", (isbn,))
+            total = db_cursor.fetchone()
+            db_cursor.execute("""
+                SELECT copies_sold FROM book_sales_daily
+                WHERE isbn = %s AND sale_date = '2020-02-02'
+            """, (isbn,))
+            daily = db_cursor.fetchone()
+            return (total["copies_sold"] if total else 0, daily["copies_sold"] if daily else 0)
+
+        before_total, _ = sold()
+
+        db_cursor.execute("""
+            INSERT INTO orders (shipping_address_id, billing_address_id, order_time, status_id)
+            VALUES (1, 1, '2020-02-02 12:00', 1)
+            RETURNING order_id
+        """)
+        order_id = db_cursor.fetchone()["order_id"]
+        db_cursor.execute("""
+            INSERT INTO order_items (order_id, order_time, price_id, quantity)
+            VALUES (%s, '2020-02-02 12:00', (SELECT price_id FROM prices WHERE isbn = %s AND valid_until IS NULL), 3)
+            RETURNING id
+        """, (order_id, isbn))
+        item_id = db_cursor.fetchone()["id"]
+        assert sold() == (before_total + 3, 3)
+
+        db_cursor.execute("UPDATE order_items SET quantity = 5 WHERE id = %s", (item_id,))
+        assert sold() == (before_total + 5, 5)
+
+        db_cursor.execute("DELETE FROM order_items WHERE id = %s", (item_id,))
+        assert sold() == (before_total, 0)
+
+        db_connection.rollback()
+
+    def test_counters_are_dropped_at_zero(self, db_connection, db_cursor):
+        """Test that removing the only sold copies of a book deletes its counter rows."""
+        db_cursor.execute("""
+            SELECT price_id, isbn FROM prices
+            WHERE valid_until IS NULL AND isbn NOT IN (SELECT isbn FROM book_sales)
+            ORDER BY isbn LIMIT 1
+        """)
+        price = db_cursor.fetchone()
+        db_cursor.execute("""
+            INSERT INTO orders (shipping_address_id, billing_address_id, order_time, status_id)
+            VALUES (1, 1, '2020-02-02 12:00', 1)
+            RETURNING order_id
+        """)
+        order_id = db_cursor.fetchone()["order_id"]
+        db_cursor.execute("""
+            INSERT INTO order_items (order_id, order_time, price_id, quantity)
+            VALUES (%s, '2020-02-02 12:00', %s, 2)
+        """, (order_id, price["price_id"]))
+
+        def rows():
+            db_cursor.execute("""
+                SELECT (SELECT count(*) FROM book_sales WHERE isbn = %(isbn)s) AS total,
+                       (SELECT count(*) FROM book_sales_daily WHERE isbn = %(isbn)s) AS daily
+            """, {"isbn": price["isbn"]})
+            return db_cursor.fetchone()
+
+        assert rows() == {"total": 1, "daily": 1}
+        db_cursor.execute("DELETE FROM order_items WHERE order_id = %s", (order_id,))
+        assert rows() == {"total": 0, "daily": 0}
+
+        db_connection.rollback()
+
+
+class TestOrderTotals:
+    """Tests for orders.item_count and total_amount, maintained by triggers."""
+
+    def test_totals_match_order_items(self, db_cursor):
+        """Test that the loaded totals equal aggregating the items of every order."""
+        db_cursor.execute("""
+            SELECT o.order_id,
+                   COALESCE(SUM(oi.quantity), 0)::INTEGER AS item_count,
+                   COALESCE(SUM(oi.quantity * p.unit_price), 0) AS total_amount
+            FROM orders o
+            LEFT JOIN order_items oi USING (order_id)
+            LEFT JOIN prices p USING (price_id)
+            GROUP BY o.order_id ORDER BY o.order_id
+        """)
+        expected = db_cursor.fetchall()
+
+        db_cursor.execute("SELECT order_id, item_count, total_amount FROM orders ORDER BY order_id")
+        assert db_cursor.fetchall() == expected
+
+    def test_totals_follow_order_item_changes(self, db_connection, db_cursor):
+        """Test that adding, changing and removing items and correcting a price update the totals."""
+        def totals(order_id):
+            db_cursor.execute(
+                "SELECT item_count, total_amount FROM orders WHERE order_id = %s", (order_id,))
+            row = db_cursor.fetchone()
+            return row["item_count"], row["total_amount"]
+
+        db_cursor.execute("""
+            INSERT INTO orders (shipping_address_id, billing_address_id, order_time, status_id)
+            VALUES (1, 1, '2020-02-02 12:00', 1)
+            RETURNING order_id
+        """)
+        order_id = db_cursor.fetchone()["order_id"]
+        assert totals(order_id) == (0, 0)
+
+        db_cursor.execute("""
+            INSERT INTO prices (isbn, unit_price, valid_from, valid_until)
+            VALUES ('9780077077037', 10.00, '2000-01-01', '2000-01-02'),
+                   ('9780534391140', 2.50, '2000-01-01', '2000-01-02')
+            RETURNING price_id
+        """)
+        first_price, second_price = (row["price_id"] for row in db_cursor.fetchall())
+        db_cursor.execute("""
+            INSERT INTO order_items (order_id, order_time, price_id, quantity)
+            VALUES (%s, '2020-02-02 12:00', %s, 3), (%s, '2020-02-02 12:00', %s, 2)
+            RETURNING id
+        """, (order_id, first_price, order_id, second_price))
+        first_item, second_item = (row["id"] for row in db_cursor.fetchall())
+        assert totals(order_id) == (5, Decimal("35.00"))
+
+        db_cursor.execute("UPDATE order_items SET quantity = 1 WHERE id = %s", (first_item,))
+        assert totals(order_id) == (3, Decimal("15.00"))
+
+        db_cursor.execute("UPDATE prices SET unit_price = 3.00 WHERE price_id = %s", (second_price,))
+        assert totals(order_id) == (3, Decimal("16.00"))
+
+        db_cursor.execute("DELETE FROM order_items WHERE id = %s", (second_item,))
+        assert totals(order_id) == (1, Decimal("10.00"))
+
+        db_connection.rollback()
+
+
+class TestOrderPartitions:
+    """Tests for the monthly partitions of orders and order_items."""
+
+    def test_rows_are_stored_in_their_month(self, db_cursor):
+        """Test that an order and its items go to the partitions of its month."""
+        db_cursor.execute("""
+            SELECT o.tableoid::regclass::text AS orders, oi.tableoid::regclass::text AS items
+            FROM orders o JOIN order_items oi USING (order_id, order_time)
+            WHERE o.order_id = 1
+        """)
+        assert db_cursor.fetchall() == [{"orders": "orders_2025_12", "items": "order_items_2025_12"}] * 2
+
+    def test_order_lookup_with_time_reads_one_month(self, db_cursor):
+        """Test that an order_id and order_time lookup is pruned to the partitions of that month."""
+        db_cursor.execute("SELECT order_time FROM orders WHERE order_id = 1")
+        order_time = db_cursor.fetchone()["order_time"]
+        db_cursor.execute("""
+            EXPLAIN SELECT * FROM orders o JOIN order_items oi USING (order_id, order_time)
+            WHERE o.order_id = %s AND o.order_time = %s
+        """, (1, order_time))
+        plan = "\n".join(row["QUERY PLAN"] for row in db_cursor.fetchall())
+        assert "orders_2025_12" in plan and "order_items_2025_12" in plan
+        assert "orders_2025_11" not in plan and "order_items_2025_11" not in plan
+
+    def test_create_partitions_skips_existing_months(self, db_connection, db_cursor):
+        """Test that only months without partitions get new ones."""
+        db_cursor.execute("SELECT create_order_partitions('2025-11-15', '2026-01-01') AS created")
+        assert db_cursor.fetchone()["created"] == 0
+
+        db_cursor.execute("SELECT create_order_partitions('2019-11-15', '2020-01-01') AS created")
+        assert db_cursor.fetchone()["created"] == 2
+        db_cursor.execute("SELECT to_regclass('order_items_2019_12') IS NOT NULL AS exists")
+        assert db_cursor.fetchone()["exists"]
+
+        db_connection.rollback()
+
+    def test_archive_detaches_finished_months(self, db_connection, db_cursor):
+        """Test that only months of delivered and cancelled orders are archived."""
+        db_cursor.execute("SELECT order_id FROM user_order_summary ORDER BY order_id")
+        order_ids = [row["order_id"] for row in db_cursor.fetchall()]
+
+        db_cursor.execute("SELECT archive_order_partitions('2026-01-01') AS month")
+        archived = [row["month"] for row in db_cursor.fetchall()]
+        # November only has a cancelled order, December has a shipped one
+        assert date(2025, 11, 1) in archived
+        assert date(2025, 12, 1) not in archived
+
+        db_cursor.execute("SELECT order_id FROM user_order_summary ORDER BY order_id")
+        assert [row["order_id"] for row in db_cursor.fetchall()] == [i for i in order_ids if i != 6]
+        db_cursor.execute("SELECT count(*) AS count FROM order_item_details WHERE order_id IN (1, 6)")
+        assert db_cursor.fetchone()["count"] == 2
+        db_cursor.execute("SELECT count(*) AS count FROM archive.order_items_2025_11")
+        assert db_cursor.fetchone()["count"] == 1
+
+        # Archived months are not created again, whatever the search_path
+        db_cursor.execute("SET LOCAL search_path = public")
+        db_cursor.execute("SELECT create_order_partitions('2025-11-01', '2026-01-01') AS created")
+        assert db_cursor.fetchone()["created"] == 0
+        db_cursor.execute("SELECT to_regclass('public.orders_2025_11') IS NULL AS missing")
+        assert db_cursor.fetchone()["missing"]
+
+        db_connection.rollback()
+
+    def test_schema_reload_drops_archived_months(self, db_setup):
+        """Test that loading the schema again after an archive run recreates and refills the archived months."""
+        conn = get_db_connection()
+        try:
+            archived = [month for (month,) in conn.execute("SELECT archive_order_partitions('2026-01-01')")]
+            assert date(2025, 11, 1) in archived
+            conn.commit()
+        finally:
+            conn.close()
+
+        try:
+            setup_database()
+            conn = get_db_connection()
+            try:
+                assert conn.execute("SELECT to_regnamespace('archive') IS NULL").fetchone()[0]
+                assert conn.execute(
+                    "SELECT tableoid::regclass::text FROM orders WHERE order_id = 6"
+                ).fetchone()[0] == "orders_2025_11"
+            finally:
+                conn.close()
+        finally:
+            setup_database(snapshot=True)
+
+
 class TestOrderAddressValidation:
     """Tests for order address ownership validation trigger."""
 
@@ -491,6 +846,36 @@ class TestDatabaseConstraints:
         
         db_connection.rollback()
 
+    def test_book_has_at_most_one_current_price(self, db_connection, db_cursor):
+        """Test that a second open-ended price for the same ISBN is rejected."""
+        with pytest.raises(psycopg.errors.UniqueViolation):
+            db_cursor.execute("""
+                INSERT INTO prices (isbn, unit_price, valid_from, valid_until)
+                VALUES ('9780534391140', 19.99, NOW(), NULL)
+            """)
+
+        db_connection.rollback()
+
+    def test_price_periods_of_a_book_cannot_overlap(self, db_connection, db_cursor):
+        """Test that a closed price period overlapping the history of its ISBN is rejected."""
+        db_cursor.execute("""
+            SELECT valid_from FROM prices
+            WHERE isbn = '9780534391140' ORDER BY valid_from LIMIT 1
+        """)
+        first = db_cursor.fetchone()["valid_from"]
+        # Ends exactly where the history starts: adjacent, not overlapping
+        db_cursor.execute("""
+            INSERT INTO prices (isbn, unit_price, valid_from, valid_until)
+            VALUES ('9780534391140', 9.99, %s - INTERVAL '1 year', %s)
+        """, (first, first))
+        with pytest.raises(psycopg.errors.ExclusionViolation):
+            db_cursor.execute("""
+                INSERT INTO prices (isbn, unit_price, valid_from, valid_until)
+                VALUES ('9780534391140', 9.99, %s, %s + INTERVAL '1 day')
+            """, (first, first))
+
+        db_connection.rollback()
+
     def test_review_stars_constraint(self, db_connection, db_cursor):
         """Test that review stars must be between 0 and 5."""
         # Get a user and book for the review
@@ -511,3 +896,322 @@ class TestDatabaseConstraints:
         
         db_connection.rollback()
 
+
+
+class TestIndexUsage:
+    """
+    Tests that the lookups done by the routes in app.py are answered by an index.
+    Sequential scans are disabled for the transaction, because on the small
+    example tables (reviews, addresses, order_items) a seq scan is cheaper and
+    the planner would rightly prefer it; what we check is that a matching index
+    exists and fits the query.
+    """
+
+    def assert_uses_index(self, db_cursor, query, params, index_name):
+        # Partitions are scanned through their own copies of the index
+        db_cursor.execute("""
+            SELECT inhrelid::regclass::text AS name FROM pg_inherits WHERE inhparent = %s::regclass
+        """, (index_name,))
+        names = [index_name] + [row["name"] for row in db_cursor.fetchall()]
+
+        db_cursor.execute("SET LOCAL enable_seqscan = off")
+        db_cursor.execute("EXPLAIN " + query, params)
+        plan = "\n".join(row["QUERY PLAN"] for row in db_cursor.fetchall())
+        assert any(name in plan for name in names), plan
+
+    def test_current_price_lookup(self, db_cursor):
+        """GET /price/<isbn>?valid_only=true and order creation."""
+        self.assert_uses_index(db_cursor, """
+            SELECT price_id, unit_price FROM prices
+            WHERE isbn = %s AND valid_until IS NULL
+        """, ("9780534391140",), "ux_prices_current")
+
+    def test_price_history_lookup(self, db_cursor):
+        """GET /price/<isbn>"""
+        self.assert_uses_index(db_cursor, """
+            SELECT price_id, unit_price, valid_from, valid_until FROM prices
+            WHERE isbn = %s
+            ORDER BY valid_from ASC
+        """, ("9780534391140",), "idx_prices_isbn_valid_from")
+
+    def test_book_authors_lookup(self, db_cursor):
+        """GET /books/<isbn>/authors"""
+        self.assert_uses_index(db_cursor, """
+            SELECT author_id, name, surname FROM authors
+            JOIN authorship USING (author_id)
+            WHERE isbn = %s
+        """, ("9780534391140",), "idx_authorship_isbn_author")
+
+    def test_book_categories_lookup(self, db_cursor):
+        """GET /books/<isbn>/categories"""
+        self.assert_uses_index(db_cursor, """
+            SELECT category_id, category_name FROM categories
+            JOIN book_categories USING (category_id)
+            WHERE isbn = %s
+        """, ("9780534391140",), "idx_book_categories_isbn_category")
+
+    def test_order_items_lookup(self, db_cursor):
+        """GET /orders/<order_id>"""
+        self.assert_uses_index(db_cursor, """
+            SELECT * FROM order_items oi
+            JOIN prices p ON (oi.price_id = p.price_id)
+            JOIN books b ON (p.isbn = b.isbn)
+            WHERE oi.order_id = %s AND oi.order_time = %s
+        """, (1, "2025-12-01"), "idx_order_items_order")
+
+    def test_sales_per_price_lookup(self, db_cursor):
+        """Sold copies of a price (bestsellers)."""
+        self.assert_uses_index(db_cursor, """
+            SELECT SUM(quantity) FROM order_items WHERE price_id = %s
+        """, (1,), "idx_order_items_price")
+
+    def test_prices_at_lookup(self, db_cursor):
+        """GET /prices?at=..."""
+        self.assert_uses_index(db_cursor, """
+            SELECT price_id, unit_price FROM prices
+            WHERE isbn = %s AND valid_during @> %s::TIMESTAMP
+        """, ("9780534391140", "2010-01-01"), "prices_no_overlap")
+
+    def test_reorder_queue_lookup(self, db_cursor):
+        """GET /inventory/reorder-queue and /inventory?low_stock=true"""
+        self.assert_uses_index(db_cursor, """
+            SELECT * FROM inventory
+            WHERE available <= reorder_threshold AND (available, inventory_id) > (%s, %s)
+            ORDER BY available, inventory_id
+            LIMIT 101
+        """, (0, 0), "idx_inventory_low_stock")
+
+    def test_book_reviews_lookup(self, db_cursor):
+        """GET /books/<isbn>/reviews"""
+        self.assert_uses_index(db_cursor, """
+            SELECT r.*, u.name, u.surname
+            FROM reviews r
+            JOIN users u USING (user_id)
+            WHERE r.isbn = %s
+            ORDER BY r.review_date DESC
+        """, ("9780534391140",), "idx_reviews_isbn_date")
+
+    def test_user_reviews_lookup(self, db_cursor):
+        """GET /users/<user_id>/reviews"""
+        self.assert_uses_index(db_cursor, """
+            SELECT * FROM reviews WHERE user_id = %s ORDER BY review_date DESC
+        """, (1,), "idx_reviews_user_date")
+
+    def test_user_addresses_lookup(self, db_cursor):
+        """GET /users/<user_id>/addresses"""
+        self.assert_uses_index(db_cursor, """
+            SELECT * FROM addresses WHERE user_id = %s ORDER BY address_id
+        """, (1,), "idx_addresses_user")
+
+
+class TestSqlValues:
+    """Tests for the streaming INSERT ... VALUES reader in sql_values.py."""
+
+    def test_parse_literal_inserts(self):
+        statements = list(split_statements("""
+            -- comment
+            INSERT INTO books VALUES
+            (9780534391140, 'It''s; (not) SQL', NULL),
+            -- comment between rows
+            (9780730013426, 'Database', 2006);
+            INSERT INTO users (name, email_verified) VALUES ('Jan', TRUE)
+        """))
+        assert statements == [
+            ("books", None, [
+                ("9780534391140", "It's; (not) SQL", None),
+                ("9780730013426", "Database", "2006"),
+            ]),
+            ("users", ["name", "email_verified"], [("Jan", "TRUE")]),
+        ]
+
+    def test_parse_keeps_other_statements(self):
+        subquery = (
+            "\nINSERT INTO order_items (order_id, price_id, quantity) VALUES\n"
+            "(1, (SELECT price_id FROM prices WHERE isbn = 'x;y'), 2);"
+        )
+        statements = list(split_statements(subquery + "\nINSERT INTO t VALUES (1);"))
+        assert statements == [subquery, ("t", None, [("1",)])]
+
+    def test_strings_may_span_lines(self):
+        lines = ["INSERT INTO t VALUES ('a,\n", "b''c', 1), ('d', 2);\n"]
+        assert [(table, list(rows)) for table, _, rows in iter_inserts(lines)] == [
+            ("t", [("a,\nb'c", "1"), ("d", "2")])
+        ]
+
+    def test_rows_are_lazy(self):
+        def lines():
+            yield "INSERT INTO t VALUES\n"
+            yield "(1),\n"
+            raise AssertionError("read past the first row")
+
+        _, _, rows = next(iter_inserts(lines()))
+        assert next(rows) == ("1",)
+
+    def test_rejects_other_statements(self):
+        with pytest.raises(NotLiteralInsert):
+            for _, _, rows in iter_inserts("INSERT INTO t VALUES (NOW());"):
+                list(rows)
+
+    def test_csv_keeps_empty_strings_apart_from_null(self, tmp_path):
+        """Test that sql_to_csv() quotes '' and writes NULL as an empty field."""
+        sql_path = tmp_path / "t.sql"
+        sql_path.write_text("INSERT INTO t (a, b, c) VALUES ('', NULL, 'x\"y'), (NULL, '', '1');\n")
+        assert sql_to_csv(sql_path, tmp_path / "csv") == {"t": 2}
+        assert (tmp_path / "csv" / "t" / "t-000.csv").read_text() == \
+            '"a","b","c"\n"",,"x""y"\n,"","1"\n'
+
+    def test_csv_round_trip(self, db_setup, tmp_path):
+        """Test that '' and NULL both survive sql_to_csv() and COPY."""
+        sql_path = tmp_path / "t.sql"
+        sql_path.write_text("INSERT INTO t (a, b) VALUES ('', NULL), (NULL, ''), ('a,\"b', 'c');\n")
+        sql_to_csv(sql_path, tmp_path)
+        conn = get_db_connection()
+        try:
+            conn.execute("CREATE TEMP TABLE t (n serial, a text, b text)")
+            assert copy_csv_file(conn, "t", tmp_path / "t" / "t-000.csv") == 3
+            assert conn.execute("SELECT a, b FROM t ORDER BY n").fetchall() == [
+                ("", None), (None, ""), ('a,"b', "c"),
+            ]
+        finally:
+            conn.rollback()
+            conn.close()
+
+    def test_titles_with_commas(self):
+        books = dict(parse_books(EXAMPLE_DATA_DIR / "books.sql"))
+        # (9780415617819, 'Religion, Politics and International Relations: Selected Essays', 2011)
+        assert books["9780415617819"] == 2011
+        assert len(books) == 18620
+
+
+class TestFastLoad:
+    """Tests for the COPY-based load_example_data_fast()."""
+
+    LOADED_TABLES = [
+        "authors", "books", "authorship", "book_categories", "inventory", "prices",
+        "users", "addresses", "orders", "order_items", "reviews",
+        "book_ratings", "book_sales", "book_sales_daily",
+    ]
+
+    def snapshot(self, conn):
+        """Row count and content hash of every loaded table, plus schema objects."""
+        result = {}
+        for table in self.LOADED_TABLES:
+            result[table] = conn.execute(
+                f"SELECT count(*), md5(string_agg(t::text, ',' ORDER BY t::text)) FROM {table} t"
+            ).fetchone()
+        result["indexes"] = conn.execute(
+            "SELECT array_agg(indexname ORDER BY indexname) FROM pg_indexes WHERE schemaname = current_schema()"
+        ).fetchone()
+        result["constraints"] = conn.execute(
+            "SELECT array_agg(conname ORDER BY conname) FROM pg_constraint WHERE connamespace = current_schema()::regnamespace"
+        ).fetchone()
+        return result
+
+    def test_fast_load_matches_regular_load(self, db_setup):
+        """Test that the COPY load produces the same rows, indexes and constraints as the regular load."""
+        conn = get_db_connection()
+        try:
+            setup_database(conn, close_conn=False)
+            expected = self.snapshot(conn)
+            conn.commit()
+
+            setup_database(conn, close_conn=False, fast=True)
+            assert self.snapshot(conn) == expected
+        finally:
+            conn.rollback()
+            conn.close()
+
+
+class TestSnapshotReset:
+    """Tests for resetting the database from the template database."""
+
+    def test_reset_discards_committed_changes(self, db_setup):
+        conn = get_db_connection()
+        quantity = conn.execute("SELECT quantity FROM inventory WHERE isbn = '9780534391140'").fetchone()[0]
+        conn.execute("DELETE FROM reviews")
+        conn.execute("UPDATE inventory SET quantity = quantity + 1 WHERE isbn = '9780534391140'")
+        conn.commit()
+        conn.close()
+
+        setup_database(snapshot=True)
+
+        conn = get_db_connection()
+        try:
+            assert conn.execute("SELECT count(*) FROM reviews").fetchone()[0] > 0
+            assert conn.execute("SELECT count(*) FROM book_ratings").fetchone()[0] > 0
+            assert conn.execute(
+                "SELECT quantity FROM inventory WHERE isbn = '9780534391140'"
+            ).fetchone()[0] == quantity
+        finally:
+            conn.close()
+
+    def test_template_name_follows_sources(self):
+        template = template_database_name()
+        assert template.startswith(f"{get_db_name()}_tmpl_")
+        assert template == template_database_name()
+        assert len(template) <= 63
+
+    def test_snapshot_rejects_connection(self):
+        with pytest.raises(ValueError):
+            setup_database(object(), snapshot=True)
+
+
+class TestGeneratedDataset:
+    """Tests for the scale-factor generator and load_csv_data()."""
+
+    SCALE = {"books": 300, "users": 50, "orders": 500, "reviews": 200}
+
+    def test_output_does_not_depend_on_workers(self, tmp_path):
+        generate_dataset(tmp_path / "one", seed=7, workers=1, **self.SCALE)
+        generate_dataset(tmp_path / "two", seed=7, workers=2, **self.SCALE)
+        for part in sorted((tmp_path / "one").glob("*/*.csv")):
+            other = tmp_path / "two" / part.parent.name / part.name
+            assert part.read_bytes() == other.read_bytes()
+
+    def test_batch_prices_are_valid(self):
+        """Test that every book gets exactly one current price and only non-empty validity periods."""
+        isbns = [f"978000000{i:04d}" for i in range(2000)]
+        years = [None if i % 5 == 0 else 1950 + i % 76 for i in range(2000)]
+        history = generate_price_history_batch(isbn_keys(isbns), years)
+
+        # Every book has exactly one current price and non-empty validity periods
+        current = np.isnat(history["valid_until"])
+        assert np.bincount(history["book"][current], minlength=len(isbns)).tolist() == [1] * len(isbns)
+        assert (history["valid_until"][~current] > history["valid_from"][~current]).all()
+        assert (history["cents"] >= 799).all()
+
+    def test_batch_streams_are_per_isbn(self):
+        """Test that the inventory of a book does not depend on the other books of its batch."""
+        isbns = [f"978000000{i:04d}" for i in range(1000)]
+        keys = isbn_keys(isbns)
+        quantity, threshold, _ = generate_inventory_batch(keys, "2026-01-15")
+        part_quantity, part_threshold, _ = generate_inventory_batch(keys[500:], "2026-01-15")
+        assert (quantity[500:] == part_quantity).all()
+        assert (threshold[500:] == part_threshold).all()
+        assert 0.05 < (quantity == 0).mean() < 0.15
+
+    @pytest.mark.parametrize("batch", [False, True])
+    def test_generated_data_loads(self, db_setup, tmp_path, batch):
+        counts = generate_dataset(tmp_path, seed=7, workers=2, batch=batch, **self.SCALE)
+        assert counts["books"] == 300
+        assert counts["orders"] == 500
+
+        try:
+            # Loading succeeds only if every foreign key, CHECK and trigger is satisfied
+            conn = setup_database(close_conn=False, csv_dir=tmp_path)
+            for table in ("books", "prices", "addresses", "orders", "order_items", "reviews"):
+                assert conn.execute(f"SELECT count(*) FROM {table}").fetchone()[0] == counts[table]
+            assert conn.execute("SELECT sum(copies_sold) FROM book_sales").fetchone()[0] == \
+                conn.execute("SELECT sum(quantity) FROM order_items").fetchone()[0]
+
+            # Identity sequences continue after the generated IDs
+            user_id = conn.execute("""
+                INSERT INTO users (name, surname, passhash, email)
+                VALUES ('New', 'User', repeat('0', 64), 'new.user@example.com')
+                RETURNING user_id
+            """).fetchone()[0]
+            assert user_id == self.SCALE["users"] + 1
+            conn.rollback()
+            conn.close()
+        finally:
+            setup_database(snapshot=True)
@@ -1,11 +1,22 @@
+-- Trigram matching for fuzzy title search (GET /books/search)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+-- Equality on scalar columns in GiST indexes (the price period exclusion constraint)
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
 -- Delete object if exists in reverse order of dependencies to avoid conflicts
 DROP INDEX IF EXISTS idx_prices_current CASCADE;
+DROP INDEX IF EXISTS ux_prices_current CASCADE;
 
 
 DROP VIEW IF EXISTS user_order_summary CASCADE;
 DROP VIEW IF EXISTS order_item_details CASCADE;
 DROP VIEW IF EXISTS avg_rating CASCADE;
 
+-- Functions whose signature changed, so CREATE OR REPLACE would add an overload
+DROP FUNCTION IF EXISTS create_order_transaction(INTEGER, INTEGER, JSONB);
+DROP FUNCTION IF EXISTS add_book_sales(INTEGER, INTEGER, INTEGER);
+DROP FUNCTION IF EXISTS refresh_order_totals(INTEGER[]);
+
 
 DROP TABLE IF EXISTS authors CASCADE;
 DROP TABLE IF EXISTS books CASCADE;
@@ -16,10 +27,15 @@ DROP TABLE IF EXISTS inventory CASCADE;
 DROP TABLE IF EXISTS users CASCADE;
 DROP TABLE IF EXISTS addresses CASCADE;
 DROP TABLE IF EXISTS reviews CASCADE;
+DROP TABLE IF EXISTS book_ratings CASCADE;
 DROP TABLE IF EXISTS statuses CASCADE;
 DROP TABLE IF EXISTS orders CASCADE;
 DROP TABLE IF EXISTS order_items CASCADE;
 DROP TABLE IF EXISTS prices CASCADE;
+DROP TABLE IF EXISTS book_sales CASCADE;
+DROP TABLE IF EXISTS book_sales_daily CASCADE;
+-- Months detached by archive_order_partitions()
+DROP SCHEMA IF EXISTS archive CASCADE;
 
 
 
@@ -36,16 +52,29 @@ CREATE TABLE books(
     isbn             TEXT PRIMARY KEY,
     title            TEXT NOT NULL,
     publication_year INTEGER,
+    -- title and author names, maintained by triggers (see book_search_document)
+    search_vector    tsvector,
 
     CHECK (length(isbn) = 10 OR length(isbn) = 13)
 );
 
+-- Keyset pagination of the catalog (GET /books?limit=...&cursor=...)
+CREATE INDEX idx_books_title_isbn ON books(title, isbn);
+
+-- Indexes backing GET /books/search
+CREATE INDEX idx_books_title_trgm ON books USING GIN (title gin_trgm_ops);
+CREATE INDEX idx_books_search_vector ON books USING GIN (search_vector);
+CREATE INDEX idx_books_isbn_prefix ON books(isbn text_pattern_ops);
+
 
 CREATE TABLE authorship(
     isbn      TEXT NOT NULL REFERENCES books(isbn) ON DELETE RESTRICT ON UPDATE CASCADE,
     author_id TEXT NOT NULL REFERENCES authors(author_id) ON DELETE RESTRICT ON UPDATE CASCADE
 );
 
+-- Author lookup per book (book listings and book_search_document)
+CREATE INDEX idx_authorship_isbn_author ON authorship(isbn, author_id);
+
 
 CREATE TABLE categories(
     category_id   INTEGER GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
@@ -58,6 +87,8 @@ CREATE TABLE book_categories(
     category_id INTEGER NOT NULL REFERENCES categories(category_id) ON DELETE RESTRICT ON UPDATE CASCADE
 );
 
+CREATE INDEX idx_book_categories_isbn_category ON book_categories(isbn, category_id);
+
 
 -- Tables about users:
 
@@ -86,6 +117,8 @@ CREATE TABLE addresses(
     is_primary   BOOLEAN NOT NULL
 );
 
+CREATE INDEX idx_addresses_user ON addresses(user_id);
+
 
 CREATE TABLE reviews(
     review_id   INTEGER GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
@@ -98,11 +131,26 @@ CREATE TABLE reviews(
     CHECK (0 <= stars AND stars <= 5)
 );
 
+-- Reviews of a book / by a user, newest first
+CREATE INDEX idx_reviews_isbn_date ON reviews(isbn, review_date DESC);
+CREATE INDEX idx_reviews_user_date ON reviews(user_id, review_date DESC);
+
+-- Per-book rating summary kept up to date by trg_maintain_book_ratings,
+-- so reading the rating of a book never aggregates reviews.
+-- Books without reviews have no row.
+CREATE TABLE book_ratings(
+    isbn         TEXT PRIMARY KEY REFERENCES books(isbn) ON DELETE CASCADE,
+    review_count INTEGER NOT NULL,
+    stars_sum    INTEGER NOT NULL,
+    avg_stars    NUMERIC(3, 2) GENERATED ALWAYS AS ((stars_sum::NUMERIC / review_count)::NUMERIC(3, 2)) STORED,
+
+    CHECK (review_count > 0),
+    CHECK (stars_sum >= 0)
+);
+
 CREATE VIEW avg_rating AS (
-    SELECT isbn, AVG(r.stars)::NUMERIC(3, 2) as stars FROM books
-    LEFT OUTER JOIN reviews r USING (isbn)
-    GROUP BY isbn
-    ORDER BY stars DESC NULLS LAST
+    SELECT isbn, r.avg_stars as stars FROM books
+    LEFT OUTER JOIN book_ratings r USING (isbn)
 );
 
 -- Inventory tables:
@@ -115,14 +163,25 @@ CREATE TABLE inventory(
     reorder_threshold INTEGER NOT NULL DEFAULT 10,
     quantity_reserved INTEGER NOT NULL DEFAULT 0,
     last_restocked    DATE,
-    quantity          INTEGER NOT NULL DEFAULT 0
+    quantity          INTEGER NOT NULL DEFAULT 0,
+    -- Copies that can still be ordered
+    available         INTEGER GENERATED ALWAYS AS (quantity - quantity_reserved) STORED,
 
-    CHECK (quantity >= 0)
+    CHECK (quantity >= 0),
     CHECK (quantity_reserved >= 0),
     CHECK (reorder_threshold >= 0),
     CHECK (quantity_reserved <= quantity)
 );
 
+-- Books at or below their reorder threshold, fewest available copies first
+-- (GET /inventory?low_stock=true and the reorder queue). Only those rows are
+-- in it, so it stays small however large the catalog grows, and it covers
+-- every column for index-only scans. Reservations change available, so they
+-- are no longer HOT updates.
+CREATE INDEX idx_inventory_low_stock ON inventory(available, inventory_id)
+    INCLUDE (isbn, reorder_threshold, quantity_reserved, quantity, last_restocked)
+    WHERE available <= reorder_threshold;
+
 -- Tables about orders:
 
 
@@ -132,19 +191,36 @@ CREATE TABLE statuses(
 );
 
 
+-- Partitioned by month of order_time (create_order_partitions), so old months
+-- of delivered and cancelled orders can be archived whole
+-- (archive_order_partitions). Keys of a partitioned table must contain the
+-- partition key; order_id alone is still unique, as the identity assigns it.
 CREATE TABLE orders(
-    order_id            INTEGER GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    order_id            INTEGER GENERATED ALWAYS AS IDENTITY,
     -- if adress is deleted we want to keep info about the order, so ON DELETE SET NULL
     shipping_address_id INTEGER REFERENCES addresses(address_id) ON DELETE SET NULL ON UPDATE CASCADE,
     billing_address_id  INTEGER REFERENCES addresses(address_id) ON DELETE SET NULL ON UPDATE CASCADE,
     order_time          timestamp NOT NULL,
     payment_time        timestamp,
     shipment_time       timestamp,
-    status_id           INTEGER REFERENCES statuses(status_id) ON DELETE RESTRICT ON UPDATE CASCADE
-);
+    status_id           INTEGER REFERENCES statuses(status_id) ON DELETE RESTRICT ON UPDATE CASCADE,
+    -- Copies ordered and their value at the ordered prices, maintained by
+    -- trg_*_order_totals from order_items, so listings never aggregate items
+    item_count          INTEGER NOT NULL DEFAULT 0,
+    total_amount        DECIMAL(12, 2) NOT NULL DEFAULT 0,
+
+    PRIMARY KEY (order_id, order_time)
+) PARTITION BY RANGE (order_time);
+
+-- Filters of the paginated order listing: status and/or order_time range,
+-- and the orders of a user (through idx_addresses_user)
+CREATE INDEX idx_orders_status_time ON orders(status_id, order_time);
+CREATE INDEX idx_orders_order_time ON orders(order_time);
+CREATE INDEX idx_orders_shipping_address ON orders(shipping_address_id);
 
 CREATE VIEW user_order_summary AS (
-    SELECT o.order_id, u.user_id, u.name, u.surname, s.status_name, o.order_time, o.payment_time, o.shipment_time
+    SELECT o.order_id, u.user_id, u.name, u.surname, s.status_name, o.order_time, o.payment_time, o.shipment_time,
+        o.item_count, o.total_amount
     FROM orders o
     JOIN addresses a ON o.shipping_address_id = a.address_id
     JOIN users u ON a.user_id = u.user_id
@@ -157,21 +233,64 @@ CREATE TABLE prices(
     unit_price  DECIMAL(7, 2) NOT NULL,
     valid_from  TIMESTAMP NOT NULL DEFAULT NOW(),
     valid_until TIMESTAMP,  -- NULL means current
+    -- The same period as a range, [valid_from, valid_until)
+    valid_during TSRANGE GENERATED ALWAYS AS (tsrange(valid_from, valid_until, '[)')) STORED,
 
     CHECK (unit_price >= 0),
     CHECK (valid_until IS NULL OR valid_until > valid_from)
 );
 
--- Add index for efficient "current price" queries
-CREATE INDEX idx_prices_current ON prices(price_id ) WHERE valid_until IS NULL;
+-- At most one current price per book. Also serves "current price of ISBN"
+-- lookups as an index-only scan.
+CREATE UNIQUE INDEX ux_prices_current ON prices(isbn) INCLUDE (price_id, unit_price) WHERE valid_until IS NULL;
+
+-- Periods of a book never overlap. The GiST index behind the constraint also
+-- finds the price of an ISBN at a point in time (GET /prices?at=...). Added
+-- after ux_prices_current, so a second current price still fails as a
+-- unique violation.
+ALTER TABLE prices ADD CONSTRAINT prices_no_overlap
+    EXCLUDE USING gist (isbn WITH =, valid_during WITH &&);
 
+-- Price history of a book
+CREATE INDEX idx_prices_isbn_valid_from ON prices(isbn, valid_from);
+
+-- Partitioned like orders, so the items of an order are in the partition of
+-- the same month. Rows are routed to a partition before any trigger runs, so
+-- writers have to copy order_time from the order.
 CREATE TABLE order_items(
-    id           INTEGER GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
-    order_id     INTEGER NOT NULL REFERENCES orders(order_id) ON DELETE RESTRICT ON UPDATE CASCADE,
+    id           INTEGER GENERATED ALWAYS AS IDENTITY,
+    order_id     INTEGER NOT NULL,
+    order_time   timestamp NOT NULL,
     price_id     INTEGER NOT NULL REFERENCES prices(price_id) ON DELETE RESTRICT ON UPDATE CASCADE,
-    quantity     INTEGER NOT NULL
+    quantity     INTEGER NOT NULL,
+
+    PRIMARY KEY (id, order_time),
+    FOREIGN KEY (order_id, order_time) REFERENCES orders(order_id, order_time) ON DELETE RESTRICT ON UPDATE CASCADE
+) PARTITION BY RANGE (order_time);
+
+CREATE INDEX idx_order_items_order ON order_items(order_id) INCLUDE (price_id, quantity);
+CREATE INDEX idx_order_items_price ON order_items(price_id) INCLUDE (quantity);
+
+-- Sold copies per book, maintained by trg_maintain_book_sales on order_items,
+-- so bestseller rankings never aggregate order_items.
+CREATE TABLE book_sales(
+    isbn        TEXT PRIMARY KEY REFERENCES books(isbn) ON DELETE CASCADE ON UPDATE CASCADE,
+    copies_sold INTEGER NOT NULL
 );
 
+CREATE INDEX idx_book_sales_copies ON book_sales(copies_sold DESC, isbn);
+
+-- The same counters bucketed by order day, for rankings over a time window
+CREATE TABLE book_sales_daily(
+    isbn        TEXT NOT NULL REFERENCES books(isbn) ON DELETE CASCADE ON UPDATE CASCADE,
+    sale_date   DATE NOT NULL,
+    copies_sold INTEGER NOT NULL,
+
+    PRIMARY KEY (isbn, sale_date)
+);
+
+CREATE INDEX idx_book_sales_daily_date ON book_sales_daily(sale_date) INCLUDE (isbn, copies_sold);
+
 CREATE VIEW order_item_details AS (
     SELECT oi.id, oi.order_id, b.title, b.isbn, p.unit_price, oi.quantity
     FROM order_items oi
@@ -223,11 +342,276 @@ $$ LANGUAGE plpgsql;
 
 -- Attach trigger to Orders table
 CREATE TRIGGER trg_validate_order_address_ownership
-BEFORE INSERT OR UPDATE ON orders
+BEFORE INSERT OR UPDATE OF shipping_address_id, billing_address_id ON orders
 FOR EACH ROW
 EXECUTE FUNCTION validate_order_address_ownership();
 
 
+CREATE OR REPLACE FUNCTION maintain_book_ratings()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        -- Drop the summary together with the last review of the book
+        DELETE FROM book_ratings WHERE isbn = OLD.isbn AND review_count = 1;
+        IF NOT FOUND THEN
+            UPDATE book_ratings
+            SET review_count = review_count - 1,
+                stars_sum = stars_sum - OLD.stars
+            WHERE isbn = OLD.isbn;
+        END IF;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO book_ratings (isbn, review_count, stars_sum)
+        VALUES (NEW.isbn, 1, NEW.stars)
+        ON CONFLICT (isbn) DO UPDATE
+        SET review_count = book_ratings.review_count + 1,
+            stars_sum = book_ratings.stars_sum + EXCLUDED.stars_sum;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_maintain_book_ratings
+AFTER INSERT OR DELETE OR UPDATE OF isbn, stars ON reviews
+FOR EACH ROW
+EXECUTE FUNCTION maintain_book_ratings();
+
+
+-- Add p_copies (negative to subtract) sold copies of the book behind p_price_id
+-- on day p_sale_date. Counters that drop to 0 are deleted, so books and days
+-- without sales have no rows.
+CREATE OR REPLACE FUNCTION add_book_sales(p_sale_date DATE, p_price_id INTEGER, p_copies INTEGER)
+RETURNS VOID AS $$
+DECLARE
+    v_isbn TEXT;
+BEGIN
+    SELECT isbn INTO v_isbn FROM prices WHERE price_id = p_price_id;
+
+    IF p_copies < 0 THEN
+        DELETE FROM book_sales WHERE isbn = v_isbn AND copies_sold = -p_copies;
+        IF NOT FOUND THEN
+            UPDATE book_sales
+            SET copies_sold = copies_sold + p_copies
+            WHERE isbn = v_isbn;
+        END IF;
+
+        DELETE FROM book_sales_daily
+        WHERE isbn = v_isbn AND sale_date = p_sale_date AND copies_sold = -p_copies;
+        IF NOT FOUND THEN
+            UPDATE book_sales_daily
+            SET copies_sold = copies_sold + p_copies
+            WHERE isbn = v_isbn AND sale_date = p_sale_date;
+        END IF;
+        RETURN;
+    END IF;
+
+    INSERT INTO book_sales (isbn, copies_sold)
+    VALUES (v_isbn, p_copies)
+    ON CONFLICT (isbn) DO UPDATE
+    SET copies_sold = book_sales.copies_sold + EXCLUDED.copies_sold;
+
+    INSERT INTO book_sales_daily (isbn, sale_date, copies_sold)
+    VALUES (v_isbn, p_sale_date, p_copies)
+    ON CONFLICT (isbn, sale_date) DO UPDATE
+    SET copies_sold = book_sales_daily.copies_sold + EXCLUDED.copies_sold;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION maintain_book_sales()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM add_book_sales(OLD.order_time::DATE, OLD.price_id, -OLD.quantity);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM add_book_sales(NEW.order_time::DATE, NEW.price_id, NEW.quantity);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_maintain_book_sales
+AFTER INSERT OR DELETE OR UPDATE OF order_id, order_time, price_id, quantity ON order_items
+FOR EACH ROW
+EXECUTE FUNCTION maintain_book_sales();
+
+
+-- Recompute item_count and total_amount of the given orders from their items.
+-- Orders are given by order_id and order_time (same positions of the two
+-- arrays), so each one reads only its own rows of idx_order_items_order in
+-- the partition of its month.
+CREATE OR REPLACE FUNCTION refresh_order_totals(p_order_ids INTEGER[], p_order_times TIMESTAMP[])
+RETURNS VOID AS $$
+    UPDATE orders o
+    SET item_count = t.item_count,
+        total_amount = t.total_amount
+    FROM (
+        SELECT ids.order_id, ids.order_time,
+               COALESCE(SUM(oi.quantity), 0) AS item_count,
+               COALESCE(SUM(oi.quantity * p.unit_price), 0) AS total_amount
+        FROM (SELECT DISTINCT * FROM unnest(p_order_ids, p_order_times) AS k(order_id, order_time)) ids
+        LEFT JOIN order_items oi ON oi.order_id = ids.order_id AND oi.order_time = ids.order_time
+        LEFT JOIN prices p ON p.price_id = oi.price_id
+        GROUP BY ids.order_id, ids.order_time
+    ) t
+    WHERE o.order_id = t.order_id AND o.order_time = t.order_time
+      AND (o.item_count, o.total_amount) IS DISTINCT FROM (t.item_count, t.total_amount);
+$$ LANGUAGE sql;
+
+-- Statement-level, so an order inserted with all of its items in one
+-- statement (create_order_transaction) has its totals written once
+CREATE OR REPLACE FUNCTION maintain_order_totals()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_order_ids INTEGER[];
+    v_order_times TIMESTAMP[];
+BEGIN
+    IF TG_TABLE_NAME = 'prices' THEN
+        -- A corrected unit_price changes the value of every order placed at it
+        SELECT array_agg(oi.order_id), array_agg(oi.order_time) INTO v_order_ids, v_order_times
+        FROM old_rows o
+        JOIN new_rows n USING (price_id)
+        JOIN order_items oi ON oi.price_id = n.price_id
+        WHERE n.unit_price IS DISTINCT FROM o.unit_price;
+    ELSIF TG_OP = 'INSERT' THEN
+        SELECT array_agg(order_id), array_agg(order_time) INTO v_order_ids, v_order_times
+        FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(order_id), array_agg(order_time) INTO v_order_ids, v_order_times
+        FROM old_rows;
+    ELSE
+        SELECT array_agg(order_id), array_agg(order_time) INTO v_order_ids, v_order_times
+        FROM (SELECT order_id, order_time FROM old_rows UNION SELECT order_id, order_time FROM new_rows) k;
+    END IF;
+    PERFORM refresh_order_totals(v_order_ids, v_order_times);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_order_items_insert_order_totals
+AFTER INSERT ON order_items
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION maintain_order_totals();
+
+CREATE TRIGGER trg_order_items_delete_order_totals
+AFTER DELETE ON order_items
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION maintain_order_totals();
+
+CREATE TRIGGER trg_order_items_update_order_totals
+AFTER UPDATE ON order_items
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION maintain_order_totals();
+
+CREATE TRIGGER trg_prices_update_order_totals
+AFTER UPDATE ON prices
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION maintain_order_totals();
+
+
+-- Create the monthly partitions of orders and order_items (orders_YYYY_MM,
+-- order_items_YYYY_MM) for the months from p_from until before p_until.
+-- Months that already have them are skipped, and so are archived months
+-- (archive_order_partitions): they are looked up among the partitions and in
+-- the archive schema, not through search_path. Returns the number of months
+-- created.
+CREATE OR REPLACE FUNCTION create_order_partitions(p_from DATE, p_until DATE)
+RETURNS INTEGER AS $$
+DECLARE
+    v_month DATE := date_trunc('month', p_from)::DATE;
+    v_suffix TEXT;
+    v_created INTEGER := 0;
+BEGIN
+    -- Servers starting together call this at the same time
+    PERFORM pg_advisory_xact_lock(hashtext('create_order_partitions'));
+    WHILE v_month < p_until LOOP
+        v_suffix := to_char(v_month, 'YYYY_MM');
+        IF NOT EXISTS (
+            SELECT 1
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE c.relname = 'orders_' || v_suffix
+              AND (c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = 'orders'::regclass)
+                   OR n.nspname = 'archive')
+        ) THEN
+            EXECUTE format('CREATE TABLE %I PARTITION OF orders FOR VALUES FROM (%L) TO (%L)',
+                           'orders_' || v_suffix, v_month, v_month + INTERVAL '1 month');
+            EXECUTE format('CREATE TABLE %I PARTITION OF order_items FOR VALUES FROM (%L) TO (%L)',
+                           'order_items_' || v_suffix, v_month, v_month + INTERVAL '1 month');
+            v_created := v_created + 1;
+        END IF;
+        v_month := v_month + INTERVAL '1 month';
+    END LOOP;
+    RETURN v_created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Detach the months of orders and order_items that end before p_before and
+-- hold only delivered or cancelled orders, and move them to the archive
+-- schema. user_order_summary and order_item_details no longer show them, and
+-- book_sales keeps counting their copies. Returns the archived months.
+CREATE OR REPLACE FUNCTION archive_order_partitions(p_before DATE)
+RETURNS SETOF DATE AS $$
+DECLARE
+    v_month DATE;
+    v_orders TEXT;
+    v_items TEXT;
+    v_fkey TEXT;
+    v_open BOOLEAN;
+BEGIN
+    CREATE SCHEMA IF NOT EXISTS archive;
+    -- Detaching needs these locks anyway; taken up front, no order can change
+    -- status between the check of a month and its detach
+    LOCK TABLE order_items, orders IN ACCESS EXCLUSIVE MODE;
+
+    FOR v_month IN
+        SELECT to_date(substring(c.relname FROM '\d{4}_\d{2}$'), 'YYYY_MM') AS month
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'orders'::regclass AND c.relname ~ '^orders_\d{4}_\d{2}$'
+        ORDER BY month
+    LOOP
+        CONTINUE WHEN v_month + INTERVAL '1 month' > p_before;
+        v_orders := 'orders_' || to_char(v_month, 'YYYY_MM');
+        v_items := 'order_items_' || to_char(v_month, 'YYYY_MM');
+
+        EXECUTE format($q$
+            SELECT EXISTS (
+                SELECT 1 FROM %I o
+                WHERE o.status_id IS NULL OR o.status_id NOT IN (
+                    SELECT status_id FROM statuses WHERE status_name IN ('Dostarczone', 'Anulowane')
+                )
+            )$q$, v_orders) INTO v_open;
+        CONTINUE WHEN v_open;
+
+        -- Items first: the detached items keep their foreign key to orders,
+        -- which is dropped so that their orders can be detached as well
+        EXECUTE format('ALTER TABLE order_items DETACH PARTITION %I', v_items);
+        FOR v_fkey IN
+            SELECT conname FROM pg_constraint
+            WHERE conrelid = v_items::regclass AND confrelid = 'orders'::regclass
+        LOOP
+            EXECUTE format('ALTER TABLE %I DROP CONSTRAINT %I', v_items, v_fkey);
+        END LOOP;
+        EXECUTE format('ALTER TABLE orders DETACH PARTITION %I', v_orders);
+
+        EXECUTE format('ALTER TABLE %I SET SCHEMA archive', v_items);
+        EXECUTE format('ALTER TABLE %I SET SCHEMA archive', v_orders);
+        RETURN NEXT v_month;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Months of the example and generated data (generate_inventory.py starts in
+-- 2020) and a year ahead; order_partitions.py keeps adding the next months
+SELECT create_order_partitions('2020-01-01', (date_trunc('month', NOW()) + INTERVAL '13 months')::DATE);
+
+
 CREATE OR REPLACE FUNCTION validate_at_most_one_primary_address()
 RETURNS TRIGGER AS $$
 DECLARE
@@ -257,6 +641,57 @@ FOR EACH ROW
 EXECUTE FUNCTION validate_at_most_one_primary_address();
 
 
+-- Items of an order request, one row per ISBN (repeated ISBNs are summed up)
+CREATE OR REPLACE FUNCTION order_items_from_json(p_items JSONB)
+RETURNS TABLE (isbn TEXT, quantity INTEGER) AS $$
+    SELECT x.isbn, SUM(x.quantity)::INTEGER
+    FROM jsonb_to_recordset(p_items) AS x(isbn text, quantity int)
+    GROUP BY x.isbn;
+$$ LANGUAGE sql IMMUTABLE;
+
+
+-- Lock the inventory rows of the books in p_items (an order request's items)
+-- all at once, always in ISBN order, so that two orders sharing books wait for
+-- each other instead of deadlocking. p_lock_mode as in create_order_transaction.
+CREATE OR REPLACE FUNCTION lock_order_inventory(p_items JSONB, p_lock_mode TEXT)
+RETURNS VOID AS $$
+DECLARE
+    v_problem RECORD;
+BEGIN
+    IF p_lock_mode = 'wait' THEN
+        PERFORM 1 FROM inventory i
+        WHERE i.isbn IN (SELECT x.isbn FROM order_items_from_json(p_items) x)
+        ORDER BY i.isbn
+        FOR UPDATE;
+    ELSIF p_lock_mode = 'nowait' THEN
+        PERFORM 1 FROM inventory i
+        WHERE i.isbn IN (SELECT x.isbn FROM order_items_from_json(p_items) x)
+        ORDER BY i.isbn
+        FOR UPDATE NOWAIT;
+    ELSIF p_lock_mode = 'skip_locked' THEN
+        WITH locked AS (
+            SELECT i.isbn FROM inventory i
+            WHERE i.isbn IN (SELECT x.isbn FROM order_items_from_json(p_items) x)
+            ORDER BY i.isbn
+            FOR UPDATE SKIP LOCKED
+        )
+        SELECT x.isbn INTO v_problem
+        FROM order_items_from_json(p_items) x
+        JOIN inventory i ON i.isbn = x.isbn
+        WHERE x.isbn NOT IN (SELECT isbn FROM locked)
+        LIMIT 1;
+
+        IF FOUND THEN
+            RAISE EXCEPTION 'Inventory of % is locked by another order', v_problem.isbn
+                USING ERRCODE = 'lock_not_available';
+        END IF;
+    ELSE
+        RAISE EXCEPTION 'Unknown lock mode: %', p_lock_mode;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+
 CREATE OR REPLACE FUNCTION create_order_transaction(
     p_shipping_id INTEGER,
     p_billing_id INTEGER,
@@ -264,17 +699,23 @@ CREATE OR REPLACE FUNCTION create_order_transaction(
      -- We pass the p_items as a JSON array with "isbn" and "quantity" , e.g.:
      -- [ {"isbn": "9780534391140", "quantity": 2}, {"isbn": "9780730013426", "quantity": 1} ]
      --
-    p_items JSONB
+    p_items JSONB,
+     --
+     -- How to behave when another order holds one of the inventory rows:
+     --   'wait'        - wait for it (default)
+     --   'nowait'      - fail immediately with lock_not_available (55P03)
+     --   'skip_locked' - lock whatever is free, then fail with lock_not_available
+     --                   if anything was skipped
+     -- The caller is expected to retry the last two after a backoff.
+     --
+    p_lock_mode TEXT DEFAULT 'wait'
 )
 RETURNS JSON AS $$
 DECLARE
     v_order_id INTEGER;
+    v_order_time TIMESTAMP;
     v_status_id INTEGER;
-    v_item RECORD;
-    v_price_id INTEGER;
-    v_unit_price NUMERIC;
-    v_quantity_in_stock INTEGER;
-    v_quantity_reserved INTEGER;
+    v_problem RECORD;
 BEGIN
     -- We do not need to check if addresses belong to the same user here
     -- because of the trigger on orders table
@@ -285,50 +726,52 @@ BEGIN
         RAISE EXCEPTION 'System Error: Status "Oczekujące" not found.';
     END IF;
 
-    -- Create the order
-    INSERT INTO orders (shipping_address_id, billing_address_id, order_time, status_id)
-    VALUES (p_shipping_id, p_billing_id, NOW(), v_status_id)
-    RETURNING order_id INTO v_order_id;
-
-    -- Create all the order items and update inventory
-    FOR v_item IN SELECT * FROM jsonb_to_recordset(p_items) AS x(isbn text, quantity int)
-    LOOP
-        -- Sanity check inputs
-        IF v_item.quantity <= 0 THEN
-            RAISE EXCEPTION 'Quantity must be positive for ISBN %', v_item.isbn;
-        END IF;
+    -- Sanity check inputs
+    SELECT x.isbn INTO v_problem
+    FROM jsonb_to_recordset(p_items) AS x(isbn text, quantity int)
+    WHERE x.quantity IS NULL OR x.quantity <= 0
+    LIMIT 1;
+    IF FOUND THEN
+        RAISE EXCEPTION 'Quantity must be positive for ISBN %', v_problem.isbn;
+    END IF;
 
-        -- FETCH PRICE + INVENTORY + LOCK THE ROW
-        SELECT
-            p.price_id, p.unit_price, i.quantity, i.quantity_reserved
-        INTO
-            v_price_id, v_unit_price, v_quantity_in_stock, v_quantity_reserved
-        FROM inventory i
-        JOIN prices p ON i.isbn = p.isbn
-        WHERE i.isbn = v_item.isbn AND p.valid_until IS NULL
-        FOR UPDATE OF i; -- <--- CRITICAL LOCK to prevent race conditions
-
-        -- Checks
-        IF NOT FOUND THEN
-            RAISE EXCEPTION 'Book % not found or price missing.', v_item.isbn;
+    PERFORM lock_order_inventory(p_items, p_lock_mode);
+
+    -- Check price and stock of every item in one pass; report the first problem
+    SELECT x.isbn, x.quantity, p.price_id, i.quantity - i.quantity_reserved AS available
+    INTO v_problem
+    FROM order_items_from_json(p_items) x
+    LEFT JOIN inventory i ON i.isbn = x.isbn
+    LEFT JOIN prices p ON p.isbn = x.isbn AND p.valid_until IS NULL
+    WHERE i.isbn IS NULL OR p.price_id IS NULL OR i.quantity - i.quantity_reserved < x.quantity
+    ORDER BY x.isbn
+    LIMIT 1;
+
+    IF FOUND THEN
+        IF v_problem.price_id IS NULL OR v_problem.available IS NULL THEN
+            RAISE EXCEPTION 'Book % not found or price missing.', v_problem.isbn;
         END IF;
+        RAISE EXCEPTION 'Insufficient stock for %. Requested: %, Available: %',
+                        v_problem.isbn, v_problem.quantity, v_problem.available;
+    END IF;
 
-        -- We keep this explicit check here to get better error message
-        IF (v_quantity_in_stock - v_quantity_reserved) < v_item.quantity THEN
-             RAISE EXCEPTION 'Insufficient stock for %. Requested: %, Available: %',
-                             v_item.isbn, v_item.quantity, (v_quantity_in_stock - v_quantity_reserved);
-        END IF;
+    -- Create the order
+    INSERT INTO orders (shipping_address_id, billing_address_id, order_time, status_id)
+    VALUES (p_shipping_id, p_billing_id, NOW(), v_status_id)
+    RETURNING order_id, order_time INTO v_order_id, v_order_time;
 
-        -- Insert Order Item
-        INSERT INTO order_items (order_id, price_id, quantity)
-        VALUES (v_order_id, v_price_id, v_item.quantity);
+    -- Insert all order items at once
+    INSERT INTO order_items (order_id, order_time, price_id, quantity)
+    SELECT v_order_id, v_order_time, p.price_id, x.quantity
+    FROM order_items_from_json(p_items) x
+    JOIN prices p ON p.isbn = x.isbn AND p.valid_until IS NULL
+    ORDER BY x.isbn;
 
-        -- Update Inventory
-        UPDATE inventory
-        SET quantity_reserved = quantity_reserved + v_item.quantity
-        WHERE isbn = v_item.isbn;
-
-    END LOOP;
+    -- Reserve inventory for all items at once
+    UPDATE inventory i
+    SET quantity_reserved = i.quantity_reserved + x.quantity
+    FROM order_items_from_json(p_items) x
+    WHERE i.isbn = x.isbn;
 
     -- Return success object
     RETURN json_build_object(
@@ -337,4 +780,160 @@ BEGIN
         'message', 'Order created successfully'
     );
 END;
-$$ LANGUAGE plpgsql;
\ No newline at end of file
+$$ LANGUAGE plpgsql;
+
+-- Create many orders in one transaction (POST /create_orders), returning the
+-- result of create_order_transaction for each, in order. The inventory rows
+-- of every book in the batch are locked first, in ISBN order: each order
+-- alone locks in ISBN order, but two batches holding the locks of their
+-- earlier orders could still deadlock.
+CREATE OR REPLACE FUNCTION create_order_transactions(p_orders JSONB, p_lock_mode TEXT DEFAULT 'wait')
+RETURNS SETOF JSON AS $$
+DECLARE
+    v_order RECORD;
+BEGIN
+    PERFORM lock_order_inventory(
+        (SELECT COALESCE(jsonb_agg(item), '[]'::jsonb)
+         FROM jsonb_array_elements(p_orders) o, jsonb_array_elements(o->'items') item),
+        p_lock_mode
+    );
+
+    FOR v_order IN
+        SELECT o.shipping_address_id, o.billing_address_id, o.items
+        FROM ROWS FROM (
+            jsonb_to_recordset(p_orders)
+                AS (shipping_address_id int, billing_address_id int, items jsonb)
+        ) WITH ORDINALITY AS o(shipping_address_id, billing_address_id, items, n)
+        ORDER BY o.n
+    LOOP
+        RETURN NEXT create_order_transaction(
+            v_order.shipping_address_id, v_order.billing_address_id, v_order.items, p_lock_mode);
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Full-text search document of a book: title (weight A) and author names (weight B).
+-- The 'simple' configuration is used because titles and names come in many languages.
+CREATE OR REPLACE FUNCTION book_search_document(p_isbn TEXT, p_title TEXT)
+RETURNS tsvector AS $$
+    SELECT setweight(to_tsvector('simple', p_title), 'A') ||
+           setweight(to_tsvector('simple', COALESCE(string_agg(a.name || ' ' || COALESCE(a.surname, ''), ' '), '')), 'B')
+    FROM authorship s
+    JOIN authors a USING (author_id)
+    WHERE s.isbn = p_isbn;
+$$ LANGUAGE sql STABLE;
+
+
+CREATE OR REPLACE FUNCTION set_book_search_vector()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.search_vector := book_search_document(NEW.isbn, NEW.title);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_set_book_search_vector
+BEFORE INSERT OR UPDATE OF title ON books
+FOR EACH ROW
+EXECUTE FUNCTION set_book_search_vector();
+
+
+-- Statement-level so that bulk loads of authorship rebuild each book once
+CREATE OR REPLACE FUNCTION refresh_book_search_vectors()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'authors' THEN
+        UPDATE books b SET search_vector = book_search_document(b.isbn, b.title)
+        WHERE b.isbn IN (
+            SELECT s.isbn FROM authorship s JOIN new_rows n USING (author_id)
+        );
+    ELSIF TG_OP = 'INSERT' THEN
+        UPDATE books b SET search_vector = book_search_document(b.isbn, b.title)
+        WHERE b.isbn IN (SELECT isbn FROM new_rows);
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE books b SET search_vector = book_search_document(b.isbn, b.title)
+        WHERE b.isbn IN (SELECT isbn FROM old_rows);
+    ELSE
+        UPDATE books b SET search_vector = book_search_document(b.isbn, b.title)
+        WHERE b.isbn IN (SELECT isbn FROM old_rows UNION SELECT isbn FROM new_rows);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_authorship_insert_search_vector
+AFTER INSERT ON authorship
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION refresh_book_search_vectors();
+
+CREATE TRIGGER trg_authorship_delete_search_vector
+AFTER DELETE ON authorship
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION refresh_book_search_vectors();
+
+CREATE TRIGGER trg_authorship_update_search_vector
+AFTER UPDATE ON authorship
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION refresh_book_search_vectors();
+
+CREATE TRIGGER trg_authors_update_search_vector
+AFTER UPDATE ON authors
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION refresh_book_search_vectors();
+
+
+-- Tell the backend's response cache (LISTEN catalog_changed) which table
+-- changed. Statement-level, and Postgres folds identical notifications of a
+-- transaction into one, so bulk writes send a single message per table.
+CREATE OR REPLACE FUNCTION notify_catalog_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('catalog_changed', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_books_notify_catalog_changed
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON books
+FOR EACH STATEMENT
+EXECUTE FUNCTION notify_catalog_changed();
+
+CREATE TRIGGER trg_authors_notify_catalog_changed
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON authors
+FOR EACH STATEMENT
+EXECUTE FUNCTION notify_catalog_changed();
+
+CREATE TRIGGER trg_authorship_notify_catalog_changed
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON authorship
+FOR EACH STATEMENT
+EXECUTE FUNCTION notify_catalog_changed();
+
+CREATE TRIGGER trg_categories_notify_catalog_changed
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON categories
+FOR EACH STATEMENT
+EXECUTE FUNCTION notify_catalog_changed();
+
+CREATE TRIGGER trg_statuses_notify_catalog_changed
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON statuses
+FOR EACH STATEMENT
+EXECUTE FUNCTION notify_catalog_changed();
+
+CREATE TRIGGER trg_prices_notify_catalog_changed
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON prices
+FOR EACH STATEMENT
+EXECUTE FUNCTION notify_catalog_changed();
+
+CREATE TRIGGER trg_inventory_notify_catalog_changed
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON inventory
+FOR EACH STATEMENT
+EXECUTE FUNCTION notify_catalog_changed();
+
+CREATE TRIGGER trg_book_ratings_notify_catalog_changed
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON book_ratings
+FOR EACH STATEMENT
+EXECUTE FUNCTION notify_catalog_changed();
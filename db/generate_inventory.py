@@ -2,33 +2,42 @@
 """
 Generate inventory and prices for all books in the database.
 Creates inventory.sql and prices.sql with realistic data.
+
+With scale factors (--books N --users N --orders N --reviews N) it generates
+a synthetic dataset for every table instead, written as CSV files for COPY
+(load them with `python db_loader.py --csv DIR`).
 """
 
+import argparse
+import bisect
+import csv
 import hashlib
+import os
 import random
-from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
 
+from sql_values import LEADING_COLUMNS, iter_inserts
+
+try:
+    import numpy as np
+except ImportError:  # only needed by the batch path (--batch)
+    np = None
+
 def parse_books(books_sql_path):
-    """Extract ISBN and publication_year from books.sql"""
-    books = []
+    """Yield (isbn, publication_year) of every book in books.sql, one row at a time"""
     with open(books_sql_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            if line.strip().startswith('('):
-                # Parse: (9780534391140, 'Databases', 2006),
-                parts = line.strip().strip('(),').split(',')
-                if len(parts) >= 3:
-                    isbn = parts[0].strip()
-                    year = parts[2].strip()
-                    if year == 'NULL':
-                        year = None
-                    else:
-                        try:
-                            year = int(year)
-                        except:
-                            year = None
-                    books.append((isbn, year))
-    return books
+        for table, columns, rows in iter_inserts(f):
+            if table != 'books':
+                continue
+            columns = columns or LEADING_COLUMNS['books']
+            isbn_at, year_at = columns.index('isbn'), columns.index('publication_year')
+            for row in rows:
+                year = row[year_at]
+                yield row[isbn_at], None if year is None else int(year)
 
 def generate_price_history(isbn, year):
     """Generate multiple price records with Poisson-like distribution over time"""
@@ -78,7 +87,8 @@ def generate_price_history(isbn, year):
             day = random.randint(1, 28)
             change_dates.append(f"{change_year:04d}-{month:02d}-{day:02d}")
         
-        change_dates.sort()
+        # Equal dates would make an empty validity period (CHECK valid_until > valid_from)
+        change_dates = sorted(d for d in set(change_dates) if d > f"{pub_year}-01-01")
         
         # Generate prices with variations
         current_price = initial_price
@@ -149,62 +159,636 @@ def generate_last_restocked():
     date = datetime.now() - timedelta(days=days_ago)
     return date.strftime('%Y-%m-%d')
 
-def main():
-    script_dir = Path(__file__).parent
-    books_sql = script_dir / 'example_data' / 'books.sql'
-    inventory_sql = script_dir / 'example_data' / 'inventory_generated.sql'
-    prices_sql = script_dir / 'example_data' / 'prices_generated.sql'
-    
-    print(f"Reading books from {books_sql}...")
-    books = parse_books(books_sql)
-    print(f"Found {len(books)} books")
-    
-    print("Generating inventory and prices...")
-    
-    # Generate inventory.sql
-    with open(inventory_sql, 'w', encoding='utf-8') as inv_f:
+
+def write_sql(books, inventory_sql, prices_sql):
+    """
+    Write inventory and prices SQL for all books, row by row.
+
+    Returns:
+        tuple: (inventory rows, price rows)
+    """
+    inventory_count = price_count = 0
+    with open(inventory_sql, 'w', encoding='utf-8') as inv_f, \
+            open(prices_sql, 'w', encoding='utf-8') as price_f:
         inv_f.write("-- Generated inventory for all books\n")
         inv_f.write("-- Generated by generate_inventory.py\n\n")
         inv_f.write("INSERT INTO inventory (isbn, reorder_threshold, quantity_reserved, quantity, last_restocked) VALUES\n")
-        
-        inventory_lines = []
+        price_f.write("-- Generated prices for all books\n")
+        price_f.write("-- Generated by generate_inventory.py\n")
+        price_f.write("-- Multiple price records per book showing price history\n\n")
+        price_f.write("INSERT INTO prices (isbn, unit_price, valid_from, valid_until) VALUES\n")
+
+        # One pass over the books; every generator reseeds per ISBN, so the
+        # output is the same as generating inventory and prices separately
         for isbn, year in books:
             quantity = generate_inventory_quantity(isbn)
             threshold = generate_reorder_threshold(quantity)
             last_restock = generate_last_restocked()
             reserved = 0  # No reservations by default
-            
-            line = f"('{isbn}', {threshold}, {reserved}, {quantity}, '{last_restock}')"
-            inventory_lines.append(line)
-        
-        inv_f.write(',\n'.join(inventory_lines))
+
+            if inventory_count:
+                inv_f.write(',\n')
+            inv_f.write(f"('{isbn}', {threshold}, {reserved}, {quantity}, '{last_restock}')")
+            inventory_count += 1
+
+            for record in generate_price_history(isbn, year):
+                if price_count:
+                    price_f.write(',\n')
+                price_f.write(f"('{record['isbn']}', {record['price']:.2f}, '{record['valid_from']}', {record['valid_until']})")
+                price_count += 1
+
         inv_f.write(';\n')
-    
-    # Generate prices.sql
-    with open(prices_sql, 'w', encoding='utf-8') as price_f:
+        price_f.write(';\n')
+
+    return inventory_count, price_count
+
+
+# ---------------------------------------------------------------------------
+# NumPy batch path (--batch)
+# ---------------------------------------------------------------------------
+#
+# Same distributions as the functions above, computed for many ISBNs at once.
+# Instead of reseeding `random` per ISBN, draw j of stream s for an ISBN is a
+# hash of (ISBN key, s, j) (counter-based), so every ISBN gets the same values
+# no matter which batch it is generated in. The numbers differ from the
+# row-by-row path.
+
+BATCH_SIZE = 100000  # ISBNs formatted and written at a time
+
+_STREAM_INVENTORY = 1
+_STREAM_PRICES = 2
+_DATE_NONE = 99999999  # sorts after every YYYYMMDD date
+
+
+def _np_splitmix(x):
+    """SplitMix64 finalizer on uint64 arrays (wraps around like the C version)"""
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def isbn_keys(isbns, seed=0):
+    """64-bit RNG key per ISBN"""
+    keys = np.fromiter((int(hashlib.md5(isbn.encode()).hexdigest()[:16], 16) for isbn in isbns),
+                       dtype=np.uint64, count=len(isbns))
+    return keys ^ _np_splitmix(np.array([seed], dtype=np.uint64))
+
+
+def _uniforms(keys, stream, count):
+    """Array of shape (len(keys), count) with draws 0..count-1 of a stream, in [0, 1)"""
+    counters = _np_splitmix(np.arange(count, dtype=np.uint64) + np.uint64(stream << 32))
+    bits = _np_splitmix(keys[:, None] ^ counters[None, :])
+    return (bits >> np.uint64(11)) * (1.0 / (1 << 53))
+
+
+def _randint(u, low, high):
+    """Integers in [low, high] from uniforms, like random.randint"""
+    return low + np.floor(u * (high - low + 1)).astype(np.int64)
+
+
+def _dates_from_codes(codes):
+    """YYYYMMDD integers to datetime64[D]"""
+    months = (codes // 10000 - 1970) * 12 + (codes // 100 % 100 - 1)
+    return months.astype('datetime64[M]').astype('datetime64[D]') + (codes % 100 - 1)
+
+
+def generate_inventory_batch(keys, today):
+    """
+    Batch version of generate_inventory_quantity(), generate_reorder_threshold()
+    and generate_last_restocked().
+
+    Returns:
+        tuple: (quantity, reorder_threshold, last_restocked) arrays
+    """
+    u = _uniforms(keys, _STREAM_INVENTORY, 6)
+    out_of_stock = u[:, 0] < 0.10
+    low = ~out_of_stock & (u[:, 1] < 0.30)
+    medium = ~out_of_stock & ~low & (u[:, 2] < 0.80)
+    quantity = np.select(
+        [out_of_stock, low, medium],
+        [0, _randint(u[:, 3], 1, 15), _randint(u[:, 3], 16, 75)],
+        _randint(u[:, 3], 76, 150),
+    )
+    threshold = np.select(
+        [quantity == 0, quantity < 20, quantity < 50],
+        [10, _randint(u[:, 4], 8, 12), _randint(u[:, 4], 12, 18)],
+        _randint(u[:, 4], 15, 25),
+    )
+    last_restocked = np.datetime64(today, 'D') - _randint(u[:, 5], 1, 90)
+    return quantity, threshold, last_restocked
+
+
+def generate_price_history_batch(keys, years):
+    """
+    Batch version of generate_price_history().
+
+    Args:
+        keys: isbn_keys() of the books
+        years: Publication years, None when unknown
+
+    Returns:
+        dict: one entry per price record, grouped by book in input order:
+            'book' (index into keys), 'position' (0 = first price of the book),
+            'cents', 'valid_from' and 'valid_until' (NaT for the current price)
+    """
+    current_year = 2026
+    slots = MAX_PRICES_PER_BOOK - 1  # price changes
+    years = np.array([current_year - 20 if y is None else y for y in years], dtype=np.int64)
+    years_since_pub = np.maximum(1, current_year - years)
+
+    u = _uniforms(keys, _STREAM_PRICES, 3 + 4 * slots)
+    u_months, u_days, u_factors, u_rounding = (u[:, 3 + i * slots:3 + (i + 1) * slots] for i in range(4))
+
+    # Exponential number of changes with mean years_since_pub / 2.5
+    scale = np.maximum(0.5, years_since_pub / 2.5)
+    num_changes = np.clip(np.floor(-np.log1p(-u[:, 0]) * scale).astype(np.int64) + 1, 1, MAX_PRICES_PER_BOOK)
+
+    base = np.select(
+        [years_since_pub < 3, years_since_pub < 10],
+        [35 + 30 * u[:, 1], 25 + 20 * u[:, 1]],
+        15 + 20 * u[:, 1],
+    )
+    prices = np.empty((len(keys), MAX_PRICES_PER_BOOK))
+    prices[:, 0] = np.maximum(7.99, np.floor(base) + np.where(u[:, 2] > 0.5, 0.99, 0.49))
+    for j in range(slots):
+        price = np.clip(prices[:, j] * (0.88 + 0.24 * u_factors[:, j]), 7.99, 75.99)
+        prices[:, j + 1] = np.floor(price) + np.where(u_rounding[:, j] > 0.5, 0.99, 0.49)
+
+    # Change dates as YYYYMMDD, spread across the years since publication
+    changes = np.arange(1, MAX_PRICES_PER_BOOK)
+    change_years = years[:, None] + changes[None, :] * years_since_pub[:, None] // num_changes[:, None]
+    codes = change_years * 10000 + _randint(u_months, 1, 12) * 100 + _randint(u_days, 1, 28)
+    first_day = years * 10000 + 101
+    codes[(changes[None, :] >= num_changes[:, None]) | (codes <= first_day[:, None])] = _DATE_NONE
+    codes.sort(axis=1)
+    # Equal dates would make an empty validity period
+    codes[:, 1:][codes[:, 1:] == codes[:, :-1]] = _DATE_NONE
+    codes.sort(axis=1)
+    changes_kept = (codes < _DATE_NONE).sum(axis=1)
+
+    book, position = np.nonzero(np.arange(MAX_PRICES_PER_BOOK)[None, :] <= changes_kept[:, None])
+    change_codes = np.concatenate([codes, np.full((len(keys), 1), _DATE_NONE)], axis=1)
+    from_codes = np.where(position == 0, first_day[book], change_codes[book, position - 1])
+    until_codes = change_codes[book, position]
+    valid_until = _dates_from_codes(np.where(until_codes == _DATE_NONE, first_day[book], until_codes))
+    valid_until[until_codes == _DATE_NONE] = np.datetime64('NaT')
+    return {
+        'book': book,
+        'position': position,
+        'cents': np.rint(prices[book, position] * 100).astype(np.int64),
+        'valid_from': _dates_from_codes(from_codes),
+        'valid_until': valid_until,
+    }
+
+
+def _strings(values, fmt):
+    """
+    Format an integer array through a lookup table of its value range.
+
+    Prices and dates take few distinct values, so this formats each value once
+    instead of once per row. Returns an object array for fast concatenation.
+    """
+    low = int(values.min())
+    table = np.array([fmt(v) for v in range(low, int(values.max()) + 1)], dtype=object)
+    return table[values - low]
+
+
+def _day_string(days):
+    return (date(1970, 1, 1) + timedelta(days=days)).isoformat()
+
+
+def write_inventory_sql_batch(f, isbns, keys, today):
+    """Write inventory VALUES rows for a batch of books; returns the number of rows"""
+    quantity, threshold, last_restocked = generate_inventory_batch(keys, today)
+    rows = (np.array([f"('{isbn}', " for isbn in isbns], dtype=object)
+            + _strings(threshold, lambda t: f"{t}, 0, ")
+            + _strings(quantity, lambda q: f"{q}, ")
+            + _strings(last_restocked.astype(np.int64), lambda d: f"'{_day_string(d)}')"))
+    f.write(',\n'.join(rows.tolist()))
+    return len(rows)
+
+
+def write_prices_sql_batch(f, isbns, keys, years):
+    """Write prices VALUES rows for a batch of books; returns the number of rows"""
+    history = generate_price_history_batch(keys, years)
+    valid_from = history['valid_from'].astype(np.int64)
+    current = np.isnat(history['valid_until'])
+    valid_until = np.where(current, valid_from, history['valid_until'].astype(np.int64))
+
+    until_strings = _strings(valid_until, lambda d: f"'{_day_string(d)}')")
+    until_strings[current] = 'NULL)'
+    rows = (np.array([f"('{isbn}', " for isbn in isbns], dtype=object)[history['book']]
+            + _strings(history['cents'], lambda c: f"{c // 100}.{c % 100:02d}, ")
+            + _strings(valid_from, lambda d: f"'{_day_string(d)}', ")
+            + until_strings)
+    f.write(',\n'.join(rows.tolist()))
+    return len(rows)
+
+
+def write_sql_batch(books, inventory_sql, prices_sql, today):
+    """
+    Write inventory and prices SQL for all books with the NumPy batch path.
+
+    Returns:
+        tuple: (inventory rows, price rows)
+    """
+    inventory_rows = price_rows = 0
+    buffering = 1 << 20
+    with open(inventory_sql, 'w', encoding='utf-8', buffering=buffering) as inv_f, \
+            open(prices_sql, 'w', encoding='utf-8', buffering=buffering) as price_f:
+        inv_f.write("-- Generated inventory for all books\n")
+        inv_f.write("-- Generated by generate_inventory.py --batch\n\n")
+        inv_f.write("INSERT INTO inventory (isbn, reorder_threshold, quantity_reserved, quantity, last_restocked) VALUES\n")
         price_f.write("-- Generated prices for all books\n")
-        price_f.write("-- Generated by generate_inventory.py\n")
+        price_f.write("-- Generated by generate_inventory.py --batch\n")
         price_f.write("-- Multiple price records per book showing price history\n\n")
         price_f.write("INSERT INTO prices (isbn, unit_price, valid_from, valid_until) VALUES\n")
-        
-        price_lines = []
-        for isbn, year in books:
-            price_history = generate_price_history(isbn, year)
-            for record in price_history:
-                line = f"('{record['isbn']}', {record['price']:.2f}, '{record['valid_from']}', {record['valid_until']})"
-                price_lines.append(line)
-        
-        price_f.write(',\n'.join(price_lines))
+
+        books = iter(books)
+        while batch := list(islice(books, BATCH_SIZE)):
+            isbns = [isbn for isbn, _ in batch]
+            keys = isbn_keys(isbns)
+            if inventory_rows:
+                inv_f.write(',\n')
+                price_f.write(',\n')
+            inventory_rows += write_inventory_sql_batch(inv_f, isbns, keys, today)
+            price_rows += write_prices_sql_batch(price_f, isbns, keys, [year for _, year in batch])
+
+        inv_f.write(';\n')
         price_f.write(';\n')
+    return inventory_rows, price_rows
+
+
+# ---------------------------------------------------------------------------
+# Scale-factor dataset generator
+# ---------------------------------------------------------------------------
+
+# Rows of one table generated by one task. Every chunk has its own random
+# stream, so the output depends on the seed only, not on the number of workers.
+CHUNK_SIZE = 10000
+
+# IDs are derived from the row number of the owning entity, so that chunks can
+# reference each other without coordination. Unused slots are simply skipped.
+MAX_PRICES_PER_BOOK = 10  # generate_price_history() makes at most 10 records
+MAX_ADDRESSES_PER_USER = 3
+MAX_ITEMS_PER_ORDER = 4
+
+CATEGORY_COUNT = 8  # categories inserted by create_tables.sql
+REFERENCE_DATE = date(2026, 1, 15)  # "today" of the generated data
+ORDERS_FROM = datetime(2020, 1, 1)
+
+TABLE_COLUMNS = {
+    'authors': ['author_id', 'name', 'surname'],
+    'books': ['isbn', 'title', 'publication_year'],
+    'authorship': ['isbn', 'author_id'],
+    'book_categories': ['isbn', 'category_id'],
+    'inventory': ['inventory_id', 'isbn', 'reorder_threshold', 'quantity_reserved', 'quantity', 'last_restocked'],
+    'prices': ['price_id', 'isbn', 'unit_price', 'valid_from', 'valid_until'],
+    'users': ['user_id', 'name', 'surname', 'passhash', 'email', 'email_verified', 'phone'],
+    'addresses': ['address_id', 'user_id', 'street', 'building_nr', 'apartment_nr', 'city',
+                  'postal_code', 'country', 'is_primary'],
+    'orders': ['order_id', 'shipping_address_id', 'billing_address_id', 'order_time',
+               'payment_time', 'shipment_time', 'status_id'],
+    'order_items': ['id', 'order_id', 'order_time', 'price_id', 'quantity'],
+    'reviews': ['review_id', 'user_id', 'isbn', 'review_date', 'review_body', 'stars'],
+}
+
+# Tables written by the task of each entity
+ENTITY_TABLES = {
+    'authors': ['authors'],
+    'books': ['books', 'authorship', 'book_categories', 'inventory', 'prices'],
+    'users': ['users', 'addresses'],
+    'orders': ['orders', 'order_items'],
+    'reviews': ['reviews'],
+}
+
+FIRST_NAMES = ['Jan', 'Anna', 'Piotr', 'Katarzyna', 'Michal', 'Magdalena', 'Tomasz', 'Agnieszka',
+               'Krzysztof', 'Joanna', 'Marcin', 'Ewa', 'Pawel', 'Monika', 'Adam', 'Zofia']
+SURNAMES = ['Kowalski', 'Nowak', 'Wisniewski', 'Wojcik', 'Kaminski', 'Lewandowski', 'Zielinski',
+            'Szymanski', 'Dabrowski', 'Kozlowski', 'Jankowski', 'Mazur', 'Krawczyk', 'Piotrowski']
+TITLE_WORDS = ['Database', 'Systems', 'Politics', 'Introduction', 'History', 'Theory', 'Design',
+               'Programming', 'Biology', 'Medicine', 'Psychology', 'Horror', 'Modern', 'Practical',
+               'Advanced', 'Essays', 'Guide', 'Principles', 'Studies', 'Literature']
+CITIES = [('Wroclaw', '50'), ('Krakow', '31'), ('Warszawa', '00'), ('Gdansk', '80'),
+          ('Poznan', '60'), ('Lodz', '90')]
+STREETS = ['ul. Rynek', 'ul. Dluga', 'ul. Krotka', 'ul. Polna', 'ul. Lesna', 'ul. Ogrodowa']
+REVIEW_BODIES = ['Gorąco polecam', 'Bardzo dobra książka', 'Przeciętna', 'Nie polecam',
+                 'Świetne wprowadzenie do tematu', None]
+
+_MASK64 = (1 << 64) - 1
+
+
+def _mix(*values):
+    """SplitMix64-style hash of integers, used to seed per-entity random streams"""
+    h = 0x9E3779B97F4A7C15
+    for value in values:
+        h = (h ^ value) & _MASK64
+        h = ((h ^ (h >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+        h = ((h ^ (h >> 27)) * 0x94D049BB133111EB) & _MASK64
+        h ^= h >> 31
+    return h
+
+
+def _table_code(name):
+    return int(hashlib.md5(name.encode()).hexdigest()[:8], 16)
+
+
+def synthetic_isbn(book_index):
+    """Valid ISBN-13 in the 979 range (the example data uses 978)"""
+    digits = f"979{book_index:09d}"
+    checksum = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits))
+    return digits + str((10 - checksum % 10) % 10)
+
+
+def address_count(seed, user_index):
+    """Number of addresses of a user, without generating the user"""
+    return 1 + _mix(seed, _table_code('addresses'), user_index) % MAX_ADDRESSES_PER_USER
+
+
+@lru_cache(maxsize=100000)
+def synthetic_book(seed, book_index, author_count):
+    """Book attributes other tables refer to: (isbn, title, year, author indexes)"""
+    rng = random.Random(_mix(seed, _table_code('books'), book_index))
+    isbn = synthetic_isbn(book_index)
+    title = ' '.join(rng.sample(TITLE_WORDS, rng.randint(1, 4)))
+    year = rng.randint(1950, REFERENCE_DATE.year - 1) if rng.random() > 0.3 else None
+    authors = rng.sample(range(author_count), min(author_count, rng.randint(1, 3)))
+    return isbn, title, year, authors
+
+
+@lru_cache(maxsize=100000)
+def _book_price_history(isbn, year, book_index):
+    prices = []
+    for k, record in enumerate(generate_price_history(isbn, year)):
+        valid_until = None if record['valid_until'] == 'NULL' else record['valid_until'].strip("'")
+        prices.append((book_index * MAX_PRICES_PER_BOOK + k + 1, f"{record['price']:.2f}",
+                       record['valid_from'], valid_until))
+    return prices
+
+
+def book_prices(config, book_indexes):
+    """
+    Price history of the given books.
+
+    Returns:
+        dict: book index -> [(price_id, unit_price, valid_from, valid_until)],
+            oldest first, dates as YYYY-MM-DD strings
+    """
+    books = [synthetic_book(config['seed'], i, config['authors']) for i in book_indexes]
+    if not books:
+        return {}
+    if not config['batch']:
+        return {i: _book_price_history(book[0], book[2], i) for i, book in zip(book_indexes, books)}
+
+    history = generate_price_history_batch(isbn_keys([book[0] for book in books], config['seed']),
+                                           [book[2] for book in books])
+    indexes = np.asarray(book_indexes)[history['book']]
+    columns = zip(
+        (indexes * MAX_PRICES_PER_BOOK + history['position'] + 1).tolist(),
+        _strings(history['cents'], lambda c: f"{c // 100}.{c % 100:02d}").tolist(),
+        np.datetime_as_string(history['valid_from']).tolist(),
+        [None if d is None else d.isoformat() for d in history['valid_until'].tolist()],
+    )
+    prices = {i: [] for i in book_indexes}
+    for book, record in zip(indexes.tolist(), columns):
+        prices[book].append(record)
+    return prices
+
+
+def book_inventory(config, rng, isbns):
+    """(reorder_threshold, quantity, last_restocked) of each book"""
+    if config['batch']:
+        quantity, threshold, last_restocked = generate_inventory_batch(
+            isbn_keys(isbns, config['seed']), REFERENCE_DATE)
+        return list(zip(threshold.tolist(), quantity.tolist(), last_restocked.tolist()))
+
+    inventory = []
+    for isbn in isbns:
+        quantity = generate_inventory_quantity(isbn)
+        threshold = generate_reorder_threshold(quantity)
+        inventory.append((threshold, quantity, REFERENCE_DATE - timedelta(days=rng.randint(1, 90))))
+    return inventory
+
+
+def _price_at(prices, day):
+    """price_id valid on the given YYYY-MM-DD day, or None before the first price"""
+    starts = [valid_from for _, _, valid_from, _ in prices]
+    position = bisect.bisect_right(starts, day) - 1
+    return prices[position][0] if position >= 0 else None
+
+
+def _author_rows(config, rng, start, stop):
+    for i in range(start, stop):
+        yield 'authors', (f"author_{i}", rng.choice(FIRST_NAMES), rng.choice(SURNAMES))
+
+
+def _book_rows(config, rng, start, stop):
+    indexes = range(start, stop)
+    books = [synthetic_book(config['seed'], i, config['authors']) for i in indexes]
+    prices = book_prices(config, indexes)
+    inventory = book_inventory(config, rng, [book[0] for book in books])
+
+    for i, (isbn, title, year, authors), (threshold, quantity, last_restocked) in zip(indexes, books, inventory):
+        yield 'books', (isbn, title, year)
+        for author in authors:
+            yield 'authorship', (isbn, f"author_{author}")
+        for category in rng.sample(range(1, CATEGORY_COUNT + 1), rng.randint(1, 2)):
+            yield 'book_categories', (isbn, category)
+        yield 'inventory', (i + 1, isbn, threshold, 0, quantity, last_restocked)
+        for price_id, unit_price, valid_from, valid_until in prices[i]:
+            yield 'prices', (price_id, isbn, unit_price, valid_from, valid_until)
+
+
+def _user_rows(config, rng, start, stop):
+    for i in range(start, stop):
+        user_id = i + 1
+        name, surname = rng.choice(FIRST_NAMES), rng.choice(SURNAMES)
+        passhash = hashlib.sha256(f"password{user_id}".encode()).hexdigest()
+        email = f"{name}.{surname}.{user_id}@example.com".lower()
+        phone = f"+48 5{rng.randint(0, 99):02d} {rng.randint(0, 999):03d} {rng.randint(0, 999):03d}" \
+            if rng.random() > 0.2 else None
+        yield 'users', (user_id, name, surname, passhash, email, rng.random() > 0.3, phone)
+
+        for k in range(address_count(config['seed'], i)):
+            city, postal_prefix = rng.choice(CITIES)
+            apartment = rng.randint(1, 60) if rng.random() > 0.4 else None
+            yield 'addresses', (i * MAX_ADDRESSES_PER_USER + k + 1, user_id, rng.choice(STREETS),
+                                rng.randint(1, 200), apartment, city,
+                                f"{postal_prefix}-{rng.randint(0, 999):03d}", 'Polska', k == 0)
+
+
+def _order_rows(config, rng, start, stop):
+    span = int((datetime.combine(REFERENCE_DATE, datetime.min.time()) - ORDERS_FROM).total_seconds())
+    orders = []
+    for i in range(start, stop):
+        user = rng.randrange(config['users'])
+        addresses = address_count(config['seed'], user)
+        shipping = user * MAX_ADDRESSES_PER_USER + rng.randrange(addresses) + 1
+        billing = shipping if rng.random() > 0.2 else user * MAX_ADDRESSES_PER_USER + rng.randrange(addresses) + 1
+
+        order_time = ORDERS_FROM + timedelta(seconds=rng.randrange(span))
+        # 1='Oczekujące', 2='W realizacji', 3='Wysłane', 4='Dostarczone', 5='Anulowane'
+        status = rng.choices([1, 2, 3, 4, 5], weights=[5, 5, 10, 75, 5])[0]
+        payment_time = order_time + timedelta(minutes=rng.randint(1, 60)) if status in (2, 3, 4) else None
+        shipment_time = payment_time + timedelta(hours=rng.randint(2, 72)) if status in (3, 4) else None
+
+        books = rng.sample(range(config['books']), min(config['books'], rng.randint(1, MAX_ITEMS_PER_ORDER)))
+        quantities = rng.choices([1, 2, 3, 5], weights=[70, 20, 7, 3], k=len(books))
+        orders.append((i + 1, shipping, billing, order_time, payment_time, shipment_time, status,
+                       list(zip(books, quantities))))
+
+    # Price histories of all books sold in the chunk, computed at once
+    prices = book_prices(config, sorted({book for order in orders for book, _ in order[-1]}))
+    for order in orders:
+        order_id, order_time, items = order[0], order[3], order[-1]
+        yield 'orders', order[:-1]
+
+        # Items are sold at the price valid on the order day; books published
+        # later are skipped
+        day = order_time.strftime('%Y-%m-%d')
+        for k, (book, quantity) in enumerate(items):
+            price_id = _price_at(prices[book], day)
+            if price_id is not None:
+                yield 'order_items', ((order_id - 1) * MAX_ITEMS_PER_ORDER + k + 1, order_id, order_time,
+                                      price_id, quantity)
+
+
+def _review_rows(config, rng, start, stop):
+    for i in range(start, stop):
+        isbn = synthetic_book(config['seed'], rng.randrange(config['books']), config['authors'])[0]
+        review_date = ORDERS_FROM + timedelta(minutes=rng.randrange(6 * 365 * 24 * 60))
+        yield 'reviews', (i + 1, rng.randrange(config['users']) + 1, isbn, review_date,
+                          rng.choice(REVIEW_BODIES), rng.choices(range(6), weights=[1, 3, 5, 15, 35, 41])[0])
+
+
+ENTITY_GENERATORS = {
+    'authors': _author_rows,
+    'books': _book_rows,
+    'users': _user_rows,
+    'orders': _order_rows,
+    'reviews': _review_rows,
+}
+
+
+def generate_chunk(task):
+    """Write one chunk of an entity as CSV part files; returns rows written per table"""
+    entity, chunk, config = task
+    start = chunk * CHUNK_SIZE
+    stop = min(start + CHUNK_SIZE, config[entity])
+    rng = random.Random(_mix(config['seed'], _table_code(entity), chunk))
+
+    out_dir = Path(config['out'])
+    files, writers, counts = [], {}, {}
+    try:
+        for table in ENTITY_TABLES[entity]:
+            f = open(out_dir / table / f"part-{chunk:05d}.csv", 'w', encoding='utf-8', newline='')
+            files.append(f)
+            writers[table] = csv.writer(f)
+            writers[table].writerow(TABLE_COLUMNS[table])
+            counts[table] = 0
+        for table, row in ENTITY_GENERATORS[entity](config, rng, start, stop):
+            writers[table].writerow(row)
+            counts[table] += 1
+    finally:
+        for f in files:
+            f.close()
+    return counts
+
+
+def generate_dataset(out_dir, books, users, orders, reviews, seed=42, workers=None, batch=False):
+    """
+    Generate a consistent dataset for every table as CSV files for COPY.
+
+    Each table gets a directory of part files with a header row. Rows carry
+    explicit IDs, so the parts can be loaded in any order into an empty schema.
+    With batch=True inventory and prices come from the NumPy batch path.
+
+    Returns:
+        dict: rows written per table
+    """
+    if books < 1:
+        raise ValueError("at least one book is needed")
+    if (orders or reviews) and users < 1:
+        raise ValueError("orders and reviews need at least one user")
+    config = {
+        'out': str(out_dir),
+        'seed': seed,
+        'authors': max(1, books * 7 // 10),
+        'books': books,
+        'users': users,
+        'orders': orders,
+        'reviews': reviews,
+        'batch': batch,
+    }
+    for table in TABLE_COLUMNS:
+        table_dir = Path(out_dir) / table
+        table_dir.mkdir(parents=True, exist_ok=True)
+        for stale in table_dir.glob('part-*.csv'):
+            stale.unlink()
+
+    tasks = [
+        (entity, chunk, config)
+        for entity in ENTITY_GENERATORS
+        for chunk in range((config[entity] + CHUNK_SIZE - 1) // CHUNK_SIZE)
+    ]
+    totals = dict.fromkeys(TABLE_COLUMNS, 0)
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        for counts in executor.map(generate_chunk, tasks):
+            for table, count in counts.items():
+                totals[table] += count
+    return totals
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--books', type=int, help='number of books (enables the scale-factor generator)')
+    parser.add_argument('--users', type=int, help='number of users')
+    parser.add_argument('--orders', type=int, help='number of orders')
+    parser.add_argument('--reviews', type=int, help='number of reviews')
+    parser.add_argument('--seed', type=int, default=42, help='random seed (default: 42)')
+    parser.add_argument('--workers', type=int, help='generator processes (default: CPU count)')
+    parser.add_argument('--batch', action='store_true',
+                        help='generate inventory and prices with NumPy, many ISBNs at a time')
+    parser.add_argument('--out', type=Path, default=Path(__file__).parent / 'generated_data',
+                        help='output directory for the CSV files (default: db/generated_data)')
+    return parser.parse_args(argv)
+
+
+def scale_main(args):
+    counts = {
+        'books': 20000 if args.books is None else args.books,
+        'users': 10000 if args.users is None else args.users,
+        'orders': 100000 if args.orders is None else args.orders,
+        'reviews': 50000 if args.reviews is None else args.reviews,
+    }
+    print(f"Generating {', '.join(f'{n} {entity}' for entity, n in counts.items())} "
+          f"(seed {args.seed}) into {args.out}...")
+    started = datetime.now()
+    totals = generate_dataset(args.out, seed=args.seed, workers=args.workers, batch=args.batch, **counts)
+    for table, count in totals.items():
+        print(f"  {table:<16} {count:>12,} rows")
+    print(f"✓ Generated {sum(totals.values()):,} rows in {(datetime.now() - started).total_seconds():.1f}s")
+    print(f"\nLoad with: python db_loader.py --csv {args.out}")
+
+def main(batch=False):
+    script_dir = Path(__file__).parent
+    books_sql = script_dir / 'example_data' / 'books.sql'
+    inventory_sql = script_dir / 'example_data' / 'inventory_generated.sql'
+    prices_sql = script_dir / 'example_data' / 'prices_generated.sql'
     
+    print(f"Generating inventory and prices for the books in {books_sql}...")
+    books = parse_books(books_sql)
+
+    if batch:
+        inventory_count, price_count = write_sql_batch(books, inventory_sql, prices_sql, datetime.now().date())
+    else:
+        inventory_count, price_count = write_sql(books, inventory_sql, prices_sql)
+
     print(f"✓ Generated {inventory_sql}")
     print(f"✓ Generated {prices_sql}")
-    print(f"\nGenerated {len(books)} inventory records")
-    
-    # Count total price records
-    total_prices = sum(len(generate_price_history(isbn, year)) for isbn, year in books[:100])
-    avg_prices_per_book = total_prices / 100
-    print(f"Average ~{avg_prices_per_book:.1f} price records per book (showing price history)")
+    print(f"\nGenerated {inventory_count} inventory records")
+    print(f"Average ~{price_count / max(1, inventory_count):.1f} price records per book (showing price history)")
     print("\nYou can now:")
     print("1. Review the generated files")
     print("2. Rename inventory.sql → inventory_old.sql")
@@ -212,4 +796,10 @@ def main():
     print("4. Update db_loader.py to load prices_generated.sql")
 
 if __name__ == '__main__':
-    main()
+    args = parse_args()
+    if args.batch and np is None:
+        raise SystemExit("--batch needs NumPy (pip install numpy)")
+    if any(n is not None for n in (args.books, args.users, args.orders, args.reviews)):
+        scale_main(args)
+    else:
+        main(batch=args.batch)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Maintenance of the monthly partitions of orders and order_items.
+
+Creates the partitions of the coming months before orders arrive for them,
+and archives old months: months whose orders are all delivered or cancelled
+are detached and moved to the `archive` schema, so queries, indexes and
+vacuum of the live tables only deal with the recent ones. Run it regularly,
+e.g. daily from cron:
+
+    python order_partitions.py                  # partitions for the next 12 months
+    python order_partitions.py --archive 24     # and archive months older than 24 months
+"""
+
+import argparse
+
+try:
+    from db_loader import get_db_connection, load_env
+except ImportError:  # imported as db.order_partitions
+    from db.db_loader import get_db_connection, load_env
+
+
+# Months ahead of the current one that always have partitions
+DEFAULT_MONTHS_AHEAD = 12
+
+
+def create_future_partitions(conn, months_ahead=DEFAULT_MONTHS_AHEAD):
+    """
+    Create the partitions of the current month and the next months_ahead months.
+
+    Returns:
+        int: Number of months whose partitions were created
+    """
+    created = conn.execute(
+        """
+        SELECT create_order_partitions(
+            date_trunc('month', NOW())::DATE,
+            (date_trunc('month', NOW()) + make_interval(months => %s::INTEGER + 1))::DATE
+        )
+        """,
+        (months_ahead,),
+    ).fetchone()[0]
+    conn.commit()
+    return created
+
+
+def archive_partitions(conn, keep_months):
+    """
+    Archive the months before the last keep_months months (not counting the
+    current one) whose orders are all delivered or cancelled.
+
+    Orders and order_items are locked while the months are checked and
+    detached, so this briefly blocks new orders.
+
+    Returns:
+        list: First days of the archived months
+    """
+    months = conn.execute(
+        """
+        SELECT archive_order_partitions(
+            (date_trunc('month', NOW()) - make_interval(months => %s::INTEGER))::DATE
+        )
+        """,
+        (keep_months,),
+    ).fetchall()
+    conn.commit()
+    return [month for (month,) in months]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create and archive monthly partitions of orders.")
+    parser.add_argument('--ahead', type=int, default=DEFAULT_MONTHS_AHEAD, metavar='MONTHS',
+                        help=f'months to create partitions for (default: {DEFAULT_MONTHS_AHEAD})')
+    parser.add_argument('--archive', type=int, metavar='MONTHS',
+                        help='archive finished months older than this many months')
+    args = parser.parse_args(argv)
+
+    load_env()
+    with get_db_connection() as conn:
+        created = create_future_partitions(conn, args.ahead)
+        print(f"Created partitions for {created} months")
+        if args.archive is not None:
+            archived = archive_partitions(conn, args.archive)
+            print(f"Archived {len(archived)} months" +
+                  (f": {', '.join(month.strftime('%Y-%m') for month in archived)}" if archived else ""))
+
+
+if __name__ == '__main__':
+    main()
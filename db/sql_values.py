@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Streaming reader for the `INSERT ... VALUES` files in example_data.
+
+The files are read line by line and rows are yielded as they are parsed, so
+memory use does not grow with the file. String literals may contain commas,
+semicolons, parentheses, doubled quotes and line breaks.
+
+Used by generate_inventory.py (to read books.sql) and db_loader.py (to send
+the example data through COPY). Run as a script it converts SQL files to CSV
+files for COPY, laid out as `python db_loader.py --csv DIR` expects:
+
+    python sql_values.py --out DIR example_data/authors.sql example_data/books.sql ...
+"""
+
+import argparse
+import re
+from pathlib import Path
+
+_TOKEN_RE = re.compile(r"""
+    (?P<skip>\s+|--[^\n]*)
+  | (?P<string>'(?:[^']|'')*'(?!'))
+  | (?P<open>'(?:[^']|'')*\Z)          # string that continues on the next line
+  | (?P<punct>[(),;])
+  | (?P<word>[^\s(),;']+)              # numbers, keywords, names
+""", re.VERBOSE)
+_NUMBER_RE = re.compile(r"[-+]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][-+]?\d+)?")
+
+# Columns of the example data tables whose INSERTs have no column list
+# (the leading columns of the table, as in create_tables.sql)
+LEADING_COLUMNS = {
+    'books': ['isbn', 'title', 'publication_year'],
+    'authorship': ['isbn', 'author_id'],
+    'book_categories': ['isbn', 'category_id'],
+}
+
+
+class NotLiteralInsert(ValueError):
+    """Statement is not an INSERT ... VALUES of literals."""
+
+    def __init__(self, token):
+        super().__init__(f"not an INSERT ... VALUES of literals near {token!r}")
+        self.token = token
+
+
+def _tokenize(lines):
+    """Yield (token, source text since the previous token) from lines of SQL."""
+    skipped = ''
+    carry = ''
+    for line in lines:
+        text = carry + line
+        carry = ''
+        for match in _TOKEN_RE.finditer(text):
+            kind = match.lastgroup
+            if kind == 'open':
+                carry = match.group()
+                break
+            if kind == 'skip':
+                skipped += match.group()
+                continue
+            yield match.group(), skipped + match.group()
+            skipped = ''
+    if carry:
+        # Unterminated string; rejected by literal_value()
+        yield carry, skipped + carry
+
+
+class TokenStream:
+    """Tokens of SQL lines, optionally keeping the source text read so far."""
+
+    def __init__(self, lines, keep_source=False):
+        self._tokens = _tokenize(lines)
+        self.source = [] if keep_source else None
+
+    def next(self):
+        """Next token, or None at the end of the input."""
+        for token, source in self._tokens:
+            if self.source is not None:
+                self.source.append(source)
+            return token
+        return None
+
+
+def _is_name(token):
+    return token is not None and token not in ('(', ')', ',', ';') and not token.startswith("'")
+
+
+def literal_value(token):
+    """COPY text of a literal token: None for NULL, strings unquoted."""
+    if token is None:
+        raise NotLiteralInsert(token)
+    if token.startswith("'"):
+        if len(token) < 2 or not token.endswith("'"):
+            raise NotLiteralInsert(token)
+        return token[1:-1].replace("''", "'")
+    if token.upper() == 'NULL':
+        return None
+    if token.upper() in ('TRUE', 'FALSE') or _NUMBER_RE.fullmatch(token):
+        return token
+    raise NotLiteralInsert(token)
+
+
+def _parse_header(token, tokens):
+    """Parse `INSERT INTO table [(columns)] VALUES`; returns (table, columns or None)."""
+    if token.upper() != 'INSERT':
+        raise NotLiteralInsert(token)
+    token = tokens.next()
+    if token is None or token.upper() != 'INTO':
+        raise NotLiteralInsert(token)
+    table = tokens.next()
+    if not _is_name(table):
+        raise NotLiteralInsert(table)
+
+    columns = None
+    token = tokens.next()
+    if token == '(':
+        columns = []
+        while token != ')':
+            token = tokens.next()
+            if not _is_name(token):
+                raise NotLiteralInsert(token)
+            columns.append(token)
+            token = tokens.next()
+            if token not in (',', ')'):
+                raise NotLiteralInsert(token)
+        token = tokens.next()
+    if token is None or token.upper() != 'VALUES':
+        raise NotLiteralInsert(token)
+    return table, columns
+
+
+def _parse_rows(tokens):
+    """Yield the value tuples of a VALUES list, up to its `;`."""
+    while True:
+        token = tokens.next()
+        if token != '(':
+            raise NotLiteralInsert(token)
+        row = []
+        while token != ')':
+            row.append(literal_value(tokens.next()))
+            token = tokens.next()
+            if token not in (',', ')'):
+                raise NotLiteralInsert(token)
+        yield tuple(row)
+
+        token = tokens.next()
+        if token in (';', None):
+            return
+        if token != ',':
+            raise NotLiteralInsert(token)
+
+
+def _lines(source):
+    return source.splitlines(keepends=True) if isinstance(source, str) else source
+
+
+def iter_inserts(source):
+    """
+    Read INSERT statements lazily.
+
+    Args:
+        source: SQL text, or an iterable of lines such as an open file
+
+    Yields:
+        (table, columns or None, rows) per statement, where rows is an
+        iterator of value tuples that must be consumed before the next
+        statement is read. Values are strings as COPY expects them, None
+        for NULL.
+
+    Raises:
+        NotLiteralInsert: On a statement that is not an INSERT of literals.
+    """
+    tokens = TokenStream(_lines(source))
+    while True:
+        token = tokens.next()
+        if token is None:
+            return
+        if token == ';':
+            continue
+        table, columns = _parse_header(token, tokens)
+        rows = _parse_rows(tokens)
+        yield table, columns, rows
+        for _ in rows:  # skip whatever the caller did not read
+            pass
+
+
+def split_statements(source):
+    """
+    Split SQL into statements, parsing INSERTs of literals.
+
+    Unlike iter_inserts(), every statement is read whole, so that statements
+    that are not INSERTs of literals can be passed through unchanged.
+
+    Yields:
+        (table, columns or None, list of rows) for every INSERT whose values
+        are all literals, and the original SQL text for any other statement.
+    """
+    tokens = TokenStream(_lines(source), keep_source=True)
+    while True:
+        tokens.source = []
+        token = tokens.next()
+        if token is None:
+            return
+        if token == ';':
+            continue
+        try:
+            table, columns = _parse_header(token, tokens)
+            yield table, columns, list(_parse_rows(tokens))
+        except NotLiteralInsert as exc:
+            token = exc.token
+            while token not in (';', None):
+                token = tokens.next()
+            yield ''.join(tokens.source)
+
+
+def _csv_line(values):
+    """
+    CSV line for COPY: NULL as an empty field, every other value quoted.
+
+    COPY reads only an unquoted empty field as NULL, so '' has to be quoted
+    to stay an empty string (csv.writer leaves it unquoted).
+    """
+    return ','.join(
+        '' if value is None else '"' + value.replace('"', '""') + '"' for value in values
+    ) + '\n'
+
+
+def sql_to_csv(sql_path, out_dir):
+    """
+    Convert the INSERT statements of a SQL file to CSV files for COPY.
+
+    Each statement becomes out_dir/<table>/<file name>-<n>.csv with a header
+    row of column names, written row by row. NULL is written as an empty
+    field and '' as "", as COPY (FORMAT csv) reads them.
+
+    Returns:
+        dict: rows written per table
+    """
+    sql_path = Path(sql_path)
+    counts = {}
+    written = []
+    try:
+        with open(sql_path, 'r', encoding='utf-8') as f:
+            for number, (table, columns, rows) in enumerate(iter_inserts(f)):
+                first = next(rows, None)
+                if first is None:
+                    continue
+                if columns is None:
+                    columns = LEADING_COLUMNS.get(table)
+                    if columns is None or len(columns) < len(first):
+                        raise ValueError(f"INSERT INTO {table} needs a column list")
+                    columns = columns[:len(first)]
+
+                table_dir = Path(out_dir) / table
+                table_dir.mkdir(parents=True, exist_ok=True)
+                csv_path = table_dir / f"{sql_path.stem}-{number:03d}.csv"
+                written.append(csv_path)
+                with open(csv_path, 'w', encoding='utf-8', newline='') as out:
+                    out.write(_csv_line(columns))
+                    out.write(_csv_line(first))
+                    count = 1
+                    for row in rows:
+                        out.write(_csv_line(row))
+                        count += 1
+                counts[table] = counts.get(table, 0) + count
+    except ValueError:
+        # Half a file would load as if it were complete
+        for csv_path in written:
+            csv_path.unlink(missing_ok=True)
+        raise
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert INSERT ... VALUES files to CSV for COPY.")
+    parser.add_argument('files', nargs='+', type=Path, help='SQL files to convert')
+    parser.add_argument('--out', type=Path, required=True, help='output directory')
+    args = parser.parse_args(argv)
+
+    for sql_path in args.files:
+        try:
+            counts = sql_to_csv(sql_path, args.out)
+        except ValueError as exc:
+            print(f"✗ {sql_path.name}: {exc}")
+            continue
+        for table, count in counts.items():
+            print(f"✓ {sql_path.name}: {count} {table} rows")
+
+
+if __name__ == '__main__':
+    main()
@@ -27,7 +27,7 @@ function createWindow() {
 
 function startPythonBackend() {
   const pythonExecutable = process.platform === 'win32' ? 'python' : 'python3';
-  const scriptPath = path.join(__dirname, 'backend', 'app.py');
+  const scriptPath = path.join(__dirname, 'backend', 'serve.py');
   
   console.log(`Starting Python backend: ${pythonExecutable} ${scriptPath}`);
 
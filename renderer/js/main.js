@@ -183,7 +183,7 @@ document.addEventListener('keydown', async (e) => {
 
 // Initial load - Poll until backend is ready
 const checkBackend = setInterval(() => {
-    fetch(`${API_URL}/user_order_summary`)
+    fetch(`${API_URL}/user_order_summary?limit=1`)
         .then(res => {
             if (res.ok) {
                 clearInterval(checkBackend);
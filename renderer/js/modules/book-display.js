@@ -166,22 +166,12 @@ async function showBookDetail(isbn, apiUrl) {
     content.innerHTML = '<p>Loading book details...</p>';
 
     try {
-        // Fetch book details, reviews, and price history in parallel
-        const [bookRes, reviewsRes, pricesRes, authorsRes] = await Promise.all([
-            fetch(`${apiUrl}/books/${isbn}`),
-            fetch(`${apiUrl}/books/${isbn}/reviews`),
-            fetch(`${apiUrl}/price/${isbn}`),
-            fetch(`${apiUrl}/books/${isbn}/authors`)
-        ]);
-
-        const [bookData, reviews, prices, authors] = await Promise.all([
-            bookRes.json(),
-            reviewsRes.json(),
-            pricesRes.json(),
-            authorsRes.json()
-        ]);
-
-        const book = bookData[0] || {};
+        // Book details, reviews, price history and authors in one request
+        const response = await fetch(`${apiUrl}/books/${isbn}/full`);
+        if (!response.ok) throw new Error('Failed to fetch book details');
+
+        const book = await response.json();
+        const { reviews, prices, authors } = book;
         renderBookDetail(isbn, book, reviews, prices, authors);
     } catch (error) {
         console.error('Error fetching book details:', error);
@@ -195,10 +185,8 @@ function renderBookDetail(isbn, book, reviews, prices, authors) {
     // Format authors
     const authorNames = authors.map(a => `${a.name} ${a.surname}`).join(', ') || 'Unknown';
 
-    // Calculate average rating from reviews
-    const avgRating = reviews.length > 0
-        ? (reviews.reduce((sum, r) => sum + r.stars, 0) / reviews.length).toFixed(1)
-        : 'N/A';
+    // Average rating comes precomputed with the book summary
+    const avgRating = book.stars != null ? parseFloat(book.stars).toFixed(1) : 'N/A';
 
     // Current price
     const currentPrice = book.unit_price ? `${parseFloat(book.unit_price).toFixed(2)} zł` : 'N/A';
@@ -211,7 +199,7 @@ function renderBookDetail(isbn, book, reviews, prices, authors) {
                 <p><strong>Authors:</strong> ${authorNames}</p>
                 <p><strong>Publication Year:</strong> ${book.publication_year || 'N/A'}</p>
                 <p><strong>Current Price:</strong> ${currentPrice}</p>
-                <p><strong>Rating:</strong> ${avgRating}${avgRating !== 'N/A' ? ' / 5' : ''} (${reviews.length} reviews)</p>
+                <p><strong>Rating:</strong> ${avgRating}${avgRating !== 'N/A' ? ' / 5' : ''} (${book.review_count ?? reviews.length} reviews)</p>
                 <p><strong>In Stock:</strong> ${book.quantity || 0}</p>
             </div>
         </div>
@@ -1,56 +1,52 @@
-// ============= BOOK SEARCH WITH FUZZY MATCHING =============
+// ============= BOOK SEARCH (SERVER-SIDE) =============
 
+// Books from the latest search response, used to resolve the selected ISBN
 let booksCache = [];
-let booksFuse = null;
+let booksSearchApiUrl = null;
 let highlightedBookIndex = -1;
+let bookSearchTimer = null;
+let bookSearchRequestId = 0;
+
+const BOOK_SEARCH_DEBOUNCE_MS = 150;
 
 async function fetchBooksForSearch(apiUrl) {
+    // Searching happens on the backend (/books/search), nothing to preload
+    booksSearchApiUrl = apiUrl;
+}
+
+function toSearchBook(book) {
+    // Each result has: isbn, title, publication_year, unit_price, available_quantity,
+    // authors: [{author_id, name, surname}], title_highlight, authors_highlight
+    const authorDisplay = book.authors
+        .map(author => author.surname ? `${author.name} ${author.surname}` : author.name)
+        .join(', ');
+
+    return {
+        isbn: book.isbn,
+        title: book.title,
+        publication_year: book.publication_year,
+        authors: book.authors,
+        authorDisplay: authorDisplay || 'Unknown Author',
+        titleHighlight: book.title_highlight || book.title,
+        authorHighlight: book.authors_highlight || authorDisplay || 'Unknown Author',
+        price: parseFloat(book.unit_price || 0),
+        available_quantity: parseInt(book.available_quantity || 0)
+    };
+}
+
+async function searchBooks(searchTerm, resultsElement) {
+    // Ignore responses that arrive after a newer search was started
+    const requestId = ++bookSearchRequestId;
     try {
-        const response = await fetch(`${apiUrl}/books`);
-        if (!response.ok) throw new Error('Failed to fetch books');
+        const response = await fetch(`${booksSearchApiUrl}/books/search?q=${encodeURIComponent(searchTerm)}&limit=10`);
+        if (!response.ok) throw new Error('Failed to search books');
         const books = await response.json();
-        
-        // Transform books data for search
-        // Each book has: isbn, title, publication_year, unit_price, authors: [{author_id, name, surname}]
-        booksCache = books.map(book => {
-            // Create searchable author string
-            const authorString = book.authors
-                .map(author => `${author.name} ${author.surname}`)
-                .join(' ');
-            
-            // Create display author string
-            const authorDisplay = book.authors
-                .map(author => `${author.name} ${author.surname}`)
-                .join(', ');
-            
-            return {
-                isbn: book.isbn,
-                title: book.title,
-                publication_year: book.publication_year,
-                authors: book.authors,
-                authorString: authorString,
-                authorDisplay: authorDisplay || 'Unknown Author',
-                price: parseFloat(book.unit_price || 0),
-                available_quantity: parseInt(book.available_quantity || 0)
-            };
-        });
-        
-        // Initialize Fuse.js for fuzzy search
-        booksFuse = new Fuse(booksCache, {
-            keys: [
-                { name: 'isbn', weight: 0.5 },
-                { name: 'title', weight: 0.35 },
-                { name: 'authorString', weight: 0.15 }
-            ],
-            threshold: 0.3,
-            includeMatches: true,
-            minMatchCharLength: 2,
-            ignoreLocation: true
-        });
-        
-        console.log(`Loaded ${booksCache.length} books for search`);
+        if (requestId !== bookSearchRequestId) return;
+
+        booksCache = books.map(toSearchBook);
+        displayBookResults(booksCache, resultsElement);
     } catch (error) {
-        console.error('Error fetching books:', error);
+        console.error('Error searching books:', error);
     }
 }
 
@@ -66,6 +62,8 @@ function initBookSearch(inputElement, resultsElement, onBookSelected) {
         const searchTerm = e.target.value.trim();
         
         if (searchTerm.length === 0) {
+            clearTimeout(bookSearchTimer);
+            bookSearchRequestId++;
             resultsElement.style.display = 'none';
             highlightedBookIndex = -1;
             selectedBookIsbn = null;
@@ -73,32 +71,15 @@ function initBookSearch(inputElement, resultsElement, onBookSelected) {
         }
         
         if (searchTerm.length < 2) {
+            clearTimeout(bookSearchTimer);
+            bookSearchRequestId++;
             resultsElement.innerHTML = '<div class="search-result-item">Type at least 2 characters...</div>';
             resultsElement.style.display = 'block';
             return;
         }
 
-        // Check if query looks like an ISBN (digits and dashes, at least 5 chars to avoid matching years)
-        const isIsbnQuery = /^[\d-]+$/.test(searchTerm) && searchTerm.replace(/-/g, '').length >= 5;
-
-        if (isIsbnQuery) {
-            // For ISBN queries, filter by exact prefix match first
-            const normalizedQuery = searchTerm.replace(/-/g, '');
-            const exactMatches = booksCache.filter(book =>
-                book.isbn.replace(/-/g, '').startsWith(normalizedQuery)
-            );
-
-            if (exactMatches.length > 0) {
-                // Convert to Fuse-like result format for displayBookResults
-                const results = exactMatches.map(book => ({ item: book, matches: [] }));
-                displayBookResults(results, resultsElement);
-                return;
-            }
-        }
-
-        // Fall back to fuzzy search
-        const results = booksFuse.search(searchTerm);
-        displayBookResults(results, resultsElement);
+        clearTimeout(bookSearchTimer);
+        bookSearchTimer = setTimeout(() => searchBooks(searchTerm, resultsElement), BOOK_SEARCH_DEBOUNCE_MS);
     });
     
     inputElement.addEventListener('keydown', (e) => {
@@ -141,8 +122,8 @@ function initBookSearch(inputElement, resultsElement, onBookSelected) {
     });
 }
 
-function displayBookResults(results, resultsElement) {
-    if (results.length === 0) {
+function displayBookResults(books, resultsElement) {
+    if (books.length === 0) {
         resultsElement.innerHTML = '<div class="search-result-item">No books found</div>';
         resultsElement.style.display = 'block';
         highlightedBookIndex = -1;
@@ -150,36 +131,17 @@ function displayBookResults(results, resultsElement) {
         return;
     }
     
-    // Limit to top 10 results
-    const topResults = results.slice(0, 10);
-    
-    resultsElement.innerHTML = topResults.map((result, index) => {
-        const book = result.item;
-        const matches = result.matches || [];
-        
-        // Highlight matches in title and author
-        let displayTitle = book.title;
-        let displayAuthor = book.authorDisplay;
-        
-        matches.forEach(match => {
-            if (match.key === 'title') {
-                displayTitle = highlightBookMatches(book.title, match.indices);
-            } else if (match.key === 'authorString') {
-                displayAuthor = highlightBookMatches(book.authorDisplay, match.indices);
-            }
-        });
-        
-        return `
+    // Matched words come back from the backend already wrapped in <mark>
+    resultsElement.innerHTML = books.map((book, index) => `
             <div class="search-result-item" data-isbn="${book.isbn}" data-index="${index}">
                 <div class="search-result-main">
-                    <strong>${displayTitle}</strong>
+                    <strong>${book.titleHighlight}</strong>
                     <span class="search-result-year">(${book.publication_year ? `${book.publication_year}` : 'N/A'})</span>
                 </div>
-                <div class="search-result-author">${displayAuthor}</div>
+                <div class="search-result-author">${book.authorHighlight}</div>
                 <div class="search-result-price">${book.price.toFixed(2)} zł</div>
             </div>
-        `;
-    }).join('');
+        `).join('');
     
     resultsElement.style.display = 'block';
     adjustDropdownHeight(resultsElement);
@@ -217,22 +179,6 @@ function adjustDropdownHeight(dropdown) {
     dropdown.style.maxHeight = `${maxHeight}px`;
 }
 
-function highlightBookMatches(text, indices) {
-    if (!indices || indices.length === 0) return text;
-    
-    let result = '';
-    let lastIndex = 0;
-    
-    indices.forEach(([start, end]) => {
-        result += text.substring(lastIndex, start);
-        result += '<mark>' + text.substring(start, end + 1) + '</mark>';
-        lastIndex = end + 1;
-    });
-    
-    result += text.substring(lastIndex);
-    return result;
-}
-
 function updateBookHighlight(resultsElement) {
     const items = resultsElement.querySelectorAll('.search-result-item');
     items.forEach((item, index) => {
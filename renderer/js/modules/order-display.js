@@ -41,23 +41,31 @@ function hideUserCard() {
 // Hide user card when clicking anywhere outside
 document.addEventListener('click', hideUserCard);
 
-// Fetch and display orders
-async function fetchOrders(apiUrl) {
+const ORDERS_PAGE_SIZE = 100;
+
+// Fetch and display the newest orders; older ones are loaded a page at a time
+async function fetchOrders(apiUrl, cursor = null) {
     try {
-        const response = await fetch(`${apiUrl}/user_order_summary`);
+        const params = new URLSearchParams({ limit: ORDERS_PAGE_SIZE });
+        if (cursor) params.set('cursor', cursor);
+        const response = await fetch(`${apiUrl}/user_order_summary?${params}`);
         if (!response.ok) throw new Error('Failed to fetch orders');
-        const orders = await response.json();
-        renderOrders(orders, apiUrl);
+        const page = await response.json();
+        renderOrders(page, apiUrl, cursor !== null);
     } catch (error) {
         console.error('Error fetching orders:', error);
     }
 }
 
-function renderOrders(orders, apiUrl) {
+function renderOrders(page, apiUrl, append = false) {
     const inventoryBody = document.getElementById('inventory-body');
-    inventoryBody.innerHTML = '';
-    
-    orders.forEach(order => {
+    if (append) {
+        inventoryBody.querySelector('.load-more-row')?.remove();
+    } else {
+        inventoryBody.innerHTML = '';
+    }
+
+    page.items.forEach(order => {
         const row = document.createElement('tr');
         row.innerHTML = `
             <td>${order.order_id}</td>
@@ -66,10 +74,11 @@ function renderOrders(orders, apiUrl) {
             <td>${order.status_name}</td>
             <td>${order.payment_time ? new Date(order.payment_time).toLocaleString() : 'Pending'}</td>
             <td>${order.shipment_time ? new Date(order.shipment_time).toLocaleString() : 'Not shipped'}</td>
+            <td>${parseFloat(order.total_amount || 0).toFixed(2)} zł</td>
         `;
         
         // Click to open detail panel
-        row.addEventListener('click', () => openOrderDetail(order.order_id, apiUrl));
+        row.addEventListener('click', () => openOrderDetail(order.order_id, order.order_time, apiUrl));
         row.style.cursor = 'pointer';
         
         inventoryBody.appendChild(row);
@@ -79,10 +88,21 @@ function renderOrders(orders, apiUrl) {
         customerCell.addEventListener('mouseenter', (e) => showUserCard(order.user_id, e, apiUrl));
         customerCell.addEventListener('mouseleave', hideUserCard);
     });
+
+    if (page.next_cursor) {
+        const shown = inventoryBody.querySelectorAll('tr').length;
+        const row = document.createElement('tr');
+        row.className = 'load-more-row';
+        row.innerHTML = `
+            <td colspan="7"><button class="secondary-btn">Load more (${shown} of about ${page.estimated_total})</button></td>
+        `;
+        row.querySelector('button').addEventListener('click', () => fetchOrders(apiUrl, page.next_cursor));
+        inventoryBody.appendChild(row);
+    }
 }
 
 // Order detail panel functions
-async function openOrderDetail(orderId, apiUrl) {
+async function openOrderDetail(orderId, orderTime, apiUrl) {
     const detailPanel = document.getElementById('order-detail-panel');
     detailPanel.classList.add('open');
     
@@ -90,7 +110,9 @@ async function openOrderDetail(orderId, apiUrl) {
     detailContent.innerHTML = '<p>Loading order details...</p>';
     
     try {
-        const response = await fetch(`${apiUrl}/orders/${orderId}`);
+        // order_time lets the backend read only the partition of the order's month
+        const params = new URLSearchParams({ order_time: orderTime });
+        const response = await fetch(`${apiUrl}/orders/${orderId}?${params}`);
         if (!response.ok) throw new Error('Failed to fetch order details');
         const order = await response.json();
         renderOrderDetail(order);
@@ -162,6 +184,10 @@ function renderOrderDetail(order) {
                     <strong>Shipment Time:</strong> 
                     <span>${order.shipment_time ? new Date(order.shipment_time).toLocaleString() : 'Not shipped'}</span>
                 </div>
+                <div class="detail-item">
+                    <strong>Total:</strong>
+                    <span>${parseFloat(order.total_amount || 0).toFixed(2)} zł (${order.item_count} items)</span>
+                </div>
             </div>
         </div>
         
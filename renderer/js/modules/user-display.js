@@ -154,18 +154,11 @@ async function openUserDetail(userId, apiUrl) {
     detailContent.innerHTML = '<p>Loading user details...</p>';
 
     try {
-        // Fetch user, addresses, and reviews in parallel
-        const [userRes, addressesRes, reviewsRes] = await Promise.all([
-            fetch(`${apiUrl}/users/${userId}`),
-            fetch(`${apiUrl}/users/${userId}/addresses`),
-            fetch(`${apiUrl}/users/${userId}/reviews`)
-        ]);
-
-        if (!userRes.ok) throw new Error('Failed to fetch user details');
-
-        const user = await userRes.json();
-        const addresses = addressesRes.ok ? await addressesRes.json() : [];
-        const reviews = reviewsRes.ok ? await reviewsRes.json() : [];
+        // User, addresses and reviews in one request
+        const response = await fetch(`${apiUrl}/users/${userId}/full`);
+        if (!response.ok) throw new Error('Failed to fetch user details');
+
+        const { addresses, reviews, ...user } = await response.json();
 
         // Store for edit mode
         currentUserDetail = user;